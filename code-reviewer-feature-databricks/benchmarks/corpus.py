@@ -0,0 +1,81 @@
+import random
+
+
+TABLES = ['orders', 'customers', 'products', 'order_items', 'payments', 'shipments', 'inventory', 'suppliers']
+COLUMNS = ['id', 'customer_id', 'product_id', 'amount', 'status', 'created_at', 'region', 'quantity', 'price']
+
+
+def _sql_statement(rng, i):
+    """Returns one synthetic SQL statement; about a third trip one of the regex rules."""
+    table, other = rng.sample(TABLES, 2)
+    columns = ", ".join(rng.sample(COLUMNS, rng.randint(2, 5)))
+    column = rng.choice(COLUMNS)
+    kind = rng.randrange(10)
+    if kind == 0:
+        return f"SELECT * FROM {table} WHERE {column} = {i};"
+    if kind == 1:
+        return f"SELECT {columns}\nFROM {table} t\nJOIN {other} o ON o.id = t.{column}\nWHERE t.status = 'open; pending'\n  AND t.amount > {i % 1000};"
+    if kind == 2:
+        return f"-- Nightly load {i}\nINSERT INTO {table} ({columns})\nSELECT {columns} FROM staging_{table} WHERE batch_id = {i};"
+    if kind == 3:
+        return f"UPDATE {table}\nSET status = 'closed', updated_at = CURRENT_TIMESTAMP\nWHERE id IN (SELECT id FROM {other} WHERE region LIKE '%north%');"
+    if kind == 4:
+        return (
+            f"WITH recent AS (\n    SELECT {columns}, ROW_NUMBER() OVER (PARTITION BY customer_id ORDER BY created_at DESC) AS rn\n"
+            f"    FROM {table}\n)\nSELECT {columns} FROM recent WHERE rn = 1;"
+        )
+    if kind == 5:
+        return f"SELECT {column}, COUNT(*) AS total\nFROM {table}, {other}\nGROUP BY {column}\nHAVING COUNT(*) > {i % 50};"
+    if kind == 6:
+        return f"/* cleanup {i} */ DELETE FROM {table} WHERE created_at < DATE '2020-01-01';"
+    if kind == 7:
+        return f"SELECT CASE WHEN amount > 100 THEN 'large' ELSE 'small' END AS size, {columns}\nFROM {table} (NOLOCK);"
+    if kind == 8:
+        return f"SELECT {columns} FROM {table} WHERE UPPER({column}) = 'X{i}'\nUNION ALL\nSELECT {columns} FROM {other};"
+    return f"CREATE TEMP TABLE tmp_{i} AS\nSELECT {columns}\nFROM {table}\nWHERE {column} IS NOT NULL;"
+
+
+def _pyspark_statement(rng, i):
+    """Returns one synthetic top-level PySpark statement (a def, an assignment or a write)."""
+    table, other = rng.sample(TABLES, 2)
+    column = rng.choice(COLUMNS)
+    kind = rng.randrange(6)
+    if kind == 0:
+        return f'df_{i} = spark.sql("SELECT * FROM {table}")'
+    if kind == 1:
+        return (
+            f"df_{i} = (\n    spark.table(\"{table}\")\n    .filter(F.col(\"{column}\") > {i % 100})\n"
+            f"    .join(spark.table(\"{other}\"), \"id\")\n    .groupBy(\"region\")\n    .agg(F.sum(\"amount\").alias(\"total\"))\n)"
+        )
+    if kind == 2:
+        return f"rows_{i} = spark.table(\"{table}\").collect()"
+    if kind == 3:
+        return (
+            f"def transform_{i}(df):\n    \"\"\"Cleans the {table} feed.\"\"\"\n"
+            f"    df = df.withColumn(\"{column}\", F.trim(F.col(\"{column}\")))\n"
+            f"    return df.dropDuplicates([\"id\"])"
+        )
+    if kind == 4:
+        return f"spark.table(\"{table}\").write.mode(\"overwrite\").saveAsTable(\"{table}_copy_{i}\")"
+    return f"count_{i} = spark.table(\"{table}\").count()"
+
+
+def generate_sql_corpus(path, statements, seed=0):
+    """Writes a SQL file with the given number of statements. Returns the path."""
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        for i in range(statements):
+            f.write(_sql_statement(rng, i))
+            f.write("\n\n")
+    return path
+
+
+def generate_pyspark_corpus(path, statements, seed=0):
+    """Writes a PySpark file with the given number of top-level statements. Returns the path."""
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write("from pyspark.sql import functions as F\n\n")
+        for i in range(statements):
+            f.write(_pyspark_statement(rng, i))
+            f.write("\n\n")
+    return path
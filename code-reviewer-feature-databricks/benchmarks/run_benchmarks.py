@@ -0,0 +1,253 @@
+import argparse
+import contextlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+
+# Add project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import generate_sql_corpus, generate_pyspark_corpus
+from config import EMBEDDING_CACHE_CONFIG, REVIEW_CACHE_CONFIG, PGVECTOR_CONFIG, RULE_CACHE_CONFIG
+
+
+# Patterns for the synthetic PySpark rules; the seed data only has SQL rules
+PYSPARK_PATTERNS = [
+    ('Avoid collect() on large DataFrames', r'\.collect\(\)', 'Major'),
+    ('Avoid SELECT * in spark.sql', r'spark\.sql\(\s*"select\s+\*', 'Minor'),
+    ('Avoid overwrite without partition filter', r'\.mode\(\s*"overwrite"\s*\)', 'Major'),
+    ('Avoid count() for existence checks', r'\.count\(\)', 'Minor'),
+]
+
+# One quoted field of a row in insert_rules.sql; '' escapes a quote
+_FIELD = r"'((?:[^']|'')*)'"
+_RULE_ROW = re.compile(r"\(\s*" + r"\s*,\s*".join([_FIELD] * 7) + r"\s*\)")
+
+
+def seed_rules(language):
+    """Returns (id, title, description, code_pattern, severity, practice_type, category) rows.
+
+    SQL rules come from database/insert_rules.sql, so the regex stage runs the real patterns.
+    """
+    if language == 'PySpark':
+        return [
+            (i, title, title, pattern, severity, 'bad', 'Performance')
+            for i, (title, pattern, severity) in enumerate(PYSPARK_PATTERNS, 1)
+        ]
+    sql_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'insert_rules.sql')
+    with open(sql_path, 'r') as f:
+        content = f.read()
+    rows = []
+    for i, match in enumerate(_RULE_ROW.finditer(content), 1):
+        title, description, code_pattern, severity, rule_language, category, practice_type = (
+            field.replace("''", "'") for field in match.groups()
+        )
+        if rule_language == language:
+            rows.append((i, title, description, code_pattern, severity, practice_type, category))
+    return rows
+
+
+def install_rules(language, vector_rules, dimensions=384, seed=0):
+    """Pins a synthetic rule set for a language in the rule cache, so no database is needed.
+
+    The regex rules are the seed rules; `vector_rules` random unit vectors stand in for a
+    vectorized catalog of that size.
+    """
+    from rag import rule_cache
+
+    rows = seed_rules(language)
+    bad_pattern_rows = [row for row in rows if row[5] == 'bad']
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((vector_rules, dimensions)).astype(np.float32)
+    vector_rows = []
+    for i in range(vector_rules):
+        _, title, description, _, severity, practice_type, category = rows[i % len(rows)]
+        vector_rows.append((100000 + i, title, description, severity, practice_type, category, vectors[i].tolist()))
+    rule_cache.pin_rules(rule_cache.build_entry(language, ('benchmark', vector_rules), bad_pattern_rows, vector_rows))
+
+
+def _stub_encode(code_chunks, batch_size, use_pool):
+    """Deterministic stand-in for the sentence transformer: a seeded random vector per chunk."""
+    return np.vstack([
+        np.random.default_rng(zlib.crc32(code_chunk.encode('utf-8'))).standard_normal(384).astype(np.float32)
+        for code_chunk in code_chunks
+    ])
+
+
+def use_embedder(embedder):
+    """Selects the real model or the stub encoder. Returns the name of the one in use."""
+    from rag import embedder as embedder_module
+    if embedder in ('auto', 'model'):
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                embedder_module.get_model()
+            return 'model'
+        except Exception as e:
+            if embedder == 'model':
+                raise
+            print(f"Embedding model unavailable ({e}), using the stub encoder.")
+    embedder_module._encode = _stub_encode
+    return 'stub'
+
+
+def stub_llm(latency_seconds=0.0):
+    """Replaces the Databricks call with a canned response after a fixed latency."""
+    os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+    from rag import generator
+
+    def call_databricks_llm(prompt, temperature=0.0):
+        if latency_seconds:
+            time.sleep(latency_seconds)
+        if "Bad Practices Found by Regex" in prompt:
+            return '{"issues_found": 1, "issues": [{"line_number": 1, "severity": "Major", "rule_id": 1, "suggestion": "Benchmark issue"}]}'
+        return '{"issues_found": 0, "issues": []}'
+
+    generator.call_databricks_llm = call_databricks_llm
+
+
+def measure(stage, memory=True):
+    """Runs a stage with its output silenced and returns (result, seconds, peak MiB or None).
+
+    Peak memory is measured with tracemalloc in a second, separate run, because tracing
+    allocations slows the stage down too much to time it in the same run.
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        result = stage()
+        seconds = time.perf_counter() - started
+        peak = None
+        if memory:
+            tracemalloc.start()
+            try:
+                stage()
+                peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            finally:
+                tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run_suite(language, statements, work_dir, memory=True, end_to_end=True, concurrency=None):
+    """Generates a corpus and times every stage on it. Returns one result dict per stage."""
+    from main import analyze_code
+    from rag.embedder import embed_chunks
+    from rag.retriever import scan_bad_practices, find_relevant_rules_batch
+    from utils.chunker import chunk_pyspark_file
+    from utils.line_mapper import iter_sql_file
+
+    if language == 'SQL':
+        path = generate_sql_corpus(os.path.join(work_dir, f"corpus_{statements}.sql"), statements)
+
+        def chunk():
+            return list(iter_sql_file(path))
+    else:
+        path = generate_pyspark_corpus(os.path.join(work_dir, f"corpus_{statements}.py"), statements)
+
+        def chunk():
+            with open(path, 'r') as f:
+                return chunk_pyspark_file(f.read())
+
+    results = []
+
+    def record(stage_name, stage):
+        result, seconds, peak = measure(stage, memory)
+        results.append({
+            "language": language,
+            "statements": statements,
+            "stage": stage_name,
+            "seconds": round(seconds, 4),
+            "statements_per_second": round(statements / seconds, 1) if seconds else None,
+            "peak_memory_mib": round(peak, 1) if peak is not None else None
+        })
+        return result
+
+    chunks = record("chunking", chunk)
+    texts = [code_chunk for code_chunk, _ in chunks]
+    record("regex", lambda: scan_bad_practices(chunks, language))
+    embeddings = record("embedding", lambda: embed_chunks(texts))
+    record("vector_retrieval", lambda: find_relevant_rules_batch(embeddings, language))
+    if end_to_end:
+        record("end_to_end", lambda: analyze_code(path, concurrency=concurrency))
+    for result in results:
+        # PySpark chunks can hold several small statements
+        result['chunks'] = len(chunks)
+    return results
+
+
+def print_results(results):
+    """Prints the results as an aligned table."""
+    header = f"{'language':<9} {'statements':>10} {'chunks':>8} {'stage':<17} {'seconds':>9} {'statements/s':>13} {'peak MiB':>9}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        peak = f"{result['peak_memory_mib']:.1f}" if result['peak_memory_mib'] is not None else "-"
+        rate = f"{result['statements_per_second']:.1f}" if result['statements_per_second'] is not None else "-"
+        print(f"{result['language']:<9} {result['statements']:>10} {result['chunks']:>8} {result['stage']:<17} "
+              f"{result['seconds']:>9.3f} {rate:>13} {peak:>9}")
+
+
+def max_rss_mib():
+    """Returns the process' peak resident set size in MiB, or None where it is not available."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the code review pipeline on synthetic corpora.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Corpus sizes in statements.')
+    parser.add_argument('--languages', nargs='+', default=['SQL', 'PySpark'], choices=['SQL', 'PySpark'])
+    parser.add_argument('--vector-rules', type=int, default=1000, help='Size of the synthetic vectorized rule catalog.')
+    parser.add_argument('--embedder', choices=['auto', 'model', 'stub'], default='auto',
+                        help='Use the sentence transformer, a stub encoder, or the model when it can be loaded.')
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help='Simulated latency of each stubbed LLM call.')
+    parser.add_argument('--concurrency', type=int, default=None, help='Maximum number of stubbed LLM reviews in flight.')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc runs that measure peak memory.')
+    parser.add_argument('--skip-end-to-end', action='store_true', help='Only time the individual stages.')
+    parser.add_argument('--with-caches', action='store_true', help='Keep the embedding and review caches enabled.')
+    parser.add_argument('--output', type=str, default=None, help='Also write the results to this JSON file.')
+    args = parser.parse_args()
+
+    # Everything runs against pinned in-memory rules and stubbed endpoints
+    RULE_CACHE_CONFIG['listen'] = False
+    PGVECTOR_CONFIG['enabled'] = False
+    if not args.with_caches:
+        EMBEDDING_CACHE_CONFIG['enabled'] = False
+        REVIEW_CACHE_CONFIG['enabled'] = False
+
+    output_path = os.path.abspath(args.output) if args.output else None
+    embedder = use_embedder(args.embedder)
+    stub_llm(args.llm_latency_ms / 1000)
+
+    all_results = []
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='review_benchmark_') as work_dir:
+        # Reports and caches written by analyze_code stay in the temporary directory
+        os.chdir(work_dir)
+        try:
+            for language in args.languages:
+                install_rules(language, args.vector_rules)
+                for statements in args.sizes:
+                    print(f"Benchmarking {language} with {statements} statements...")
+                    all_results.extend(run_suite(language, statements, work_dir, memory=not args.no_memory,
+                                                 end_to_end=not args.skip_end_to_end, concurrency=args.concurrency))
+        finally:
+            os.chdir(original_dir)
+
+    print()
+    print_results(all_results)
+    print(f"\nEmbedder: {embedder}. Process peak RSS: {max_rss_mib()} MiB.")
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump({"embedder": embedder, "vector_rules": args.vector_rules, "results": all_results}, f, indent=4)
+        print(f"Results saved to {output_path}")
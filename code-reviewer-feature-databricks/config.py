@@ -1,3 +1,5 @@
+import os
+
 # PostgreSQL Database Configuration
 DB_CONFIG = {
     "dbname": "rules",
@@ -7,8 +9,111 @@ DB_CONFIG = {
     "port": "5432"
 }
 
+# Connection pool shared by everything that reads or writes the rules table. The pool closes
+# connections returned beyond minconn, losing their prepared statements, so it keeps them all.
+DB_POOL_CONFIG = {
+    "minconn": 8,
+    "maxconn": 8
+}
+
+# pgvector Configuration
+PGVECTOR_CONFIG = {
+    "enabled": False,  # Store rules.vector as vector(N) and run the similarity search in Postgres
+    "dimensions": 384,  # Embedding size of the sentence transformer model
+    "index_type": "hnsw",  # "hnsw" or "ivfflat"
+    "hnsw_m": 16,
+    "hnsw_ef_construction": 64,
+    "hnsw_ef_search": 40,  # Candidates kept per HNSW query; raise it if filtered queries miss rules
+    "ivfflat_lists": 100,  # About rows / 1000 for up to a million rules
+    "ivfflat_probes": 10
+}
+
 # LM Studio API Configuration
 LM_STUDIO_CONFIG = {
     "api_base": "http://localhost:1234/v1",
     "api_key": "not-needed"
 }
+
+# Rule Cache Configuration
+RULE_CACHE_CONFIG = {
+    "check_interval_seconds": 30,  # How often to compare last_updated_utc against the cached rules
+    "listen": True,  # Also LISTEN for NOTIFY messages sent by the rules table trigger
+    "notify_channel": "rules_changed"
+}
+
+# Embedding Configuration
+EMBEDDING_CONFIG = {
+    # Local directory or Hugging Face model name of the sentence transformer
+    "model_path": os.environ.get("EMBEDDING_MODEL_PATH", "sentence-transformers/all-MiniLM-L6-v2"),
+    "backend": os.environ.get("EMBEDDING_BACKEND", "sentence-transformers"),  # or "onnx" (int8, CPU)
+    "onnx_model_dir": os.environ.get("EMBEDDING_ONNX_DIR", os.path.join("models", "all-MiniLM-L6-v2-onnx")),
+    "onnx_threads": None,  # ONNX Runtime intra-op threads; None uses every core
+    "max_seq_length": 256,  # Tokens per text, as in the all-MiniLM-L6-v2 sentence transformer
+    "batch_size": 32,  # Chunks per SentenceTransformer.encode batch
+    "multi_process": False,  # Spread encoding over a multi-process pool (one worker per CPU core)
+    "multi_process_min_chunks": 256  # Below this a pool costs more to start than it saves
+}
+
+# Embedding Cache Configuration
+EMBEDDING_CACHE_CONFIG = {
+    "enabled": True,
+    "path": os.path.join(".cache", "embeddings.sqlite3"),
+    "max_entries": 200000  # Least recently used embeddings are evicted beyond this
+}
+
+# LLM Request Configuration
+LLM_CONFIG = {
+    "max_concurrency": 4,  # Reviews in flight at once
+    "max_retries": 5,  # Retries on rate limiting (429), 5xx and connection errors
+    "backoff_base_seconds": 1.0,
+    "backoff_max_seconds": 30.0,
+    "timeout_seconds": 120,
+    "stream": False  # Stream responses, surfacing issues as they arrive and stopping once the answer is known
+}
+
+# Review Cache Configuration
+REVIEW_CACHE_CONFIG = {
+    "enabled": True,
+    "path": os.path.join(".cache", "reviews.sqlite3"),
+    "max_entries": 100000  # Least recently used reviews are evicted beyond this
+}
+
+# Prompt Packing Configuration (used with --pack)
+PACKING_CONFIG = {
+    "token_budget": 3000,  # Estimated prompt tokens per packed request
+    "small_chunk_tokens": 400,  # Larger chunks are always reviewed on their own
+    "max_chunks_per_prompt": 10,
+    "prompt_overhead_tokens": 350,  # Instructions and response format
+    "chunk_overhead_tokens": 15  # Chunk header and code fence
+}
+
+# Duplicate Statement Configuration
+DEDUP_CONFIG = {
+    "enabled": True,  # Review identical statements once and copy the issues to every occurrence
+    "strip_literals": False  # Also treat statements that only differ in string and number literals as identical
+}
+
+# Approximate Nearest-Neighbour Index Configuration
+ANN_CONFIG = {
+    "enabled": True,
+    "min_rules": 10000,  # Below about 10k rules exact search is as fast (batches of 32 chunks) and has full recall
+    "n_lists": None,  # IVF clusters; None picks about sqrt(number of rules)
+    "n_probe": 8,  # Clusters searched per query; higher trades speed for recall
+    "kmeans_iterations": 20,
+    "max_changed_fraction": 0.2,  # Retrain the clusters when more rules than this have changed
+    "path": os.path.join(".cache", "ann")  # One index file per language
+}
+
+# Ruleset Bundle Configuration (rag/rule_bundle.py)
+RULE_BUNDLE_CONFIG = {
+    "enabled": True,  # Load rules from the exported bundle when one exists, before asking the database
+    "path": os.environ.get("RULE_BUNDLE_PATH", os.path.join(".cache", "rules_bundle")),
+    "keep_versions": 2  # Older exports are deleted; running workers may still map the previous one
+}
+
+# Review Daemon Configuration (review_server.py and main.py --server)
+DAEMON_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 8765,
+    "max_jobs": 1  # Jobs reviewed at once; more queue. Each job already runs LLM calls concurrently
+}
@@ -0,0 +1,259 @@
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import execute_values
+import sys
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+
+# Add the project root to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from config import DB_CONFIG, DB_POOL_CONFIG, PGVECTOR_CONFIG
+
+
+# Statements prepared once per pooled connection: name -> (parameter types, query)
+PREPARED_QUERIES = {
+    "rules_version": (
+        "(text)",
+        "SELECT MAX(last_updated_utc), COUNT(*) FROM rules WHERE language = $1"
+    ),
+    "bad_pattern_rules": (
+        "(text)",
+        "SELECT id, title, description, code_pattern, severity, practice_type, category FROM rules WHERE language = $1 AND practice_type = 'bad' AND code_pattern IS NOT NULL"
+    ),
+    "vector_rules": (
+        "(text)",
+        "SELECT id, title, description, severity, practice_type, category, vector FROM rules WHERE language = $1 AND vector IS NOT NULL"
+    ),
+    # With pgvector the vectors stay in Postgres and only rule metadata is cached
+    "vector_rule_metadata": (
+        "(text)",
+        "SELECT id, title, description, severity, practice_type, category FROM rules WHERE language = $1 AND vector IS NOT NULL"
+    ),
+    # One round trip for a batch: each embedding is a pgvector literal, searched by its own
+    # ORDER BY <=> LIMIT so the vector index is used; the threshold applies to those top k
+    "nearest_rules": (
+        "(text[], text, integer, float8)",
+        """SELECT q.ord, r.id, r.title, r.description, r.severity, r.practice_type, r.category, r.similarity
+        FROM unnest($1) WITH ORDINALITY AS q(embedding, ord)
+        CROSS JOIN LATERAL (
+            SELECT id, title, description, severity, practice_type, category,
+                   1 - (vector <=> q.embedding::vector) AS similarity
+            FROM rules
+            WHERE language = $2 AND vector IS NOT NULL
+            ORDER BY vector <=> q.embedding::vector
+            LIMIT $3
+        ) r
+        WHERE r.similarity > $4
+        ORDER BY q.ord, r.similarity DESC"""
+    ),
+    "rule_languages": (
+        "",
+        "SELECT DISTINCT language FROM rules ORDER BY language"
+    ),
+    "vectorization_state": (
+        "",
+        "SELECT id, title, description, category, content_hash, vector IS NULL FROM rules"
+    ),
+}
+
+
+class RuleStore:
+    """Pooled access to the rules table through prepared statements."""
+
+    def __init__(self, db_config=None, minconn=None, maxconn=None):
+        self.db_config = db_config or DB_CONFIG
+        maxconn = maxconn if maxconn is not None else DB_POOL_CONFIG['maxconn']
+        self._pool = pool.ThreadedConnectionPool(
+            minconn if minconn is not None else DB_POOL_CONFIG['minconn'],
+            maxconn,
+            **self.db_config
+        )
+        # ThreadedConnectionPool raises PoolError when every connection is out, so
+        # borrowers beyond maxconn wait for one to be returned instead
+        self._slots = threading.BoundedSemaphore(maxconn)
+        # Prepared statements live in the server session, so track them on the connection
+        # object itself; entries go away with connections the pool closes
+        self._prepared = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """Borrows a pooled connection, committing on success and rolling back on error.
+
+        Waits while all of the pool's connections are borrowed.
+        """
+        self._slots.acquire()
+        try:
+            conn = self._pool.getconn()
+        except BaseException:
+            self._slots.release()
+            raise
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except psycopg2.Error:
+            broken = conn.closed != 0
+            if not broken:
+                conn.rollback()
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.putconn(conn, close=broken)
+            self._slots.release()
+
+    def execute(self, cur, name, params=()):
+        """Runs a named prepared statement, preparing it on this connection the first time."""
+        # A pooled connection is only ever used by one thread at a time
+        with self._lock:
+            prepared = self._prepared.setdefault(cur.connection, set())
+        if name not in prepared:
+            param_types, query = PREPARED_QUERIES[name]
+            cur.execute(f"PREPARE {name} {param_types} AS {query};")
+            prepared.add(name)
+        if params:
+            placeholders = ", ".join(["%s"] * len(params))
+            cur.execute(f"EXECUTE {name} ({placeholders});", params)
+        else:
+            cur.execute(f"EXECUTE {name};")
+
+    def fetch_version(self, language):
+        """Returns a (max last_updated_utc, row count) pair identifying the rules of a language."""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self.execute(cur, "rules_version", (language,))
+                return cur.fetchone()
+
+    def fetch_languages(self):
+        """Returns every language that has rules."""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self.execute(cur, "rule_languages")
+                return [row[0] for row in cur.fetchall()]
+
+    def fetch_rule_set(self, language):
+        """Fetches the version, regex rules and vectorized rules of a language in one transaction.
+
+        With pgvector enabled the vector rows carry None instead of the vector, since the
+        similarity search runs in the database (see nearest_rules).
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self.execute(cur, "rules_version", (language,))
+                version = cur.fetchone()
+                self.execute(cur, "bad_pattern_rules", (language,))
+                bad_pattern_rows = cur.fetchall()
+                if PGVECTOR_CONFIG['enabled']:
+                    self.execute(cur, "vector_rule_metadata", (language,))
+                    vector_rows = [row + (None,) for row in cur.fetchall()]
+                else:
+                    self.execute(cur, "vector_rules", (language,))
+                    vector_rows = cur.fetchall()
+        return version, bad_pattern_rows, vector_rows
+
+    def nearest_rules(self, language, embeddings, top_k=3, similarity_threshold=0.55):
+        """Runs the cosine similarity search for a batch of embeddings in Postgres (pgvector).
+
+        Returns one list of (rule_id, title, description, severity, practice_type,
+        category, similarity) rows per embedding, most similar first.
+        """
+        literals = ["[" + ",".join(repr(float(value)) for value in embedding) + "]" for embedding in embeddings]
+        results = [[] for _ in literals]
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                if PGVECTOR_CONFIG['index_type'] == 'ivfflat':
+                    cur.execute("SET LOCAL ivfflat.probes = %s;", (PGVECTOR_CONFIG['ivfflat_probes'],))
+                else:
+                    cur.execute("SET LOCAL hnsw.ef_search = %s;", (PGVECTOR_CONFIG['hnsw_ef_search'],))
+                self.execute(cur, "nearest_rules", (literals, language, top_k, similarity_threshold))
+                for row in cur.fetchall():
+                    results[row[0] - 1].append(row[1:])
+        return results
+
+    def rebuild_vector_index(self):
+        """Rebuilds the pgvector index, which IVFFlat needs after bulk loads to re-cluster."""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("REINDEX INDEX rules_vector_idx;")
+
+    def ensure_content_hash_column(self):
+        """Adds the content_hash column to rules tables created before it existed."""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("ALTER TABLE rules ADD COLUMN IF NOT EXISTS content_hash TEXT;")
+
+    def fetch_vectorization_state(self):
+        """Returns (id, title, description, category, content_hash, vector is null) for every rule."""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self.execute(cur, "vectorization_state")
+                return cur.fetchall()
+
+    def update_vectors(self, rule_vectors, page_size=1000):
+        """Stores (rule_id, vector, content_hash) triples with multi-row UPDATEs in one transaction.
+
+        Each page of rows is sent as a single UPDATE ... FROM (VALUES ...) statement rather
+        than one statement per rule.
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    "UPDATE rules AS r SET vector = v.vector, content_hash = v.content_hash "
+                    "FROM (VALUES %s) AS v (id, vector, content_hash) WHERE r.id = v.id",
+                    rule_vectors,
+                    template="(%s, %s::float8[], %s)",
+                    page_size=page_size
+                )
+
+    def listen(self, channel):
+        """Opens a dedicated autocommit connection that LISTENs on a channel.
+
+        This connection is kept out of the pool because it has to stay open to receive
+        notifications.
+        """
+        conn = psycopg2.connect(**self.db_config)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {channel};")
+        return conn
+
+    def close(self):
+        """Closes every pooled connection."""
+        self._pool.closeall()
+        with self._lock:
+            self._prepared.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+# Stores inherited from a parent process, kept referenced so they are never closed here
+_inherited_stores = []
+
+
+def get_rule_store():
+    """Returns the process-wide RuleStore, creating its pool on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RuleStore()
+        return _store
+
+
+def reset_after_fork():
+    """Forgets the inherited pool in a forked child process.
+
+    The parent's connections are set aside without closing them, because closing a socket
+    shared with the parent would terminate the parent's sessions too.
+    """
+    global _store, _store_lock
+    if _store is not None:
+        _inherited_stores.append(_store)
+    _store = None
+    _store_lock = threading.Lock()
@@ -6,7 +6,21 @@ import os
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
-from config import DB_CONFIG
+from config import DB_CONFIG, RULE_CACHE_CONFIG, PGVECTOR_CONFIG
+
+
+def vector_index_sql():
+    """Returns the CREATE INDEX statement for the configured pgvector index type."""
+    if PGVECTOR_CONFIG['index_type'] == 'ivfflat':
+        return (
+            "CREATE INDEX IF NOT EXISTS rules_vector_idx ON rules USING ivfflat (vector vector_cosine_ops) "
+            f"WITH (lists = {int(PGVECTOR_CONFIG['ivfflat_lists'])});"
+        )
+    return (
+        "CREATE INDEX IF NOT EXISTS rules_vector_idx ON rules USING hnsw (vector vector_cosine_ops) "
+        f"WITH (m = {int(PGVECTOR_CONFIG['hnsw_m'])}, ef_construction = {int(PGVECTOR_CONFIG['hnsw_ef_construction'])});"
+    )
+
 
 def setup_database():
     """Sets up the PostgreSQL database, creating the rules table with the vector column and inserting initial data."""
@@ -21,9 +35,17 @@ def setup_database():
         print('Dropping table "rules" if it exists...')
         cursor.execute("DROP TABLE IF EXISTS rules;")
 
+        # pgvector stores the embeddings as vector(N) so the similarity search runs in Postgres
+        if PGVECTOR_CONFIG['enabled']:
+            print('Enabling the pgvector extension...')
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+            vector_type = f"vector({int(PGVECTOR_CONFIG['dimensions'])})"
+        else:
+            vector_type = "FLOAT[]"
+
         # Create the rules table with the vector column
         print('Creating table "rules"...')
-        cursor.execute("""
+        cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS rules (
             id SERIAL PRIMARY KEY,
             code_pattern TEXT NOT NULL,
@@ -34,11 +56,54 @@ def setup_database():
             description TEXT NOT NULL,
             practice_type TEXT NOT NULL DEFAULT 'bad',
             last_updated_utc TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            vector FLOAT[],  -- Add the vector column here
+            vector {vector_type},  -- Add the vector column here
+            content_hash TEXT,  -- Hash of the text the vector was computed from
             UNIQUE (language, title)
         );
         """)
 
+        # Indexes for the per-language lookups made by the retriever
+        print('Creating indexes on "rules"...')
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS rules_language_practice_type_idx ON rules (language, practice_type);
+        CREATE INDEX IF NOT EXISTS rules_language_vectorized_idx ON rules (language) WHERE vector IS NOT NULL;
+        """)
+        if PGVECTOR_CONFIG['enabled']:
+            cursor.execute(vector_index_sql())
+
+        # Keep last_updated_utc current and notify listening reviewers whenever rules change
+        print('Creating rule change trigger...')
+        cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION rules_touch_and_notify() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                NEW.last_updated_utc := CURRENT_TIMESTAMP;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('{RULE_CACHE_CONFIG["notify_channel"]}', OLD.language);
+                RETURN OLD;
+            END IF;
+            PERFORM pg_notify('{RULE_CACHE_CONFIG["notify_channel"]}', NEW.language);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION rules_notify_truncate() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{RULE_CACHE_CONFIG["notify_channel"]}', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER rules_changed
+            BEFORE INSERT OR UPDATE OR DELETE ON rules
+            FOR EACH ROW EXECUTE FUNCTION rules_touch_and_notify();
+
+        CREATE TRIGGER rules_truncated
+            AFTER TRUNCATE ON rules
+            FOR EACH STATEMENT EXECUTE FUNCTION rules_notify_truncate();
+        """)
+
         # Insert initial data from SQL file
         print('Inserting initial data from "database/insert_rules.sql"...')
         sql_file_path = os.path.join(os.path.dirname(__file__), 'insert_rules.sql')
@@ -56,5 +121,35 @@ def setup_database():
             conn.close()
             print('Database connection closed.')
 
+def migrate_to_pgvector():
+    """Converts an existing FLOAT[] vector column to pgvector in place, keeping the rules and their vectors."""
+    conn = None
+    try:
+        print('Connecting to the PostgreSQL database...')
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+
+        print('Enabling the pgvector extension...')
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+        dimensions = int(PGVECTOR_CONFIG['dimensions'])
+        print(f'Converting "rules.vector" to vector({dimensions})...')
+        cursor.execute(f"ALTER TABLE rules ALTER COLUMN vector TYPE vector({dimensions}) USING vector::vector({dimensions});")
+        print('Creating the vector index...')
+        cursor.execute(vector_index_sql())
+
+        conn.commit()
+        print('Migration to pgvector completed successfully. Set PGVECTOR_CONFIG["enabled"] in config.py to use it.')
+
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        if conn:
+            cursor.close()
+            conn.close()
+            print('Database connection closed.')
+
 if __name__ == '__main__':
-    setup_database()
\ No newline at end of file
+    if '--migrate-pgvector' in sys.argv:
+        migrate_to_pgvector()
+    else:
+        setup_database()
\ No newline at end of file
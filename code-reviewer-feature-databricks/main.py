@@ -1,69 +1,329 @@
 import argparse
+import copy
 import os
 import json
 import re
-from rag.retriever import find_relevant_rules
-from rag.generator import generate_review
-from utils.line_mapper import map_sql_statements_to_lines
+import sys
+from rag.retriever import scan_bad_practices
+from rag import embedding_cache, review_cache
+from utils.line_mapper import iter_sql_file
 from utils.chunker import chunk_pyspark_file
+from utils.fingerprint import chunk_fingerprint, statement_fingerprint
+from utils.incremental import find_previous_report, load_report, carry_forward
+from utils.report_writer import JsonlReportWriter, default_report_path, write_sarif
+from utils import metrics
 from datetime import datetime
+from config import REVIEW_CACHE_CONFIG, LLM_CONFIG, DEDUP_CONFIG
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import multiprocessing
+import time
 
 
-def analyze_code(file_path):
-    """Analyzes a code file using the RAG model, processing it in chunks."""
-    try:
-        with open(file_path, 'r') as f:
-            file_content = f.read()
-    except FileNotFoundError:
-        print(f"Error: File not found at {file_path}")
-        return
+LANGUAGES_BY_EXTENSION = {
+    '.sql': 'SQL',
+    '.py': 'PySpark'  # Assuming .py is PySpark for this project
+}
+SUPPORTED_EXTENSIONS = tuple(LANGUAGES_BY_EXTENSION)
+
+
+def regex_only_issues(chunks, language):
+    """Turns direct regex rule hits into issues without any embedding or LLM call.
+
+    Returns one list of issues per chunk, or None for every chunk if the rules could not
+    be loaded, so those chunks count as not reviewed rather than clean.
+    """
+    regex_matches = scan_bad_practices(chunks, language=language)
+    if regex_matches is None:
+        print("The regex rules could not be loaded, no statement was reviewed.")
+        return [None] * len(chunks)
+    chunk_issues = []
+    for chunk_matches in regex_matches:
+        chunk_issues.append([
+            {
+                "line_number": rule['match_line'],
+                "severity": rule['severity'],
+                "rule_id": rule['id'],
+                "suggestion": f"{rule['title']}: {rule['description']}"
+            }
+            for rule in chunk_matches
+        ])
+    return chunk_issues
+
+
+def _review_issues(code_chunk, start_line, review):
+    """Takes the issues out of a chunk's review, with line numbers relative to the file."""
+    end_line = start_line + code_chunk.count('\n')
+    issues = review.get('issues', []) if review.get('issues_found', 0) > 0 else []
+    # Adjust line numbers to be relative to the entire file
+    for issue in issues:
+        # Packed prompts ask for absolute file lines; keep those when they fall inside the chunk.
+        line_number = issue.get('line_number')
+        if review.get('absolute_line_numbers') and isinstance(line_number, int) and start_line <= line_number <= end_line:
+            continue
+        # Other prompts ask for a line number relative to the chunk, whose line 1 is start_line.
+        # Anything that does not point into the chunk is attributed to its first line.
+        if not review.get('absolute_line_numbers') and isinstance(line_number, int) and 1 <= line_number <= end_line - start_line + 1:
+            issue['line_number'] = start_line + line_number - 1
+        else:
+            issue['line_number'] = start_line
+    return issues
+
+
+def _copy_review(review, from_line, to_line):
+    """Copies the review of a statement for an identical statement starting at another line."""
+    review = copy.deepcopy(review)
+    if review.get('absolute_line_numbers'):
+        for issue in review.get('issues', []):
+            if isinstance(issue.get('line_number'), int):
+                issue['line_number'] += to_line - from_line
+    return review
+
+
+def review_file(file_path, batch_size=None, encode_pool=None, fast=False, concurrency=None, pack=False, incremental=None,
+                on_chunk=None, on_issue=None, keep_issues=True, use_review_cache=None, stream=None, dedup=None, dedup_literals=None):
+    """Analyzes a code file using the RAG model, processing it in chunks.
+
+    With `fast`, only the regex rules are applied, so no model is loaded and the LLM is
+    never called. With `incremental` (a previous report path, 'latest' for the most recent
+    report of this file in outputs/, or a previous per-file report already loaded, as the
+    review server gets from its clients), only statements whose fingerprint is not in
+    that report are reviewed and the other statements' issues are carried forward. Only
+    reports of LLM reviews serve as the baseline, and statements whose rule retrieval failed
+    there are reviewed again; `incremental` cannot be combined with `fast`.
+    Statements that are identical up to comments and formatting (see DEDUP_CONFIG) are
+    reviewed once, and the issues are copied to every occurrence.
+    `use_review_cache`, `stream`, `dedup` and `dedup_literals` override REVIEW_CACHE_CONFIG,
+    LLM_CONFIG['stream'] and DEDUP_CONFIG for this file only when they are not None.
+    If given, `on_chunk(statement, issues)` is called for each chunk as soon as its issues
+    are known, with the same statement record and issues that end up in the report. When
+    LLM responses are streamed, `on_issue(issue)` is called for each issue as it arrives,
+    from the review threads and before its chunk's on_chunk; cached and carried-forward
+    issues only come through on_chunk. If a stream fails after some of its issues were
+    passed to on_issue, the statement is not reviewed and records how many were discarded
+    in `streamed_issues_discarded`. With `keep_issues` False the report only counts the
+    issues, which then reach the caller through on_chunk alone.
+    Returns the report for the file, or None if it cannot be reviewed.
+    """
+    # Only what this file records goes into its report, also while other server jobs run
+    with metrics.scope() as recorded:
+        return _review_file(file_path, recorded, batch_size=batch_size, encode_pool=encode_pool, fast=fast,
+                            concurrency=concurrency, pack=pack, incremental=incremental, on_chunk=on_chunk,
+                            on_issue=on_issue, keep_issues=keep_issues, use_review_cache=use_review_cache,
+                            stream=stream, dedup=dedup, dedup_literals=dedup_literals)
+
+
+def _review_file(file_path, recorded, batch_size, encode_pool, fast, concurrency, pack, incremental,
+                 on_chunk, on_issue, keep_issues, use_review_cache, stream, dedup, dedup_literals):
+    """Reviews a file for review_file, recording its metrics in the `recorded` scope."""
+    if fast and incremental:
+        raise ValueError("Incremental reviews need the LLM and cannot be combined with fast mode.")
 
     # Determine language from file extension
     _, file_extension = os.path.splitext(file_path)
-    language = ""
-    if file_extension == '.sql':
-        language = 'SQL'
-        chunks = map_sql_statements_to_lines(file_content)
-    elif file_extension == '.py':
-        language = 'PySpark' # Assuming .py is PySpark for this project
-        chunks = chunk_pyspark_file(file_content)
-    else:
+    language = LANGUAGES_BY_EXTENSION.get(file_extension, "")
+    if not language:
         print(f"Unsupported file type: {file_extension}")
         return
 
-    all_issues = []
+    try:
+        with metrics.timer('chunking'):
+            if language == 'SQL':
+                # Streamed from a memory map so large dumps are never read into one string
+                chunks = list(iter_sql_file(file_path))
+            else:
+                with open(file_path, 'r') as f:
+                    file_content = f.read()
+                chunks = chunk_pyspark_file(file_content)
+    except FileNotFoundError:
+        print(f"Error: File not found at {file_path}")
+        return
+
+    # Strip the chunks of any leading/trailing whitespace that might confuse the LLM
+    chunks = [(code_chunk.strip(), start_line) for code_chunk, start_line in chunks if code_chunk.strip()]
+    fingerprints = [chunk_fingerprint(code_chunk, language) for code_chunk, _ in chunks]
+    metrics.increment('chunks_total', len(chunks), language=language)
 
     print(f"Analyzing {file_path} (Language: {language}), found {len(chunks)} chunks...")
 
-    for code_chunk, start_line in chunks:
-        # Strip the chunk of any leading/trailing whitespace that might confuse the LLM
-        code_chunk = code_chunk.strip()
-        if not code_chunk:
-            continue
+    # Issues per chunk; None marks a chunk whose review failed
+    chunk_issues = [None] * len(chunks)
+    issue_counts = [0] * len(chunks)
+    # Issues already passed to on_issue per chunk, in case its streamed review then fails
+    streamed_counts = [0] * len(chunks)
+    statements = [None] * len(chunks)
+    incremental_summary = None
+    duplicate_count = 0
+
+    def finish(index, issues, duplicate_of=None, retrieval_failed=False):
+        """Records a chunk's issues and statement, tagging each issue with its statement."""
+        code_chunk, start_line = chunks[index]
+        for issue in issues or []:
+            # Remember which statement each issue came from for later incremental runs
+            issue['fingerprint'] = fingerprints[index]
+            issue['statement_line'] = start_line
+        issue_counts[index] = len(issues or [])
+        if keep_issues:
+            chunk_issues[index] = issues
+        statements[index] = {
+            "fingerprint": fingerprints[index],
+            "start_line": start_line,
+            "end_line": start_line + code_chunk.count('\n'),
+            "reviewed": issues is not None
+        }
+        if duplicate_of is not None:
+            statements[index]['duplicate_of'] = duplicate_of
+        if retrieval_failed:
+            # Reviewed without its rules, so later incremental runs review it again
+            statements[index]['retrieval_failed'] = True
+        if issues is None and streamed_counts[index]:
+            # The stream broke off after these issues went out; they are not in the report
+            statements[index]['streamed_issues_discarded'] = streamed_counts[index]
+            print(f"Review of the statement at line {start_line} failed after {streamed_counts[index]} issue(s) were streamed; they are not part of the report.")
+        if on_chunk is not None:
+            on_chunk(statements[index], issues or [])
+
+    if fast:
+        regex_issues = regex_only_issues(chunks, language)
+        metrics.increment('retrieval_method_total', sum(1 for issues in regex_issues if issues), method='Regex Match')
+        for index, issues in enumerate(regex_issues):
+            finish(index, issues)
+    else:
+        # Imported here so --fast runs never need the Databricks client or its token
+        from rag.pipeline import review_chunks
+
+        to_review = list(range(len(chunks)))
+        if incremental:
+            if isinstance(incremental, dict):
+                previous_path, previous_report = incremental.get('report_path'), incremental
+            elif incremental == 'latest':
+                previous_path, previous_report = find_previous_report(file_path, review_mode='llm')
+            else:
+                previous_path, previous_report = incremental, load_report(incremental, file_path, review_mode='llm')
+            if previous_report is None:
+                print("No previous report found, reviewing the whole file.")
+            else:
+                carried, to_review = carry_forward(chunks, fingerprints, previous_report)
+                for index, issues in sorted(carried.items()):
+                    finish(index, issues)
+                print(f"Incremental review against {previous_path}: {len(carried)} unchanged statement(s) carried forward, {len(to_review)} to review.")
+                incremental_summary = {
+                    "previous_report": previous_path,
+                    "carried_forward": len(carried),
+                    "reviewed": len(to_review)
+                }
 
-        # Find relevant rules for the current chunk using the hybrid retriever
-        relevant_rules, log_method = find_relevant_rules(code_chunk, language=language)
+        # The first occurrence of each distinct statement is reviewed for all of them
+        duplicates = {}
+        if DEDUP_CONFIG.get('enabled', True) if dedup is None else dedup:
+            first_seen = {}
+            unique = []
+            strip_literals = DEDUP_CONFIG['strip_literals'] if dedup_literals is None else dedup_literals
+            literal_sensitive = None
+            if strip_literals:
+                # Regex rules can match on literals (LIKE '%x' but not LIKE 'x%'), so statements
+                # that any of them match keep their literals in the key; all do without the rules
+                regex_matches = scan_bad_practices([chunks[index] for index in to_review], language=language)
+                if regex_matches is None:
+                    literal_sensitive = [True] * len(to_review)
+                else:
+                    literal_sensitive = [bool(chunk_matches) for chunk_matches in regex_matches]
+            for position, index in enumerate(to_review):
+                key = statement_fingerprint(chunks[index][0], language, strip_literals and not literal_sensitive[position])
+                if key in first_seen:
+                    duplicates.setdefault(first_seen[key], []).append(index)
+                else:
+                    first_seen[key] = index
+                    unique.append(index)
+            duplicate_count = len(to_review) - len(unique)
+            if duplicate_count:
+                print(f"{duplicate_count} duplicate statement(s) will reuse the review of their first occurrence.")
+                metrics.increment('duplicate_statements_total', duplicate_count)
+            to_review = unique
 
-        print(f"\nProcessing chunk (lines {start_line}-{start_line + code_chunk.count('\n')}) with: {log_method}")
+        def on_result(position, result):
+            relevant_rules, log_method, review = result
+            metrics.increment('retrieval_method_total', method=log_method)
+            retrieval_failed = log_method == "Error"
+            index = to_review[position]
+            start_line = chunks[index][1]
+            # Copied before the first occurrence's issues get its line numbers and tags
+            copies = [
+                (duplicate, _copy_review(review, start_line, chunks[duplicate][1]) if review is not None else None)
+                for duplicate in duplicates.get(index, [])
+            ]
+            finish(index, _review_issues(chunks[index][0], start_line, review) if review is not None else None,
+                   retrieval_failed=retrieval_failed)
+            for duplicate, duplicate_review in copies:
+                code_chunk, duplicate_line = chunks[duplicate]
+                issues = _review_issues(code_chunk, duplicate_line, duplicate_review) if duplicate_review is not None else None
+                finish(duplicate, issues, duplicate_of=start_line, retrieval_failed=retrieval_failed)
 
-        # Generate a review for the chunk
-        review = generate_review(code_chunk, relevant_rules, log_method)
-        if review and review.get('issues_found', 0) > 0:
-            # Adjust line numbers to be relative to the entire file
-            for issue in review['issues']:
-                # The 'start_line' from the chunk is the correct, absolute line number.
-                # The LLM might return a relative line number, but for single-line chunks, it's always 1.
-                # So, we can just use the start_line.
-                issue['line_number'] = start_line
-            all_issues.extend(review['issues'])
+        def on_review_issue(position, issue, absolute_line_numbers):
+            index = to_review[position]
+            for target in [index] + duplicates.get(index, []):
+                code_chunk, start_line = chunks[target]
+                review = _copy_review({"issues_found": 1, "issues": [issue], "absolute_line_numbers": absolute_line_numbers}, chunks[index][1], start_line)
+                for streamed_issue in _review_issues(code_chunk, start_line, review):
+                    streamed_issue['fingerprint'] = fingerprints[target]
+                    streamed_issue['statement_line'] = start_line
+                    streamed_counts[target] += 1
+                    on_issue(streamed_issue)
 
-    # 3. Assemble the final JSON report
+        # Retrieve rules (one regex scan and batched embeddings per window) and generate
+        # reviews concurrently; each chunk is finished as soon as its review is in
+        review_chunks([chunks[i] for i in to_review], language, batch_size=batch_size, encode_pool=encode_pool,
+                      max_concurrency=concurrency, pack=pack, on_result=on_result,
+                      on_issue=on_review_issue if on_issue is not None else None,
+                      use_cache=REVIEW_CACHE_CONFIG['enabled'] if use_review_cache is None else use_review_cache,
+                      stream=stream)
+
+    for index, statement in enumerate(statements):
+        # Chunks the pipeline never returned (e.g. a failed retrieval window) count as not reviewed
+        if statement is None:
+            finish(index, None)
+    all_issues = [issue for issues in chunk_issues for issue in issues or []]
+
+    # 3. Assemble the final JSON report; stage timings and counters are the ones recorded
+    # while reviewing this file
+    recorded_metrics = metrics.snapshot(recorded)
     final_report = {
         "file_name": os.path.basename(file_path),
-        "issues_found": len(all_issues),
-        "issues": all_issues
+        "file_path": os.path.abspath(file_path),
+        "review_mode": "fast" if fast else "llm",
+        "issues_found": sum(issue_counts),
+        "statements_not_reviewed": sum(1 for statement in statements if not statement['reviewed']),
+        "issues": all_issues,
+        "statements": statements,
+        "summary": {
+            "chunks": len(chunks),
+            "embedding_cache": {
+                "hits": metrics.counter(recorded_metrics, 'embedding_cache_total', result='hit'),
+                "misses": metrics.counter(recorded_metrics, 'embedding_cache_total', result='miss')
+            },
+            "review_cache": {
+                "hits": metrics.counter(recorded_metrics, 'review_cache_total', result='hit'),
+                "misses": metrics.counter(recorded_metrics, 'review_cache_total', result='miss')
+            }
+        }
     }
+    if not keep_issues:
+        del final_report['issues']
+    if duplicate_count:
+        final_report['summary']['duplicates'] = duplicate_count
+    if incremental_summary is not None:
+        final_report['summary']['incremental'] = incremental_summary
+    final_report['metrics'] = metrics.summarize(recorded_metrics)
+    return final_report
+
+
+def print_issue(file_path, issue):
+    """Prints one issue as a file:line: [severity] suggestion line."""
+    print(f"{file_path}:{issue.get('line_number')}: [{issue.get('severity')}] {issue.get('suggestion')}")
+
 
+def save_report(final_report):
+    """Prints the report and saves it under outputs/ with a timestamped name."""
     print("\n--- Code Review Report ---")
     print(json.dumps(final_report, indent=4))
     print("--- End of Report ---")
@@ -79,10 +339,350 @@ def analyze_code(file_path):
         json.dump(final_report, json_file, indent=4)
 
     print(f"Report saved successfully to {full_file_path}")
+    return full_file_path
+
+
+def _file_summary(final_report):
+    """Returns a file's report without its issues and statements, as kept for JSONL reports."""
+    return {key: value for key, value in final_report.items() if key not in ('issues', 'statements')}
+
+
+# JSONL writers opened by this process, by path; forked workers inherit the parent's
+_jsonl_writers = {}
+
+
+def _jsonl_writer(jsonl_path):
+    """Returns this process' writer for a JSONL report, opening it on first use."""
+    writer = _jsonl_writers.get(jsonl_path)
+    if writer is None:
+        writer = _jsonl_writers[jsonl_path] = JsonlReportWriter(jsonl_path)
+    return writer
+
+
+def _start_jsonl_report(jsonl_path, paths):
+    """Opens a JSONL report and records the start of the run."""
+    writer = _jsonl_writer(jsonl_path)
+    writer.write('run_started', started_utc=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), paths=paths)
+    return writer
+
+
+def _finish_jsonl_report(jsonl_path, aggregated_report):
+    """Records the totals of the run and closes the JSONL report."""
+    writer = _jsonl_writers.pop(jsonl_path)
+    writer.write('run_finished', **{key: value for key, value in aggregated_report.items() if key != 'files'})
+    writer.close()
+    print(f"Report saved successfully to {jsonl_path}")
+
+
+def analyze_code(file_path, jsonl_path=None, **options):
+    """Reviews a single file, then prints and saves its report. Returns the report.
+
+    With `jsonl_path`, the statements and issues are appended to that JSONL report as each
+    chunk finishes instead, and the returned report only has the totals.
+    """
+    if jsonl_path is None:
+        final_report = review_file(file_path, **options)
+        if final_report is not None:
+            save_report(final_report)
+        return final_report
+
+    _start_jsonl_report(jsonl_path, [os.path.abspath(file_path)])
+    final_report = _review_file_timed(file_path, options, jsonl_path)
+    _finish_jsonl_report(jsonl_path, aggregate_reports([final_report], final_report['timing_seconds']))
+    return final_report if 'error' not in final_report else None
+
+
+def expand_paths(paths):
+    """Expands files, directories, glob patterns and @list files into reviewable files.
+
+    Directories are searched recursively and globs may use `**`; both only yield files with
+    a supported extension. A path starting with @ names a text file with one path per line.
+    Duplicates are dropped and the order is kept.
+    """
+    files = []
+    for path in paths:
+        if path.startswith('@'):
+            with open(path[1:], 'r') as f:
+                listed = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+            files.extend(expand_paths(listed))
+        elif os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                files.extend(
+                    os.path.join(root, name) for name in sorted(names)
+                    if os.path.splitext(name)[1] in SUPPORTED_EXTENSIONS
+                )
+        elif glob.has_magic(path):
+            files.extend(
+                match for match in sorted(glob.glob(path, recursive=True))
+                if os.path.isfile(match) and os.path.splitext(match)[1] in SUPPORTED_EXTENSIONS
+            )
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def warm_up(fast):
+    """Loads the rules and, unless only regex rules are used, the embedding model."""
+    from rag.rule_cache import get_rules
+    for language in LANGUAGES_BY_EXTENSION.values():
+        try:
+            get_rules(language)
+        except Exception as e:
+            print(f"Could not preload {language} rules: {e}")
+    if not fast:
+        from rag.embedder import get_model
+        get_model()
+
+
+def _init_worker(fast, inherited):
+    """Prepares a review worker process.
+
+    A forked worker inherits the parent's loaded model and compiled rules copy-on-write and
+    only needs fresh database and cache connections; a spawned worker loads them itself.
+    """
+    if inherited:
+        from rag import rule_cache
+        rule_cache.reset_after_fork()
+        metrics.reset_after_fork()
+        embedding_cache.reset_after_fork()
+        review_cache.reset_after_fork()
+    else:
+        warm_up(fast)
+
+
+def _review_file_timed(file_path, options, jsonl_path=None):
+    """Reviews one file in a worker and records how long it took.
+
+    With `jsonl_path`, the file's statements and issues are appended to that report as
+    they are reviewed, and only the file's totals are returned.
+    """
+    started = time.perf_counter()
+    writer = _jsonl_writer(jsonl_path) if jsonl_path else None
+    if writer is not None:
+        options = dict(options, on_chunk=writer.chunk_writer(os.path.abspath(file_path)), keep_issues=False)
+    try:
+        final_report = review_file(file_path, **options)
+    except Exception as e:
+        print(f"Error reviewing {file_path}: {e}")
+        final_report = None
+    if final_report is None:
+        final_report = {"file_name": os.path.basename(file_path), "file_path": os.path.abspath(file_path), "error": "File could not be reviewed."}
+    final_report['timing_seconds'] = round(time.perf_counter() - started, 3)
+    if writer is not None:
+        final_report = _file_summary(final_report)
+        writer.write('file_finished', **final_report)
+    return final_report
+
+
+def aggregate_reports(file_reports, seconds):
+    """Combines per-file reports into one report with totals and summed metrics."""
+    return {
+        "files_reviewed": len(file_reports),
+        "issues_found": sum(final_report.get('issues_found', 0) for final_report in file_reports),
+        "statements_not_reviewed": sum(final_report.get('statements_not_reviewed', 0) for final_report in file_reports),
+        "timing_seconds": round(seconds, 3),
+        "metrics": metrics.summarize(metrics.merge(final_report['metrics'] for final_report in file_reports if 'metrics' in final_report)),
+        "files": file_reports
+    }
+
+
+def analyze_paths(paths, workers=None, jsonl_path=None, **options):
+    """Reviews many files across a pool of worker processes and saves one aggregated report.
+
+    Each worker loads the model and rules once and then reviews files one after another.
+    Where fork is available, both are loaded in the parent first so the workers share them.
+    With `jsonl_path`, every worker appends its statements and issues to that JSONL report
+    as it goes, and only per-file totals are collected here.
+    Returns the aggregated report.
+    """
+    files = expand_paths(paths)
+    if not files:
+        print("No .sql or .py files found to review.")
+        return None
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(files)))
+    started = time.perf_counter()
+    print(f"Reviewing {len(files)} files with {workers} worker process(es)...")
+
+    inherited = 'fork' in multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if inherited else 'spawn')
+    if inherited:
+        warm_up(options.get('fast', False))
+    if jsonl_path:
+        _start_jsonl_report(jsonl_path, [os.path.abspath(file_path) for file_path in files])
+
+    file_reports = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(options.get('fast', False), inherited)) as executor:
+        for final_report in executor.map(_review_file_timed, files, [options] * len(files), [jsonl_path] * len(files)):
+            file_reports.append(final_report)
+            print(f"Finished {final_report['file_path']} in {final_report['timing_seconds']}s ({final_report.get('issues_found', 0)} issue(s)).")
+
+    aggregated_report = aggregate_reports(file_reports, time.perf_counter() - started)
+    if jsonl_path:
+        _finish_jsonl_report(jsonl_path, aggregated_report)
+    else:
+        save_report(aggregated_report)
+    return aggregated_report
+
+def _baseline(incremental, file_path):
+    """Loads the previous report of a file for an incremental server job, or None.
+
+    Only what carry_forward needs is kept, so the job stays small.
+    """
+    if incremental == 'latest':
+        report_path, file_report = find_previous_report(file_path, review_mode='llm')
+    else:
+        report_path, file_report = incremental, load_report(incremental, file_path, review_mode='llm')
+    if file_report is None:
+        return None
+    return {
+        "report_path": report_path,
+        "statements": file_report.get('statements', []),
+        "issues": file_report.get('issues', [])
+    }
+
+
+def review_via_server(server_url, paths, language='SQL', jsonl_path=None, **options):
+    """Has a running review_server.py review the paths, printing issues as they stream in.
+
+    Paths are expanded here and sent as absolute paths, so the server must see the same
+    files. A single path of '-' sends the code read from stdin instead. Saves and returns
+    the report, aggregated when several files were reviewed. With `jsonl_path` the
+    streamed chunks are appended to that JSONL report instead. With `incremental`, the
+    previous reports are looked up here, where they are saved, and sent with the job.
+    """
+    from review_server import stream_review
+
+    incremental = options.pop('incremental', None)
+    if paths == ['-']:
+        job = {"content": sys.stdin.read(), "language": language, "name": "stdin"}
+        if incremental:
+            job['baseline'] = _baseline(incremental, 'stdin')
+    else:
+        job = {"paths": [os.path.abspath(path) for path in expand_paths(paths)]}
+        if incremental:
+            job['baselines'] = {path: _baseline(incremental, path) for path in job['paths']}
+    job['options'] = {key: value for key, value in options.items() if value is not None}
+
+    writer = _start_jsonl_report(jsonl_path, job.get('paths') or ['-']) if jsonl_path else None
+    file_reports = []
+    # Issues streamed ahead of their chunk are not printed again when the chunk finishes
+    printed = set()
+    for event in stream_review(server_url, job):
+        if event['event'] == 'issue':
+            issue = event['issue']
+            printed.add((event['file_path'], issue.get('line_number'), issue.get('rule_id'), issue.get('suggestion')))
+            print_issue(event['file_path'], issue)
+        elif event['event'] == 'chunk':
+            if event['statement'].get('streamed_issues_discarded'):
+                print(f"Review of the statement at {event['file_path']}:{event['statement']['start_line']} failed; "
+                      f"its {event['statement']['streamed_issues_discarded']} streamed issue(s) are not part of the report.")
+            for issue in event['issues']:
+                if (event['file_path'], issue.get('line_number'), issue.get('rule_id'), issue.get('suggestion')) not in printed:
+                    print_issue(event['file_path'], issue)
+            if writer is not None:
+                writer.chunk_writer(event['file_path'])(event['statement'], event['issues'])
+        elif event['event'] == 'file_finished':
+            if writer is not None:
+                file_report = _file_summary(event['report'])
+                writer.write('file_finished', **file_report)
+                file_reports.append(file_report)
+            else:
+                file_reports.append(event['report'])
+        elif event['event'] == 'error':
+            print(f"Review server error{' for ' + event['file_path'] if event.get('file_path') else ''}: {event['message']}")
+        elif event['event'] == 'done':
+            print(f"Reviewed {event['files_reviewed']} file(s) in {event['timing_seconds']}s, {event['issues_found']} issue(s) found.")
+            if writer is not None:
+                aggregated_report = aggregate_reports(file_reports, event['timing_seconds'])
+                _finish_jsonl_report(jsonl_path, aggregated_report)
+                return file_reports[0] if len(file_reports) == 1 else aggregated_report
+            if len(file_reports) == 1:
+                final_report = file_reports[0]
+            elif file_reports:
+                final_report = aggregate_reports(file_reports, event['timing_seconds'])
+            else:
+                return None
+            save_report(final_report)
+            return final_report
+    print("The review server closed the connection before the job finished.")
+    return None
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='AI Code Review Agent')
-    parser.add_argument('file_path', type=str, help='The path to the code file to be reviewed.')
+    parser.add_argument('paths', type=str, nargs='*', metavar='path',
+                        help='Code files, directories, glob patterns or @file lists to review.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes when reviewing several files (default: one per CPU core).')
+    parser.add_argument('--batch-size', type=int, default=None, help='Number of chunks per embedding batch.')
+    parser.add_argument('--encode-pool', action='store_true', default=None, help='Encode chunks with a multi-process pool across CPU cores.')
+    parser.add_argument('--fast', action='store_true', help='Only apply the regex rules (no embedding, no LLM); exits with status 1 if issues are found, 2 if the rules could not be applied.')
+    parser.add_argument('--concurrency', type=int, default=None, help='Maximum number of LLM reviews in flight at once.')
+    parser.add_argument('--pack', action='store_true', help='Review several small chunks that share the same rules in one prompt.')
+    parser.add_argument('--incremental', nargs='?', const='latest', default=None, metavar='PREVIOUS_REPORT',
+                        help='Only review statements that changed since a previous report (default: the latest report for this file in outputs/).')
+    parser.add_argument('--stream', action='store_true', help='Stream LLM responses, printing issues as they arrive.')
+    parser.add_argument('--no-dedup', action='store_true', help='Review every copy of a repeated statement separately.')
+    parser.add_argument('--dedup-literals', action='store_true',
+                        help='Also review statements that only differ in string and number literals once.')
+    parser.add_argument('--no-review-cache', action='store_true', help='Always call the LLM, neither reading nor writing cached reviews.')
+    parser.add_argument('--purge-review-cache', action='store_true', help='Delete all cached reviews before running.')
+    parser.add_argument('--server', type=str, default=None, metavar='URL',
+                        help='Send the review to a running review_server.py (http://host:port or unix:/path/to/socket).')
+    parser.add_argument('--language', type=str, default='SQL', choices=sorted(LANGUAGES_BY_EXTENSION.values()),
+                        help="Language of the code read from stdin when the path is '-' (with --server).")
+    parser.add_argument('--jsonl', nargs='?', const='auto', default=None, metavar='PATH',
+                        help='Append the report to a JSONL file as each chunk finishes (default: a timestamped file in outputs/).')
+    parser.add_argument('--sarif', nargs='?', const='auto', default=None, metavar='PATH',
+                        help='Also export the report as SARIF, built from the JSONL report (default: next to it).')
+    parser.add_argument('--metrics-file', type=str, default=None, metavar='PATH',
+                        help='Also write the stage timings and counters as a Prometheus text file.')
     args = parser.parse_args()
-    
-    analyze_code(args.file_path)
+
+    if args.purge_review_cache:
+        review_cache.purge()
+        if not args.paths:
+            sys.exit(0)
+    if not args.paths:
+        parser.error('the following arguments are required: path')
+    jsonl_path = args.jsonl or ('auto' if args.sarif else None)
+    if jsonl_path == 'auto':
+        jsonl_path = default_report_path('jsonl')
+    sarif_path = os.path.splitext(jsonl_path)[0] + '.sarif' if args.sarif == 'auto' else args.sarif
+
+    if args.fast and args.incremental:
+        parser.error("--incremental needs the LLM review and cannot be used with --fast.")
+    if args.server and args.paths == ['-'] and args.incremental == 'latest':
+        parser.error("--incremental needs a PREVIOUS_REPORT for code read from stdin.")
+
+    options = {
+        'batch_size': args.batch_size,
+        'encode_pool': args.encode_pool,
+        'fast': args.fast,
+        'concurrency': args.concurrency,
+        'pack': args.pack,
+        'incremental': args.incremental,
+        # Only set when given, so the reviewer's (or server's) configuration applies otherwise
+        'use_review_cache': False if args.no_review_cache else None,
+        'stream': True if args.stream else None,
+        'dedup': False if args.no_dedup else None,
+        'dedup_literals': True if args.dedup_literals else None
+    }
+    single_path = args.paths[0]
+    if args.server:
+        report = review_via_server(args.server, args.paths, language=args.language, jsonl_path=jsonl_path, **options)
+    elif len(args.paths) == 1 and not os.path.isdir(single_path) and not glob.has_magic(single_path) and not single_path.startswith('@'):
+        on_issue = (lambda issue: print_issue(single_path, issue)) if args.stream or LLM_CONFIG['stream'] else None
+        report = analyze_code(single_path, jsonl_path=jsonl_path, on_issue=on_issue, **options)
+    else:
+        report = analyze_paths(args.paths, workers=args.workers, jsonl_path=jsonl_path, **options)
+    if sarif_path and jsonl_path and os.path.exists(jsonl_path):
+        write_sarif(jsonl_path, sarif_path)
+    if args.metrics_file and report and 'metrics' in report:
+        metrics.write_prometheus(report['metrics'], args.metrics_file)
+    if args.fast and report and report.get('statements_not_reviewed', 0) > 0:
+        # Statements the rules never ran over must not pass the hook as clean
+        sys.exit(2)
+    if args.fast and report and report['issues_found'] > 0:
+        sys.exit(1)
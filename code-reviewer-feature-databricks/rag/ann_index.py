@@ -0,0 +1,293 @@
+import hashlib
+import numpy as np
+import sys
+import os
+import tempfile
+
+# Add project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import ANN_CONFIG
+from rag.vector_search import normalize_rows, top_k_similar_batch
+
+
+# Bumped whenever the on-disk layout changes so old index files are rebuilt
+INDEX_FORMAT = 1
+
+
+def _row_hashes(matrix):
+    """Returns a 64-bit content hash per row, used to spot rules whose vector changed."""
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(row.tobytes(), digest_size=8).digest(), 'little') for row in matrix],
+        dtype=np.uint64
+    )
+
+
+def _assign(matrix, centroids, block_size=8192):
+    """Assigns every row to its most similar centroid, in blocks to bound memory."""
+    assignments = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), block_size):
+        block = matrix[start:start + block_size]
+        assignments[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def _train_centroids(matrix, n_lists, iterations, seed=0):
+    """Runs spherical k-means over unit-length rows and returns unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(matrix, centroids)
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=n_lists)
+        present = np.flatnonzero(counts)
+        offsets = np.concatenate(([0], np.cumsum(counts[present])[:-1]))
+        sums = np.add.reduceat(matrix[order], offsets, axis=0)
+
+        new_centroids = centroids.copy()
+        new_centroids[present] = normalize_rows(sums)
+        # Empty clusters are reseeded from random rules so no list stays unused
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            new_centroids[empty] = matrix[rng.choice(len(matrix), empty.size, replace=False)]
+        if np.allclose(new_centroids, centroids, atol=1e-6):
+            break
+        centroids = new_centroids
+    return centroids
+
+
+def _with_lists(index):
+    """Groups the row assignments into contiguous inverted lists (CSR layout)."""
+    assignments = index['assignments']
+    index['list_rows'] = np.argsort(assignments, kind='stable').astype(np.int32)
+    counts = np.bincount(assignments, minlength=len(index['centroids']))
+    index['list_offsets'] = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    return index
+
+
+def build_index(matrix, rule_ids, n_lists=None, iterations=None):
+    """Builds an IVF index over a pre-normalized rule matrix.
+
+    The rules are clustered with k-means and each cluster keeps the list of rule rows
+    closest to it; a query only scores the rules in its `n_probe` nearest clusters.
+    """
+    if n_lists is None:
+        n_lists = ANN_CONFIG.get('n_lists') or int(np.sqrt(len(matrix)))
+    n_lists = max(1, min(n_lists, len(matrix)))
+    if iterations is None:
+        iterations = ANN_CONFIG['kmeans_iterations']
+
+    centroids = _train_centroids(matrix, n_lists, iterations)
+    print(f"Built an IVF index with {n_lists} lists over {len(matrix)} rule vectors.")
+    return _with_lists({
+        'centroids': centroids,
+        'assignments': _assign(matrix, centroids),
+        'rule_ids': np.asarray(rule_ids, dtype=np.int64),
+        'row_hashes': _row_hashes(matrix),
+    })
+
+
+def update_index(index, matrix, rule_ids, max_changed_fraction=None):
+    """Brings an index up to date with a changed rule matrix.
+
+    Rules whose id and vector are unchanged keep their cluster; new or changed rules are
+    assigned to their nearest existing centroid. The clusters are retrained from scratch
+    when more than `max_changed_fraction` of the rules changed, since the old centroids
+    no longer describe the catalog well. Returns the updated index.
+    """
+    if max_changed_fraction is None:
+        max_changed_fraction = ANN_CONFIG['max_changed_fraction']
+
+    rule_ids = np.asarray(rule_ids, dtype=np.int64)
+    row_hashes = _row_hashes(matrix)
+    previous = {
+        (rule_id, row_hash): assignment
+        for rule_id, row_hash, assignment in zip(index['rule_ids'].tolist(), index['row_hashes'].tolist(), index['assignments'].tolist())
+    }
+
+    assignments = np.full(len(matrix), -1, dtype=np.int32)
+    for row, key in enumerate(zip(rule_ids.tolist(), row_hashes.tolist())):
+        assignments[row] = previous.get(key, -1)
+    changed = np.flatnonzero(assignments < 0)
+    # A changed rule keeps its id, so only ids that are gone count as removed
+    previous_ids = set(index['rule_ids'].tolist())
+    current_ids = set(rule_ids.tolist())
+    added = len(current_ids - previous_ids)
+    removed = len(previous_ids - current_ids)
+    modified = changed.size - added
+
+    if changed.size + removed > max_changed_fraction * max(len(matrix), 1):
+        print(f"{added} rule vectors added, {modified} changed and {removed} removed, retraining the IVF index.")
+        return build_index(matrix, rule_ids, n_lists=len(index['centroids']))
+
+    if changed.size:
+        assignments[changed] = _assign(matrix[changed], index['centroids'])
+    print(f"Updated the IVF index: {added} rule vectors added, {modified} changed, {removed} removed.")
+    return _with_lists({
+        'centroids': index['centroids'],
+        'assignments': assignments,
+        'rule_ids': rule_ids,
+        'row_hashes': row_hashes,
+    })
+
+
+def save_index(index, path):
+    """Writes an index to an .npz file, replacing any previous file atomically."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    # A unique temporary file per writer, since workers may save the same index at once;
+    # written through the file object because np.savez appends .npz to bare names
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(
+                f,
+                format=np.array(INDEX_FORMAT),
+                centroids=index['centroids'],
+                assignments=index['assignments'],
+                rule_ids=index['rule_ids'],
+                row_hashes=index['row_hashes'],
+            )
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_index(path):
+    """Reads an index written by save_index, returning None if it is missing or unreadable."""
+    try:
+        with np.load(path) as data:
+            if int(data['format']) != INDEX_FORMAT:
+                return None
+            index = {name: data[name] for name in ('centroids', 'assignments', 'rule_ids', 'row_hashes')}
+    except (OSError, KeyError, ValueError) as e:
+        if os.path.exists(path):
+            print(f"Could not read ANN index {path}, rebuilding it: {e}")
+        return None
+    return _with_lists(index)
+
+
+def index_path(language):
+    """Returns the index file used for a language."""
+    return os.path.join(ANN_CONFIG['path'], f"rules_{language.lower()}.npz")
+
+
+def load_or_build_index(language, matrix, rule_ids):
+    """Returns an up-to-date index for a language's rule matrix, reusing the one on disk.
+
+    The stored index is updated incrementally for the rules that changed since it was
+    written, and saved back when anything changed.
+    """
+    path = index_path(language)
+    index = load_index(path)
+    if index is None or index['centroids'].shape[1] != matrix.shape[1]:
+        index = build_index(matrix, rule_ids)
+    elif np.array_equal(index['rule_ids'], np.asarray(rule_ids, dtype=np.int64)) and np.array_equal(index['row_hashes'], _row_hashes(matrix)):
+        return index
+    else:
+        index = update_index(index, matrix, rule_ids)
+    try:
+        save_index(index, path)
+    except OSError as e:
+        print(f"Could not save ANN index {path}: {e}")
+    return index
+
+
+def search_batch(index, rule_matrix, embeddings, top_k=3, similarity_threshold=0.55, n_probe=None):
+    """Searches the `n_probe` nearest clusters of each embedding.
+
+    The work is done per cluster rather than per embedding: each probed cluster's rules
+    are scored in one matrix product against every embedding that probes it, and merged
+    into a running top_k per embedding. Returns one (indices, scores) pair per embedding,
+    like top_k_similar_batch, with indices into `rule_matrix`.
+    """
+    if n_probe is None:
+        n_probe = ANN_CONFIG['n_probe']
+    embeddings = normalize_rows(np.atleast_2d(embeddings))
+    list_rows = index['list_rows']
+    list_offsets = index['list_offsets']
+    n_lists = len(index['centroids'])
+    n_probe = max(1, min(n_probe, n_lists))
+    k = max(top_k, 0)
+
+    centroid_scores = embeddings @ index['centroids'].T
+    if n_probe < n_lists:
+        probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+    else:
+        probes = np.broadcast_to(np.arange(n_lists), centroid_scores.shape)
+
+    best_scores = np.full((len(embeddings), k), -np.inf, dtype=np.float32)
+    best_rows = np.full((len(embeddings), k), -1, dtype=np.int64)
+
+    # (cluster, embedding) pairs sorted by cluster, so each cluster is one contiguous group
+    probed = probes.ravel()
+    queries = np.repeat(np.arange(len(embeddings)), n_probe)
+    order = np.argsort(probed, kind='stable')
+    probed, queries = probed[order], queries[order]
+    group_starts = np.concatenate(([0], np.flatnonzero(np.diff(probed)) + 1, [len(probed)])) if k else [0]
+
+    for start, stop in zip(group_starts[:-1], group_starts[1:]):
+        list_id = probed[start]
+        rows = list_rows[list_offsets[list_id]:list_offsets[list_id + 1]]
+        if not len(rows):
+            continue
+        group = queries[start:stop]
+        scores = embeddings[group] @ rule_matrix[rows].T
+        merged_scores = np.concatenate([best_scores[group], scores], axis=1)
+        merged_rows = np.concatenate([best_rows[group], np.broadcast_to(rows, scores.shape)], axis=1)
+        keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        best_scores[group] = np.take_along_axis(merged_scores, keep, axis=1)
+        best_rows[group] = np.take_along_axis(merged_rows, keep, axis=1)
+
+    results = []
+    for row_scores, row_rows in zip(best_scores, best_rows):
+        # Unfilled slots (fewer candidates than top_k) keep row -1
+        keep = (row_rows >= 0) & (row_scores > similarity_threshold)
+        row_scores, row_rows = row_scores[keep], row_rows[keep]
+        order = np.argsort(-row_scores, kind='stable')
+        results.append((row_rows[order].astype(np.intp), row_scores[order]))
+    return results
+
+
+def recall_at_k(index, rule_matrix, queries, top_k=3, n_probe=None):
+    """Measures how many of the exact top_k rules the index finds, averaged over queries.
+
+    The threshold is disabled on both sides so recall reflects the index, not the cut-off.
+    Returns a value between 0 and 1.
+    """
+    exact = top_k_similar_batch(rule_matrix, queries, top_k, similarity_threshold=-np.inf)
+    approximate = search_batch(index, rule_matrix, queries, top_k, similarity_threshold=-np.inf, n_probe=n_probe)
+    found = 0
+    total = 0
+    for (exact_indices, _), (approximate_indices, _) in zip(exact, approximate):
+        found += len(np.intersect1d(exact_indices, approximate_indices))
+        total += len(exact_indices)
+    return found / total if total else 1.0
+
+
+def check_recall(language='SQL', sample_size=200, top_k=3, n_probe=None):
+    """Builds or refreshes the index for a language and prints its recall against exact search.
+
+    Slightly perturbed copies of a sample of rule vectors stand in for code embeddings.
+    """
+    from rag.rule_cache import get_rules
+
+    rules = get_rules(language)
+    matrix = rules['vectors']
+    if not len(rules['vector_rules']):
+        print(f"No vectorized rules found for {language}.")
+        return None
+    index = rules['ann_index'] or load_or_build_index(language, matrix, [rule['id'] for rule in rules['vector_rules']])
+
+    rng = np.random.default_rng(0)
+    sample = matrix[rng.choice(len(matrix), min(sample_size, len(matrix)), replace=False)]
+    queries = sample + rng.normal(scale=0.05, size=sample.shape).astype(np.float32)
+    recall = recall_at_k(index, matrix, queries, top_k=top_k, n_probe=n_probe)
+    print(f"Recall@{top_k} for {language} over {len(queries)} queries: {recall:.3f}")
+    return recall
+
+
+if __name__ == "__main__":
+    check_recall(sys.argv[1] if len(sys.argv) > 1 else 'SQL')
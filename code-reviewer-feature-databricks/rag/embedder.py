@@ -0,0 +1,181 @@
+import numpy as np
+import sys
+import os
+import threading
+
+# Add project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDING_CONFIG
+from rag import embedding_cache
+from rag.vector_search import normalize_rows
+from utils import metrics
+
+
+# Identifies the model whose vector space the embeddings (and stored rule vectors) live in
+model_path = EMBEDDING_CONFIG['model_path']
+
+_model = None
+_model_lock = threading.Lock()
+
+
+class SentenceTransformerBackend:
+    """Full-precision PyTorch encoding with sentence_transformers."""
+
+    name = 'sentence-transformers'
+
+    def __init__(self, path):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(path)
+
+    def encode(self, code_chunks, batch_size, use_pool=False):
+        if use_pool and len(code_chunks) >= EMBEDDING_CONFIG['multi_process_min_chunks']:
+            print(f"Encoding {len(code_chunks)} chunks with a multi-process pool (batch size {batch_size})...")
+            pool = self.model.start_multi_process_pool()
+            try:
+                return self.model.encode_multi_process(code_chunks, pool, batch_size=batch_size)
+            finally:
+                self.model.stop_multi_process_pool(pool)
+        print(f"Encoding {len(code_chunks)} chunks (batch size {batch_size})...")
+        return self.model.encode(code_chunks, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+
+class OnnxBackend:
+    """Int8-quantized ONNX Runtime encoding of the same model, for CPU-only hosts.
+
+    Reproduces the sentence transformer's mean pooling and normalization, so its vectors
+    stay comparable with rule vectors stored by the PyTorch model. The model directory is
+    written by rag/onnx_export.py.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model_dir):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        if EMBEDDING_CONFIG.get('onnx_threads'):
+            options.intra_op_num_threads = EMBEDDING_CONFIG['onnx_threads']
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, 'model_int8.onnx'), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=EMBEDDING_CONFIG['max_seq_length'])
+        self.tokenizer.enable_padding()
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {
+            'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            'attention_mask': attention_mask,
+            'token_type_ids': np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        token_embeddings = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+        # Mean pooling over the real tokens, then L2 normalization, as in the sentence transformer
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return normalize_rows(pooled)
+
+    def encode(self, code_chunks, batch_size, use_pool=False):
+        print(f"Encoding {len(code_chunks)} chunks with ONNX Runtime (batch size {batch_size})...")
+        # Batching texts of similar length keeps padding, and so wasted work, small
+        order = sorted(range(len(code_chunks)), key=lambda i: len(code_chunks[i]))
+        embeddings = np.empty((len(code_chunks), 0), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            encoded = self._encode_batch([code_chunks[i] for i in batch])
+            if embeddings.shape[1] == 0:
+                embeddings = np.empty((len(code_chunks), encoded.shape[1]), dtype=np.float32)
+            embeddings[batch] = encoded
+        return embeddings
+
+
+BACKENDS = {
+    SentenceTransformerBackend.name: lambda: SentenceTransformerBackend(model_path),
+    OnnxBackend.name: lambda: OnnxBackend(EMBEDDING_CONFIG['onnx_model_dir']),
+}
+
+
+def load_backend(name):
+    """Creates an embedding backend by name (see BACKENDS)."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {name!r}, expected one of {sorted(BACKENDS)}.")
+    return BACKENDS[name]()
+
+
+def get_model():
+    """Loads the configured embedding backend on first use.
+
+    The backend's libraries (torch with sentence_transformers, or onnxruntime) are only
+    imported here, so runs that never reach the vector path, such as --fast or files where
+    every chunk hits a regex rule, do not pay for them.
+    """
+    global _model
+    with _model_lock:
+        if _model is not None:
+            return _model
+
+        backend = EMBEDDING_CONFIG['backend']
+        print(f"Loading the {backend} embedding backend...")
+        try:
+            model = load_backend(backend)
+            print("Model loaded successfully.")
+        except Exception as e:
+            print(f"An error occurred while loading the model: {e}")
+            model = None  # Safeguard for failed loading
+
+        # Use an assertion to ensure the model is correctly loaded before using it
+        assert model is not None, "Model failed to load, ensure the correct path and files exist."
+        _model = model
+        return _model
+
+
+def cache_model_id():
+    """Keys cached embeddings by backend too, since quantized vectors differ slightly."""
+    return f"{EMBEDDING_CONFIG['backend']}:{model_path}"
+
+
+def _encode(code_chunks, batch_size, use_pool):
+    """Runs the model over the chunks, optionally through a multi-process encode pool."""
+    embeddings = get_model().encode(code_chunks, batch_size, use_pool)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def embed_chunks(code_chunks, batch_size=None, use_pool=None):
+    """Embeds a list of code chunks with batched encode calls.
+
+    Embeddings are looked up in the on-disk embedding cache first, so only chunks that have
+    not been seen with this model are encoded. When `use_pool` is enabled (see
+    EMBEDDING_CONFIG) and there are enough chunks, the work is spread over a multi-process
+    encode pool with one worker per CPU core.
+    Returns a float32 matrix with one row per chunk.
+    """
+    if batch_size is None:
+        batch_size = EMBEDDING_CONFIG['batch_size']
+    if use_pool is None:
+        use_pool = EMBEDDING_CONFIG['multi_process']
+
+    if not code_chunks:
+        return np.empty((0, 0), dtype=np.float32)
+
+    keys = embedding_cache.cache_keys(code_chunks, cache_model_id())
+    cached = embedding_cache.lookup(keys)
+    missing = [i for i, embedding in enumerate(cached) if embedding is None]
+    print(f"Embedding cache: {len(code_chunks) - len(missing)} hit(s), {len(missing)} miss(es).")
+
+    if missing:
+        # Identical chunks within the run are encoded once
+        unique_indices = list({keys[i]: i for i in missing}.values())
+        with metrics.timer('encode'):
+            encoded = _encode([code_chunks[i] for i in unique_indices], batch_size, use_pool)
+        metrics.increment('encoded_chunks_total', len(unique_indices))
+        by_key = {keys[i]: row for i, row in zip(unique_indices, encoded)}
+        for i in missing:
+            cached[i] = by_key[keys[i]]
+        embedding_cache.store([keys[i] for i in unique_indices], encoded)
+
+    return np.vstack(cached).astype(np.float32, copy=False)
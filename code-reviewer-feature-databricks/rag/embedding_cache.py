@@ -0,0 +1,74 @@
+import numpy as np
+import sys
+import os
+import threading
+
+# Add project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDING_CACHE_CONFIG
+from utils.fingerprint import chunk_fingerprint
+from utils import metrics
+from utils.sqlite_cache import SQLiteCache
+
+
+_cache = None
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+_inherited_caches = []
+
+
+def _get_cache():
+    """Opens the on-disk cache on first use."""
+    global _cache
+    if _cache is None:
+        _cache = SQLiteCache(EMBEDDING_CACHE_CONFIG['path'], EMBEDDING_CACHE_CONFIG['max_entries'])
+    return _cache
+
+
+def cache_keys(code_chunks, model_id):
+    """Builds the content-addressed keys for chunks embedded with a given model."""
+    return [chunk_fingerprint(code_chunk, 'embedding', model_id) for code_chunk in code_chunks]
+
+
+def lookup(keys):
+    """Returns one cached float32 embedding per key, or None where the key is missing."""
+    if not EMBEDDING_CACHE_CONFIG['enabled']:
+        return [None] * len(keys)
+    found = _get_cache().get_many(keys)
+    embeddings = [
+        np.frombuffer(found[key], dtype=np.float32) if key in found else None
+        for key in keys
+    ]
+    hits = sum(embedding is not None for embedding in embeddings)
+    with _stats_lock:
+        _stats['hits'] += hits
+        _stats['misses'] += len(keys) - hits
+    metrics.increment('embedding_cache_total', hits, result='hit')
+    metrics.increment('embedding_cache_total', len(keys) - hits, result='miss')
+    return embeddings
+
+
+def store(keys, embeddings):
+    """Saves newly computed embeddings under their keys."""
+    if not EMBEDDING_CACHE_CONFIG['enabled'] or not keys:
+        return
+    _get_cache().put_many({
+        key: np.asarray(embedding, dtype=np.float32).tobytes()
+        for key, embedding in zip(keys, embeddings)
+    })
+
+
+def get_stats():
+    """Returns a copy of the hit/miss counters for this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_after_fork():
+    """Sets the inherited SQLite connection aside; a forked child opens its own on first use."""
+    global _cache, _stats_lock
+    if _cache is not None:
+        _inherited_caches.append(_cache)
+    _cache = None
+    _stats_lock = threading.Lock()
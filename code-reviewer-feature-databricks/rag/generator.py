@@ -2,6 +2,18 @@ import requests
 import json
 from dotenv import load_dotenv
 import os
+import random
+import sys
+import threading
+import time
+
+# Add project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import LLM_CONFIG, PACKING_CONFIG
+from rag import review_cache
+from rag.review_stream import ReviewStreamParser
+from utils import metrics
 
 load_dotenv()
 
@@ -9,14 +21,77 @@ DATABRICKS_TOKEN = os.environ.get('DATABRICKS_TOKEN')
 if DATABRICKS_TOKEN is None:
     raise ValueError("DATABRICKS_TOKEN environment variable is not set.")
 
-def call_databricks_llm(prompt, temperature=0.0):
+ENDPOINT_NAME = "databricks-claude-sonnet-4"
+
+# Bump whenever the prompt templates in generate_review change, so cached reviews are not reused
+PROMPT_VERSION = "1"
+PACKED_PROMPT_VERSION = f"{PROMPT_VERSION}-packed"
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# One session so concurrent reviews reuse pooled HTTPS connections, created on first use
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+# When the endpoint rate-limits one request, every worker waits until this time
+_rate_limited_until = 0.0
+_rate_limit_lock = threading.Lock()
+
+
+def size_session(pool_size):
+    """Makes the shared session pool at least `pool_size` connections and returns it.
+
+    The pool only grows, so a run or server job with more reviews in flight than
+    LLM_CONFIG['max_concurrency'] does not open and drop a connection per request.
+    """
+    global _session, _session_pool_size
+    pool_size = max(1, pool_size or 1)
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if pool_size > _session_pool_size:
+            _session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=pool_size))
+            _session_pool_size = pool_size
+        return _session
+
+
+def _wait_for_rate_limit():
+    """Sleeps until any shared rate-limit cooldown has passed."""
+    with _rate_limit_lock:
+        delay = _rate_limited_until - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def _backoff_delay(attempt, response=None):
+    """Returns how long to wait before retrying, honoring Retry-After when the server sends it."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_CONFIG['backoff_max_seconds'])
+            except ValueError:
+                pass
+    delay = LLM_CONFIG['backoff_base_seconds'] * (2 ** attempt)
+    # Full jitter so concurrent workers do not retry in lockstep
+    return random.uniform(0, min(delay, LLM_CONFIG['backoff_max_seconds']))
+
+
+def _post_llm(prompt, temperature, stream=False):
+    """Posts a prompt to the serving endpoint, retrying rate limits, 5xx and connection errors.
+
+    Returns the 200 response, or None if the request failed. With `stream` the body is
+    left unread, to be consumed as server-sent events.
+    """
+    global _rate_limited_until
     headers = {
         "Authorization": f"Bearer {DATABRICKS_TOKEN}",
         "Content-Type": "application/json"
     }
     
-    endpoint_name = "databricks-claude-sonnet-4"
-    url = f"https://dbc-3735add4-1cb6.cloud.databricks.com/serving-endpoints/{endpoint_name}/invocations"
+    url = f"https://dbc-3735add4-1cb6.cloud.databricks.com/serving-endpoints/{ENDPOINT_NAME}/invocations"
     
     data = {
         "messages": [
@@ -24,33 +99,147 @@ def call_databricks_llm(prompt, temperature=0.0):
         ],
         "temperature": temperature
     }
+    if stream:
+        data["stream"] = True
     
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-        if response.status_code == 200:
-            result = response.json()
-            # Extract the text content from the response
-            if "choices" in result and len(result["choices"]) > 0:
-                message = result["choices"][0]["message"]
-                if "content" in message and isinstance(message["content"], list):
-                    # Extract text from the content array
-                    for content_item in message["content"]:
-                        if content_item.get("type") == "text":
-                            return content_item.get("text", "")
-                elif "content" in message and isinstance(message["content"], str):
-                    # Handle if content is a string (fallback)
-                    return message["content"]
+    max_retries = LLM_CONFIG['max_retries']
+    for attempt in range(max_retries + 1):
+        _wait_for_rate_limit()
+        if attempt:
+            metrics.increment('llm_retries_total')
+        try:
+            # For a stream this only times the wait for the response headers
+            with metrics.timer('llm'):
+                response = size_session(LLM_CONFIG['max_concurrency']).post(url, headers=headers, data=json.dumps(data), timeout=LLM_CONFIG['timeout_seconds'], stream=stream)
+        except requests.RequestException as e:
+            metrics.increment('llm_requests_total', status='connection_error')
+            if attempt < max_retries:
+                delay = _backoff_delay(attempt)
+                print(f"Error connecting to Databricks LLM: {e}. Retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+            print(f"Error connecting to Databricks LLM: {e}")
             return None
-        else:
+
+        metrics.increment('llm_requests_total', status=response.status_code)
+        if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+            delay = _backoff_delay(attempt, response)
+            if response.status_code == 429:
+                with _rate_limit_lock:
+                    _rate_limited_until = max(_rate_limited_until, time.monotonic() + delay)
+            print(f"Databricks LLM returned {response.status_code}. Retrying in {delay:.1f}s...")
+            response.close()
+            time.sleep(delay)
+            continue
+
+        if response.status_code != 200:
             print(f"Error: {response.status_code} - {response.text}")
             return None
+        return response
+    return None
+
+
+def _message_text(message):
+    """Returns the text of a message or stream delta, whose content is a string or a list of parts."""
+    content = message.get("content")
+    if isinstance(content, list):
+        # Extract text from the content array
+        return "".join(item.get("text", "") for item in content if item.get("type") == "text")
+    return content
+
+
+def call_databricks_llm(prompt, temperature=0.0):
+    response = _post_llm(prompt, temperature)
+    if response is None:
+        return None
+    try:
+        result = response.json()
+        # Token counts come from the endpoint when it reports usage, else are estimated
+        usage = result.get("usage") or {}
+        metrics.increment('llm_prompt_tokens_total', usage.get("prompt_tokens") or estimate_tokens(prompt))
+        # Extract the text content from the response
+        if "choices" in result and len(result["choices"]) > 0:
+            text = _message_text(result["choices"][0]["message"])
+            if text is not None:
+                metrics.increment('llm_completion_tokens_total', usage.get("completion_tokens") or estimate_tokens(text))
+                return text
+        return None
     except Exception as e:
-        print(f"Error connecting to Databricks LLM: {e}")
+        print(f"Error reading Databricks LLM response: {e}")
         return None
 
-def generate_review(code_chunk, rules, retrieval_method="Vector Search"):
-    """Generates a code review in a structured JSON format by calling the Databricks model."""
-    
+
+def stream_databricks_llm(prompt, temperature=0.0, on_issue=None):
+    """Calls the LLM with a streamed response and parses the review as it arrives.
+
+    Each issue is passed to `on_issue` as soon as it is complete. The stream is closed as
+    soon as the answer is known (see ReviewStreamParser), so the endpoint stops generating
+    whatever would follow it. Returns the parsed review, or None, also when the stream fails
+    after some issues were already passed to `on_issue`.
+    """
+    started = time.perf_counter()
+    response = _post_llm(prompt, temperature, stream=True)
+    if response is None:
+        return None
+
+    parser = ReviewStreamParser()
+    usage = {}
+    parse_seconds = 0.0
+    first_issue = True
+    body_started = time.perf_counter()
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            # Server-sent events: only the data lines carry completion chunks
+            if not line or not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            event = json.loads(payload)
+            usage = event.get("usage") or usage
+            choices = event.get("choices") or []
+            text = _message_text(choices[0].get("delta") or choices[0].get("message") or {}) if choices else None
+            if not text:
+                continue
+
+            parse_started = time.perf_counter()
+            issues = parser.feed(text)
+            parse_seconds += time.perf_counter() - parse_started
+            for issue in issues:
+                if first_issue:
+                    metrics.observe('llm_first_issue', time.perf_counter() - started)
+                    first_issue = False
+                if on_issue is not None:
+                    on_issue(issue)
+            if parser.done:
+                metrics.increment('llm_early_stops_total')
+                break
+    except (requests.RequestException, ValueError) as e:
+        print(f"Error reading the Databricks LLM stream: {e}")
+        return None
+    finally:
+        response.close()
+        metrics.observe('llm_stream', time.perf_counter() - body_started)
+
+    metrics.increment('llm_prompt_tokens_total', usage.get("prompt_tokens") or estimate_tokens(prompt))
+    metrics.increment('llm_completion_tokens_total', usage.get("completion_tokens") or estimate_tokens(parser.text))
+    metrics.observe('parse', parse_seconds)
+
+    review = parser.result()
+    if review is None:
+        # The stream ended before the answer was complete; try the text as a whole
+        review = _parse_review(parser.text)
+    return review
+
+
+def _call_for_review(prompt, temperature, on_issue=None, stream=None):
+    """Gets a parsed review for a prompt, streamed when `stream` (default LLM_CONFIG['stream']) is set."""
+    if LLM_CONFIG.get('stream') if stream is None else stream:
+        return stream_databricks_llm(prompt, temperature, on_issue)
+    return _parse_review(call_databricks_llm(prompt, temperature))
+
+def _format_rules(rules):
+    """Renders the bad and good practice sections of a prompt."""
     # Prepare the bad practices section of the prompt
     bad_practices_text = "\n".join([
         f"- {rule['title']} (Rule ID: {rule['id']}, Severity: {rule['severity']}): {rule['description']}"
@@ -63,6 +252,54 @@ def generate_review(code_chunk, rules, retrieval_method="Vector Search"):
         for rule in rules.get('good_practices', [])
     ]) if rules.get('good_practices') else "None"
 
+    return bad_practices_text, good_practices_text
+
+
+def _parse_review(review_text):
+    """Extracts the JSON object from the model's response, or returns None."""
+    with metrics.timer('parse'):
+        return _parse_review_text(review_text)
+
+
+def _parse_review_text(review_text):
+    """Finds and decodes the JSON object in the response text."""
+    if review_text:
+        try:
+            # Find the JSON object within the response text
+            json_start = review_text.find('{')
+            json_end = review_text.rfind('}') + 1
+            if json_start != -1 and json_end != 0:
+                json_str = review_text[json_start:json_end]
+                return json.loads(json_str)
+            else:
+                print(f"Error: Could not find a valid JSON object in the response.")
+                print(f"Received text: {review_text}")
+                return None
+        except json.JSONDecodeError as e:
+            print(f"Error parsing JSON from response: {e}")
+            print(f"Received text: {review_text}")
+            return None
+    else:
+        print("No response received from Databricks LLM")
+        return None
+
+
+def generate_review(code_chunk, rules, retrieval_method="Vector Search", on_issue=None, use_cache=True, stream=None):
+    """Generates a code review in a structured JSON format by calling the Databricks model.
+
+    Reviews are cached by chunk, rule IDs, retrieval method, prompt version and model, and a
+    cache hit skips the LLM call entirely; `use_cache` False bypasses the cache. When the
+    response is streamed (`stream`, default LLM_CONFIG['stream']), `on_issue(issue)` is
+    called for each issue (with a chunk-relative line number) as soon as it arrives.
+    """
+    cache_key = review_cache.review_key(code_chunk, rules, retrieval_method, PROMPT_VERSION, ENDPOINT_NAME)
+    cached_review = review_cache.lookup(cache_key) if use_cache else None
+    if cached_review is not None:
+        return cached_review
+
+    prompt_started = time.perf_counter()
+    bad_practices_text, good_practices_text = _format_rules(rules)
+
     # Default temperature for deterministic output
     temperature = 0.0
 
@@ -133,25 +370,212 @@ Your response MUST be a single, valid JSON object. If you find no issues, you MU
 
 JSON Response:"""
 
+    metrics.observe('prompt_build', time.perf_counter() - prompt_started)
+
     # Call the Databricks LLM
-    review_text = call_databricks_llm(prompt, temperature)
-    
-    if review_text:
-        try:
-            # Find the JSON object within the response text
-            json_start = review_text.find('{')
-            json_end = review_text.rfind('}') + 1
-            if json_start != -1 and json_end != 0:
-                json_str = review_text[json_start:json_end]
-                return json.loads(json_str)
-            else:
-                print(f"Error: Could not find a valid JSON object in the response.")
-                print(f"Received text: {review_text}")
-                return None
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON from response: {e}")
-            print(f"Received text: {review_text}")
+    review = _call_for_review(prompt, temperature, on_issue, stream)
+    if use_cache:
+        review_cache.store(cache_key, review)
+    return review
+
+
+def estimate_tokens(text):
+    """Roughly estimates the number of tokens in a text (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def pack_chunks(items, token_budget=None, small_chunk_tokens=None, max_chunks_per_prompt=None):
+    """Groups small chunks that share the same retrieved rules into prompt-sized packs.
+
+    `items` is a list of (index, code_chunk, start_line, relevant_rules, retrieval_method)
+    tuples. Chunks are grouped by retrieval method and rule IDs, then packed greedily in
+    order until the estimated prompt size would exceed the token budget. Chunks larger
+    than `small_chunk_tokens` are always reviewed on their own.
+    Returns a list of packs, each a list of items.
+    """
+    if token_budget is None:
+        token_budget = PACKING_CONFIG['token_budget']
+    if small_chunk_tokens is None:
+        small_chunk_tokens = PACKING_CONFIG['small_chunk_tokens']
+    if max_chunks_per_prompt is None:
+        max_chunks_per_prompt = PACKING_CONFIG['max_chunks_per_prompt']
+
+    packs = []
+    open_packs = {}
+    for item in items:
+        _, code_chunk, _, relevant_rules, retrieval_method = item
+        chunk_tokens = estimate_tokens(code_chunk) + PACKING_CONFIG['chunk_overhead_tokens']
+        if chunk_tokens > small_chunk_tokens:
+            packs.append([item])
+            continue
+
+        rule_ids = tuple(sorted(
+            str(rule['id'])
+            for rule in relevant_rules.get('bad_practices', []) + relevant_rules.get('good_practices', [])
+        ))
+        group = (retrieval_method, rule_ids)
+        pack = open_packs.get(group)
+        if pack is not None and (
+            pack['tokens'] + chunk_tokens > token_budget or len(pack['items']) >= max_chunks_per_prompt
+        ):
+            pack = None
+        if pack is None:
+            bad_practices_text, good_practices_text = _format_rules(relevant_rules)
+            pack = {
+                'items': [],
+                'tokens': PACKING_CONFIG['prompt_overhead_tokens'] + estimate_tokens(bad_practices_text + good_practices_text)
+            }
+            open_packs[group] = pack
+            packs.append(pack['items'])
+        pack['items'].append(item)
+        pack['tokens'] += chunk_tokens
+
+    return packs
+
+
+def _shift_line_numbers(review, offset):
+    """Returns a copy of a packed review with every integer line_number moved by offset."""
+    issues = []
+    for issue in review.get('issues', []):
+        issue = dict(issue)
+        if isinstance(issue.get('line_number'), int):
+            issue['line_number'] += offset
+        issues.append(issue)
+    return dict(review, issues=issues)
+
+
+def _format_packed_code(pending):
+    """Renders each chunk with its chunk ID and with file line numbers on every line."""
+    sections = []
+    for chunk_id, (_, code_chunk, start_line, _, _) in enumerate(pending):
+        numbered = "\n".join(
+            f"{start_line + offset} | {line}"
+            for offset, line in enumerate(code_chunk.splitlines())
+        )
+        sections.append(f"### Chunk {chunk_id}\n```\n{numbered}\n```")
+    return "\n\n".join(sections)
+
+
+def generate_packed_review(items, on_issue=None, use_cache=True, stream=None):
+    """Reviews several small chunks that share the same rules in a single prompt.
+
+    `items` is one pack from pack_chunks. Returns {index: review}, where each review has
+    the usual `issues_found`/`issues` keys, issue `line_number`s are absolute file lines,
+    and `absolute_line_numbers` is set to True. If the packed response cannot be parsed,
+    the chunks are reviewed one by one instead. When responses are streamed,
+    `on_issue(index, issue, absolute_line_numbers)` is called for each issue as it arrives.
+    `use_cache` and `stream` are as for generate_review.
+    """
+    relevant_rules, retrieval_method = items[0][3], items[0][4]
+
+    reviews = {}
+    pending = []
+    cache_keys = []
+    for item in items:
+        cache_key = review_cache.review_key(item[1], relevant_rules, retrieval_method, PACKED_PROMPT_VERSION, ENDPOINT_NAME)
+        cached_review = review_cache.lookup(cache_key) if use_cache else None
+        if cached_review is not None:
+            reviews[item[0]] = _shift_line_numbers(cached_review, item[2] - 1)
+        else:
+            pending.append(item)
+            cache_keys.append(cache_key)
+
+    if not pending:
+        return reviews
+    def chunk_issue_callback(index):
+        if on_issue is None:
             return None
+        return lambda issue: on_issue(index, issue, False)
+
+    if len(pending) == 1:
+        index, code_chunk = pending[0][0], pending[0][1]
+        reviews[index] = generate_review(code_chunk, relevant_rules, retrieval_method, chunk_issue_callback(index), use_cache, stream)
+        return reviews
+
+    prompt_started = time.perf_counter()
+    bad_practices_text, good_practices_text = _format_rules(relevant_rules)
+    code_text = _format_packed_code(pending)
+    temperature = 0.0
+
+    if retrieval_method == "Regex Match":
+        intro = f"""You are a precise code review assistant. Each code chunk below has been identified as potentially violating one or more bad practices via direct Regex Matches.
+
+**Bad Practices Found by Regex:**
+{bad_practices_text}"""
+        task = "Review each chunk and confirm each violation from the list of 'Bad Practices Found by Regex' that it actually contains."
+        issue_keys = "`chunk_id`, `line_number`, `severity`, `rule_id`, and `suggestion`"
+    elif relevant_rules.get('bad_practices'):
+        intro = f"""You are a precise and discerning code review assistant. Your task is to carefully analyze each code chunk below and determine if it violates any of the *potential* bad practices listed below. These rules were identified as potentially relevant through a semantic search, but they may not all be applicable.
+
+**Potential Bad Practices to Evaluate:**
+{bad_practices_text}
+
+**Good Practices to Follow (for context, not for flagging issues):**
+{good_practices_text}"""
+        task = "**Critically evaluate** each chunk against each of the 'Potential Bad Practices'. Only report genuine violations; if a chunk does NOT violate any of the listed bad practices, report nothing for it."
+        issue_keys = "`chunk_id`, `line_number`, `severity`, `rule_id`, and `suggestion`"
     else:
-        print("No response received from Databricks LLM")
-        return None
+        temperature = 0.75
+        intro = """You are a highly intelligent SQL code review assistant. Your primary method of finding issues (rule-based retrieval) found no relevant rules for the following code chunks.
+
+Therefore, you must now rely entirely on your own extensive knowledge of SQL best practices, performance tuning, and security to conduct a thorough review. These sql codes are written by skilled employees, hence don't include basic tips as suggestions rather go into advanced sql techniques or suggestions."""
+        task = "**Analyze each chunk creatively and critically.** Look for anti-patterns, performance bottlenecks (like correlated subqueries), or security risks that may not be in a standard rulebook. Use the special value \"AI Generated Suggestion\" for `severity` and **do not include a `rule_id`.**"
+        issue_keys = "`chunk_id`, `line_number`, `severity`, and `suggestion`"
+
+    prompt = f"""{intro}
+
+**Code to Review:**
+Each chunk is independent and is shown with its chunk ID. Every line is prefixed with its line number in the file.
+
+{code_text}
+
+**Task:**
+{task}
+
+Your response MUST be a single, valid JSON object of the form {{"issues_found": <number>, "issues": [...]}}. For each issue, provide **only** these keys: {issue_keys}. `chunk_id` is the ID of the chunk the issue belongs to and `line_number` is the file line number shown in front of the offending line.
+
+If you find no issues in any chunk, you MUST return this exact JSON object:
+{{"issues_found": 0, "issues": []}}
+
+JSON Response:"""
+
+    metrics.observe('prompt_build', time.perf_counter() - prompt_started)
+
+    def packed_issue(issue):
+        try:
+            chunk_id = int(issue.get('chunk_id'))
+        except (TypeError, ValueError):
+            return
+        if on_issue is not None and 0 <= chunk_id < len(pending):
+            on_issue(pending[chunk_id][0], {key: value for key, value in issue.items() if key != 'chunk_id'}, True)
+
+    packed_review = _call_for_review(prompt, temperature, packed_issue, stream)
+    if packed_review is None or not isinstance(packed_review.get('issues'), list):
+        print(f"Could not use the packed review for {len(pending)} chunks, reviewing them one by one.")
+        for index, code_chunk, _, _, _ in pending:
+            reviews[index] = generate_review(code_chunk, relevant_rules, retrieval_method, chunk_issue_callback(index), use_cache, stream)
+        return reviews
+
+    issues_by_chunk = {chunk_id: [] for chunk_id in range(len(pending))}
+    for issue in packed_review['issues']:
+        try:
+            chunk_id = int(issue.pop('chunk_id'))
+        except (KeyError, TypeError, ValueError):
+            print(f"Dropping issue without a valid chunk_id: {issue}")
+            continue
+        if chunk_id not in issues_by_chunk:
+            print(f"Dropping issue for unknown chunk_id {chunk_id}: {issue}")
+            continue
+        issues_by_chunk[chunk_id].append(issue)
+
+    for chunk_id, item in enumerate(pending):
+        review = {
+            "issues_found": len(issues_by_chunk[chunk_id]),
+            "issues": issues_by_chunk[chunk_id],
+            "absolute_line_numbers": True
+        }
+        # Cached with chunk-relative lines so the entry stays valid if the chunk moves
+        if use_cache:
+            review_cache.store(cache_keys[chunk_id], _shift_line_numbers(review, 1 - item[2]))
+        reviews[item[0]] = review
+    return reviews
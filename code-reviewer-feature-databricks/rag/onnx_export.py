@@ -0,0 +1,149 @@
+import argparse
+import glob
+import numpy as np
+import psycopg2
+import sys
+import os
+
+# Add project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDING_CONFIG
+from rag.embedder import OnnxBackend, SentenceTransformerBackend, model_path
+from rag.vector_search import normalize_rows
+from utils.chunker import chunk_pyspark_file
+from utils.line_mapper import iter_sql_file
+
+
+def export_onnx(output_dir=None, opset=14):
+    """Exports the sentence transformer's encoder to ONNX and quantizes its weights to int8.
+
+    Writes model.onnx (float32), model_int8.onnx and tokenizer.json to `output_dir`, the
+    layout OnnxBackend loads. Needs torch, sentence_transformers and onnxruntime.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output_dir = output_dir or EMBEDDING_CONFIG['onnx_model_dir']
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"Loading {model_path}...")
+    sentence_model = SentenceTransformerBackend(model_path).model
+    transformer = sentence_model[0].auto_model.eval()
+    sentence_model.tokenizer.save_pretrained(output_dir)
+
+    class Encoder(torch.nn.Module):
+        """Returns only the token embeddings, which the backend pools itself."""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+    sample = sentence_model.tokenizer(["SELECT id FROM orders WHERE status = 'open'"], return_tensors='pt')
+    input_names = ['input_ids', 'attention_mask', 'token_type_ids']
+    fp32_path = os.path.join(output_dir, 'model.onnx')
+    int8_path = os.path.join(output_dir, 'model_int8.onnx')
+
+    print(f"Exporting the encoder to {fp32_path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(transformer),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']},
+            opset_version=opset,
+        )
+
+    print(f"Quantizing the weights to int8 in {int8_path}...")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print("Export completed successfully.")
+    return int8_path
+
+
+def check_parity(texts, reference_texts=None, top_k=3, batch_size=None):
+    """Compares the int8 ONNX backend against the PyTorch model on the same texts.
+
+    `reference_texts` play the part of the stored rules (the texts themselves by default).
+    The realistic case is scored: int8 query vectors against float32 rule vectors.
+    Returns a dict with the per-text cosine between both backends' vectors, the absolute
+    differences in query-rule cosine scores, and how often the top_k rules agree.
+    """
+    batch_size = batch_size or EMBEDDING_CONFIG['batch_size']
+    reference_texts = reference_texts or texts
+
+    reference = SentenceTransformerBackend(model_path)
+    quantized = OnnxBackend(EMBEDDING_CONFIG['onnx_model_dir'])
+    queries_fp32 = normalize_rows(reference.encode(texts, batch_size))
+    queries_int8 = normalize_rows(quantized.encode(texts, batch_size))
+    rules_fp32 = normalize_rows(reference.encode(reference_texts, batch_size))
+
+    self_cosine = (queries_fp32 * queries_int8).sum(axis=1)
+    expected = queries_fp32 @ rules_fp32.T
+    actual = queries_int8 @ rules_fp32.T
+    score_diff = np.abs(expected - actual)
+
+    k = min(top_k, len(reference_texts))
+    expected_top = np.argsort(-expected, axis=1)[:, :k]
+    actual_top = np.argsort(-actual, axis=1)[:, :k]
+    agreement = np.mean([len(np.intersect1d(e, a)) / k for e, a in zip(expected_top, actual_top)])
+
+    return {
+        "texts": len(texts),
+        "reference_texts": len(reference_texts),
+        "min_vector_cosine": float(self_cosine.min()),
+        "mean_vector_cosine": float(self_cosine.mean()),
+        "max_score_diff": float(score_diff.max()),
+        "mean_score_diff": float(score_diff.mean()),
+        f"top{k}_agreement": float(agreement),
+    }
+
+
+def _sample_chunks(paths):
+    """Collects the chunks of the given SQL and PySpark files as parity check texts."""
+    texts = []
+    for path in paths:
+        if path.endswith('.sql'):
+            texts.extend(chunk for chunk, _ in iter_sql_file(path))
+        elif path.endswith('.py'):
+            with open(path, 'r') as f:
+                texts.extend(chunk for chunk, _ in chunk_pyspark_file(f.read()))
+    return [text.strip() for text in texts if text.strip()]
+
+
+def _rule_texts():
+    """Returns the embedded text of every rule, or None if the database is unavailable."""
+    from database.rule_store import get_rule_store
+    from rag.vectorize_rules import rule_text
+
+    try:
+        rows = get_rule_store().fetch_vectorization_state()
+    except psycopg2.Error as e:
+        print(f"Could not load the rules, comparing the chunks against each other: {e}")
+        return None
+    return [rule_text(title, category, description) for _, title, description, category, _, _ in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export an int8 ONNX embedding model and check it against PyTorch.')
+    parser.add_argument('command', choices=['export', 'check'])
+    parser.add_argument('paths', nargs='*', help='Files whose chunks are used by the parity check (default: test_files).')
+    parser.add_argument('--output-dir', type=str, default=None, help='Where to write the ONNX model (export).')
+    parser.add_argument('--min-cosine', type=float, default=0.98, help='Fail the check if any vector is less similar than this.')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_onnx(args.output_dir)
+    else:
+        paths = args.paths or sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test_files', '*')))
+        report = check_parity(_sample_chunks(paths), _rule_texts())
+        for key, value in report.items():
+            print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+        if report['min_vector_cosine'] < args.min_cosine:
+            print(f"Parity check failed: minimum cosine {report['min_vector_cosine']:.4f} is below {args.min_cosine}.")
+            sys.exit(1)
+        print("Parity check passed.")
@@ -0,0 +1,106 @@
+import contextvars
+import sys
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Add project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import LLM_CONFIG, EMBEDDING_CONFIG
+from rag.retriever import find_relevant_rules_for_chunks
+
+
+def review_chunks(chunks, language, batch_size=None, encode_pool=None, max_concurrency=None, retrieval_window=None, pack=False, on_result=None, on_issue=None, use_cache=True, stream=None):
+    """Retrieves rules and generates reviews for all chunks with bounded LLM concurrency.
+
+    Chunks are retrieved in windows of `retrieval_window`; each window's LLM calls are
+    submitted to a thread pool as soon as its retrieval finishes, so retrieval for later
+    windows overlaps with the reviews still in flight. At most `max_concurrency` reviews
+    run at once and at most twice that many wait in the queue.
+
+    With `pack`, small chunks in a window that share the same rules are reviewed together
+    in one prompt (see generator.pack_chunks).
+
+    Returns one (relevant_rules, retrieval_method, review) tuple per chunk, in chunk order,
+    regardless of the order in which the LLM calls complete. If `on_result(index, result)`
+    is given instead, it is called from this thread with each chunk's tuple as soon as its
+    review completes, while later windows are still being retrieved, and nothing is kept
+    or returned. When the LLM responses are streamed, `on_issue(index, issue,
+    absolute_line_numbers)` is called from the review threads for each issue as it
+    arrives, before its chunk's result. `use_cache` and `stream` are passed on to
+    generate_review.
+    """
+    from rag.generator import generate_review, generate_packed_review, pack_chunks, size_session
+
+    if max_concurrency is None:
+        max_concurrency = LLM_CONFIG['max_concurrency']
+    if retrieval_window is None:
+        retrieval_window = batch_size or EMBEDDING_CONFIG['batch_size']
+    max_concurrency = max(1, max_concurrency)
+    size_session(max_concurrency)
+
+    retrievals_by_index = {}
+    results = [None] * len(chunks) if on_result is None else None
+    # future -> (chunk indices, packed); dropped as soon as the future is collected
+    in_flight = {}
+
+    def collect(future):
+        indices, packed = in_flight.pop(future)
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Review failed for chunk(s) starting at line {chunks[indices[0]][1]}: {e}")
+            result = None
+        for index in indices:
+            if packed:
+                review_result = result.get(index) if result is not None else None
+            else:
+                review_result = result
+            chunk_result = retrievals_by_index.pop(index) + (review_result,)
+            if on_result is not None:
+                on_result(index, chunk_result)
+            else:
+                results[index] = chunk_result
+
+    def collect_done(block=False):
+        """Collects the finished reviews; with `block`, first waits for at least one."""
+        if block and in_flight:
+            wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in [future for future in in_flight if future.done()]:
+            collect(future)
+
+    def review(index, code_chunk, relevant_rules, retrieval_method):
+        chunk_on_issue = (lambda issue: on_issue(index, issue, False)) if on_issue is not None else None
+        return generate_review(code_chunk, relevant_rules, retrieval_method, chunk_on_issue, use_cache, stream)
+
+    # Reviews run in a copy of the caller's context, so they count towards its metrics scope
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for window_start in range(0, len(chunks), retrieval_window):
+            window = chunks[window_start:window_start + retrieval_window]
+            retrievals = find_relevant_rules_for_chunks(window, language=language, batch_size=batch_size, use_pool=encode_pool)
+
+            items = []
+            for offset, ((code_chunk, start_line), (relevant_rules, retrieval_method)) in enumerate(zip(window, retrievals)):
+                index = window_start + offset
+                print(f"\nProcessing chunk (lines {start_line}-{start_line + code_chunk.count('\n')}) with: {retrieval_method}")
+                retrievals_by_index[index] = (relevant_rules, retrieval_method)
+                items.append((index, code_chunk, start_line, relevant_rules, retrieval_method))
+
+            packs = pack_chunks(items) if pack else [[item] for item in items]
+            for pack_items in packs:
+                collect_done()
+                # Backpressure: retrieval stops running ahead once enough reviews are queued
+                while len(in_flight) >= max_concurrency * 2:
+                    collect_done(block=True)
+                if len(pack_items) == 1:
+                    index, code_chunk, _, relevant_rules, retrieval_method = pack_items[0]
+                    in_flight[executor.submit(contextvars.copy_context().run, review, index, code_chunk, relevant_rules, retrieval_method)] = ([index], False)
+                else:
+                    print(f"Packing {len(pack_items)} chunks into one prompt.")
+                    in_flight[executor.submit(contextvars.copy_context().run, generate_packed_review, pack_items, on_issue, use_cache, stream)] = ([item[0] for item in pack_items], True)
+            collect_done()
+
+        while in_flight:
+            collect_done(block=True)
+
+    return results
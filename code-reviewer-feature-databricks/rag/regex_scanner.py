@@ -0,0 +1,126 @@
+import re
+import sys
+import os
+from bisect import bisect_right
+
+# Add project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.line_mapper import build_line_index, offset_to_line
+
+
+# Leading global inline flags, e.g. the "(?i)" used by several rules in insert_rules.sql
+_GLOBAL_FLAGS = re.compile(r'^\(\?([aiLmsux]+)\)')
+# Backreferences and named groups break once patterns are renumbered inside one alternation.
+# Anchors and lookarounds see the neighbouring chunks of the joined text, so a pattern using
+# them can match a chunk on its own but not inside the combined scan (or the other way round).
+# A "^" right after "[" only negates a character class and is fine.
+_NOT_COMBINABLE = re.compile(r'\\[1-9]|\(\?P[<=]|\\[AZz]|(?<!\[)\^|\$|\(\?<?[=!]')
+
+
+def _scoped(pattern):
+    """Rewrites leading global inline flags into a scoped group so the pattern can be embedded."""
+    match = _GLOBAL_FLAGS.match(pattern)
+    if match:
+        return f"(?{match.group(1)}:{pattern[match.end():]})"
+    return pattern
+
+
+def build_scanner(bad_patterns):
+    """Combines the compiled bad-practice patterns for a language into a single scanner.
+
+    Every pattern becomes a zero-width lookahead alternative `(?=(?P<rN>...))`, so one
+    pass of finditer over the text visits every offset where at least one rule matches.
+    Patterns that cannot be safely combined (backreferences, named groups, anchors and
+    lookarounds) are kept aside and searched individually, chunk by chunk.
+    """
+    combined_rules = []
+    alternatives = []
+    standalone_rules = []
+
+    for pattern, rule in bad_patterns:
+        if _NOT_COMBINABLE.search(pattern.pattern):
+            standalone_rules.append((pattern, rule))
+            continue
+        alternative = f"(?=(?P<r{len(combined_rules)}>{_scoped(pattern.pattern)}))"
+        try:
+            re.compile(alternative)
+        except re.error:
+            standalone_rules.append((pattern, rule))
+            continue
+        combined_rules.append((pattern, rule))
+        alternatives.append(alternative)
+
+    combined = None
+    if alternatives:
+        # Without anchors or lookarounds a pattern that matches a chunk also matches at the same
+        # offset of the joined text, so the combined scan finds a superset of the per-chunk
+        # matches; hits are confirmed against the chunk alone in scan_chunks.
+        combined = re.compile("|".join(alternatives), re.IGNORECASE)
+
+    return {
+        'combined': combined,
+        'combined_rules': combined_rules,
+        'standalone_rules': standalone_rules,
+    }
+
+
+def scan_chunks(scanner, chunks):
+    """Scans all chunks in one pass and returns the matched bad-practice rules for each chunk.
+
+    `chunks` is a list of (code_chunk, start_line) tuples as produced by the line mapper or
+    the chunker. The result has one list per chunk, in rule order, where every matched rule
+    carries a `match_line` with the absolute file line of its first hit.
+    """
+    texts = [code_chunk for code_chunk, _ in chunks]
+    joined = "\n".join(texts)
+    line_index = build_line_index(joined)
+
+    chunk_offsets = []
+    offset = 0
+    for text in texts:
+        chunk_offsets.append(offset)
+        offset += len(text) + 1
+
+    first_hits = [{} for _ in chunks]
+    combined_rules = scanner['combined_rules']
+
+    if scanner['combined'] is not None:
+        for match in scanner['combined'].finditer(joined):
+            position = match.start()
+            chunk_index = bisect_right(chunk_offsets, position) - 1
+            text = texts[chunk_index]
+            local = position - chunk_offsets[chunk_index]
+            hits = first_hits[chunk_index]
+            if len(hits) == len(combined_rules) or local > len(text):
+                continue
+
+            # Earlier alternatives already failed here; confirm the rest against the chunk alone.
+            for rule_index in range(int(match.lastgroup[1:]), len(combined_rules)):
+                if rule_index in hits:
+                    continue
+                if combined_rules[rule_index][0].match(text, local):
+                    hits[rule_index] = position
+
+    matched = []
+    for chunk_index, (text, start_line) in enumerate(chunks):
+        chunk_first_line = offset_to_line(line_index, chunk_offsets[chunk_index])
+        chunk_matches = []
+        for rule_index, (_, rule) in enumerate(combined_rules):
+            position = first_hits[chunk_index].get(rule_index)
+            if position is None:
+                continue
+            rule_match = dict(rule)
+            rule_match['match_line'] = start_line + offset_to_line(line_index, position) - chunk_first_line
+            chunk_matches.append(rule_match)
+
+        for pattern, rule in scanner['standalone_rules']:
+            match = pattern.search(text)
+            if match:
+                rule_match = dict(rule)
+                rule_match['match_line'] = start_line + text.count('\n', 0, match.start())
+                chunk_matches.append(rule_match)
+
+        matched.append(chunk_matches)
+
+    return matched
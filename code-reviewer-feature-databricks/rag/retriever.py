@@ -1,55 +1,84 @@
 import psycopg2
-import numpy as np
-from sentence_transformers import SentenceTransformer
 import sys
 import os
 
 # Add project root to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import DB_CONFIG
-
-
-model_path = r'C:\Users\AshishAdhikari\Documents\models--sentence-transformers--all-MiniLM-L6-v2\models--sentence-transformers--all-MiniLM-L6-v2'
-
-# Initialize the sentence transformer model using the local path
-print("Loading sentence transformer model from local cache...")
-try:
-    model = SentenceTransformer(model_path)
-    print("Model loaded successfully.")
-except Exception as e:
-    print(f"An error occurred while loading the model: {e}")
-    model = None  # Safeguard for failed loading
-
-# Use an assertion to ensure the model is correctly loaded before using it
-assert model is not None, "Model failed to load, ensure the correct path and files exist."
+from database.rule_store import get_rule_store
+from rag.embedder import embed_chunks
+from rag.rule_cache import get_rules
+from rag.regex_scanner import scan_chunks
+from rag.ann_index import search_batch
+from rag.vector_search import top_k_similar_batch
+from utils import metrics
+
+def _split_by_practice_type(top_rules, relevant_rules):
+    """Files the selected rules under good or bad practices."""
+    for rule in top_rules:
+        if rule['practice_type'] == 'bad':
+            relevant_rules['bad_practices'].append(dict(rule))
+        else:
+            relevant_rules['good_practices'].append(dict(rule))
+    return relevant_rules
+
+def _nearest_rules(rules, language, embeddings, top_k, similarity_threshold):
+    """Returns the list of most similar rules for each embedding.
+
+    The search runs in Postgres with pgvector, through the IVF index for large catalogs,
+    or as an exact matrix product otherwise.
+    """
+    with metrics.timer('similarity'):
+        if rules['server_side']:
+            return [
+                [
+                    {'id': rule_id, 'title': title, 'description': description,
+                     'severity': severity, 'practice_type': practice_type, 'category': category}
+                    for rule_id, title, description, severity, practice_type, category, _ in rows
+                ]
+                for rows in get_rule_store().nearest_rules(language, embeddings, top_k, similarity_threshold)
+            ]
+        if rules['ann_index'] is not None:
+            matches = search_batch(rules['ann_index'], rules['vectors'], embeddings, top_k, similarity_threshold)
+        else:
+            matches = top_k_similar_batch(rules['vectors'], embeddings, top_k, similarity_threshold)
+        return [[rules['vector_rules'][i] for i in indices] for indices, _ in matches]
+
+def scan_bad_practices(chunks, language='SQL'):
+    """Runs every bad-practice pattern over all chunks in a single pass.
+
+    Returns one list of matched rules per chunk, or None if the rules could not be loaded.
+    There is no fallback then: find_relevant_rules_for_chunks gives every chunk the "Error"
+    retrieval method, and --fast runs mark the statements as not reviewed.
+    """
+    try:
+        rules = get_rules(language)
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return None
+    print(f"Scanning {len(chunks)} chunks against {len(rules['bad_patterns'])} bad-practice patterns...")
+    with metrics.timer('regex'):
+        return scan_chunks(rules['scanner'], chunks)
 
-import re
+def find_relevant_rules(code_chunk, language='SQL', top_k=3, similarity_threshold=0.55, regex_matches=None, code_embedding=None):
+    """Finds the most relevant rules for a code chunk using vector similarity search.
 
-def find_relevant_rules(code_chunk, language='SQL', top_k=3, similarity_threshold=0.55):
-    """Finds the most relevant rules for a code chunk using vector similarity search."""
-    conn = None
+    If `regex_matches` is given (from scan_bad_practices), the regex stage is skipped and
+    those matches are used instead. A precomputed `code_embedding` skips the encode step.
+    """
     relevant_rules = {'good_practices': [], 'bad_practices': []}
 
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
+        # Rules, compiled patterns and the vector matrix are loaded once per language
+        rules = get_rules(language)
 
         # 1. Hybrid Approach: First, try to find direct violations with regex
-        print(f"\nRunning regex search for bad practices...\n---\n{code_chunk[:200]}...\n---")
-        cur.execute(
-            "SELECT id, title, description, code_pattern, severity, practice_type, category FROM rules WHERE language = %s AND practice_type = 'bad' AND code_pattern IS NOT NULL;",
-            (language,)
-        )
-        bad_practice_rules = cur.fetchall()
-
-        matched_bad_rules = []
-        for rule_id, title, description, code_pattern, severity, _, category in bad_practice_rules:
-            if re.search(code_pattern, code_chunk, re.IGNORECASE):
-                matched_bad_rules.append({
-                    'id': rule_id, 'title': title, 'description': description, 
-                    'severity': severity, 'practice_type': 'bad', 'category': category
-                })
+        if regex_matches is not None:
+            matched_bad_rules = regex_matches
+        else:
+            print(f"\nRunning regex search for bad practices...\n---\n{code_chunk[:200]}...\n---")
+            with metrics.timer('regex'):
+                matched_bad_rules = scan_chunks(rules['scanner'], [(code_chunk, 1)])[0]
 
         # If any regex matches were found, we can return them without falling back to vector search.
         if matched_bad_rules:
@@ -59,38 +88,17 @@ def find_relevant_rules(code_chunk, language='SQL', top_k=3, similarity_threshol
 
         # 2. If no regex match, fall back to vector search for semantic relevance
         print("No direct violations found. Falling back to vector similarity search...")
-        code_embedding = model.encode(code_chunk, convert_to_tensor=False)
-        cur.execute(
-            "SELECT id, title, description, severity, practice_type, category, vector FROM rules WHERE language = %s AND vector IS NOT NULL;",
-            (language,)
-        )
-        rules_data = cur.fetchall()
-        
-        if not rules_data:
+        if not rules['vector_rules']:
             print("No vectorized rules found.")
             return relevant_rules, "Vector Search"
 
-        rule_similarities = []
-        for rule in rules_data:
-            rule_id, title, description, severity, practice_type, category, vector = rule
-            if vector:
-                similarity = np.dot(code_embedding, np.array(vector)) / (np.linalg.norm(code_embedding) * np.linalg.norm(np.array(vector)))
-                if similarity > similarity_threshold:
-                    rule_similarities.append((similarity, {
-                        'id': rule_id, 'title': title, 'description': description,
-                        'severity': severity, 'practice_type': practice_type, 'category': category
-                    }))
-
-        rule_similarities.sort(key=lambda x: x[0], reverse=True)
-        top_rules = [rule for _, rule in rule_similarities[:top_k]]
+        if code_embedding is None:
+            code_embedding = embed_chunks([code_chunk])[0]
+        top_rules = _nearest_rules(rules, language, [code_embedding], top_k, similarity_threshold)[0]
 
         print(f"Found {len(top_rules)} semantically relevant rules with similarity > {similarity_threshold}.")
 
-        for rule in top_rules:
-            if rule['practice_type'] == 'bad':
-                relevant_rules['bad_practices'].append(rule)
-            else:
-                relevant_rules['good_practices'].append(rule)
+        _split_by_practice_type(top_rules, relevant_rules)
 
         return relevant_rules, "Vector Search"
 
@@ -100,6 +108,60 @@ def find_relevant_rules(code_chunk, language='SQL', top_k=3, similarity_threshol
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return relevant_rules, "Error"
-    finally:
-        if conn is not None:
-            conn.close()
+
+def find_relevant_rules_batch(embeddings, language='SQL', top_k=3, similarity_threshold=0.55):
+    """Runs the vector search for a batch of chunk embeddings in one matrix-matrix product.
+
+    Large rule catalogs go through the IVF index built by the rule cache instead, and with
+    pgvector the whole batch is searched in Postgres in one query.
+    Returns one relevant_rules dict per embedding, in the same order.
+    """
+    rules = get_rules(language)
+    results = []
+    for top_rules in _nearest_rules(rules, language, embeddings, top_k, similarity_threshold):
+        relevant_rules = {'good_practices': [], 'bad_practices': []}
+        results.append(_split_by_practice_type(top_rules, relevant_rules))
+    return results
+
+def find_relevant_rules_for_chunks(chunks, language='SQL', top_k=3, similarity_threshold=0.55, batch_size=None, use_pool=None):
+    """Retrieves rules for every chunk of a file at once.
+
+    Bad-practice patterns are scanned over the whole file in one pass, the chunks without a
+    regex hit are embedded in one batched encode, and their vector search is one matrix
+    product. Returns a (relevant_rules, retrieval_method) tuple per chunk, in order.
+    """
+    regex_matches = scan_bad_practices(chunks, language=language)
+    if regex_matches is None:
+        return [({'good_practices': [], 'bad_practices': []}, "Error") for _ in chunks]
+
+    results = [None] * len(chunks)
+    vector_indices = []
+    for index, matched_bad_rules in enumerate(regex_matches):
+        if matched_bad_rules:
+            results[index] = ({'good_practices': [], 'bad_practices': matched_bad_rules}, "Regex Match")
+        else:
+            vector_indices.append(index)
+
+    print(f"{len(chunks) - len(vector_indices)} chunk(s) matched via regex, {len(vector_indices)} need vector search.")
+    if not vector_indices:
+        return results
+
+    try:
+        if not get_rules(language)['vector_rules']:
+            print("No vectorized rules found.")
+            return [result or ({'good_practices': [], 'bad_practices': []}, "Vector Search") for result in results]
+        embeddings = embed_chunks([chunks[i][0] for i in vector_indices], batch_size=batch_size, use_pool=use_pool)
+        vector_results = find_relevant_rules_batch(embeddings, language, top_k, similarity_threshold)
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        vector_results = None
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        vector_results = None
+
+    for position, index in enumerate(vector_indices):
+        if vector_results is None:
+            results[index] = ({'good_practices': [], 'bad_practices': []}, "Error")
+        else:
+            results[index] = (vector_results[position], "Vector Search")
+    return results
@@ -0,0 +1,78 @@
+import json
+import sys
+import os
+import threading
+
+# Add project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import REVIEW_CACHE_CONFIG
+from utils.fingerprint import chunk_fingerprint
+from utils import metrics
+from utils.sqlite_cache import SQLiteCache
+
+
+_cache = None
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+_inherited_caches = []
+
+
+def _get_cache():
+    """Opens the on-disk cache on first use."""
+    global _cache
+    if _cache is None:
+        _cache = SQLiteCache(REVIEW_CACHE_CONFIG['path'], REVIEW_CACHE_CONFIG['max_entries'])
+    return _cache
+
+
+def review_key(code_chunk, rules, retrieval_method, prompt_version, model_name):
+    """Builds the cache key for a review from everything that can change the LLM's answer.
+
+    The chunk's line breaks are kept in the key because cached issues carry line numbers
+    relative to the chunk, which a reflowed chunk would shift.
+    """
+    rule_ids = sorted(
+        str(rule['id'])
+        for rule in rules.get('bad_practices', []) + rules.get('good_practices', [])
+    )
+    return chunk_fingerprint(code_chunk, 'review', ",".join(rule_ids), retrieval_method, prompt_version, model_name, keep_lines=True)
+
+
+def lookup(key):
+    """Returns the cached review for a key, or None."""
+    if not REVIEW_CACHE_CONFIG['enabled']:
+        return None
+    value = _get_cache().get(key)
+    with _stats_lock:
+        _stats['hits' if value is not None else 'misses'] += 1
+    metrics.increment('review_cache_total', result='hit' if value is not None else 'miss')
+    return json.loads(value) if value is not None else None
+
+
+def store(key, review):
+    """Saves a parsed review under its key."""
+    if not REVIEW_CACHE_CONFIG['enabled'] or review is None:
+        return
+    _get_cache().put(key, json.dumps(review))
+
+
+def purge():
+    """Removes every cached review."""
+    _get_cache().clear()
+    print(f"Review cache at {REVIEW_CACHE_CONFIG['path']} purged.")
+
+
+def get_stats():
+    """Returns a copy of the hit/miss counters for this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_after_fork():
+    """Sets the inherited SQLite connection aside; a forked child opens its own on first use."""
+    global _cache, _stats_lock
+    if _cache is not None:
+        _inherited_caches.append(_cache)
+    _cache = None
+    _stats_lock = threading.Lock()
@@ -0,0 +1,131 @@
+import json
+
+
+class ReviewStreamParser:
+    """Parses a streamed review response incrementally, as its text arrives in pieces.
+
+    The response is expected to hold one JSON object of the form
+    {"issues_found": <number>, "issues": [...]}, possibly after some preamble. Each issue
+    object is decoded as soon as its closing brace arrives. `done` becomes True once the
+    answer is known: `issues_found` is 0, the `issues` array is closed, or the object is.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.issues = []
+        self.done = False
+        self.empty = False
+        self.issues_closed = False
+        self._pos = 0
+        self._started = False
+        self._containers = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._expect_key = False
+        self._key = None
+        self._value_start = None
+        self._in_issues = False
+        self._issue_start = None
+
+    def feed(self, text):
+        """Adds the next piece of the response. Returns the issues completed by it."""
+        self.text += text
+        completed = []
+        while self._pos < len(self.text) and not self.done:
+            char = self.text[self._pos]
+            if not self._started:
+                if char == '{':
+                    self._started = True
+                    self._open('{')
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string()
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif char in '{[':
+                self._open(char)
+            elif char in '}]':
+                issue = self._close()
+                if issue is not None:
+                    completed.append(issue)
+            elif len(self._containers) == 1:
+                if char == ':':
+                    self._value_start = self._pos + 1
+                elif char == ',':
+                    self._end_value()
+                    self._expect_key = True
+            self._pos += 1
+        self.issues.extend(completed)
+        return completed
+
+    def _open(self, char):
+        depth = len(self._containers)
+        self._containers.append(char)
+        if depth == 0:
+            self._expect_key = True
+        elif depth == 1 and char == '[' and self._key == 'issues':
+            self._in_issues = True
+        elif depth == 2 and char == '{' and self._in_issues:
+            self._issue_start = self._pos
+
+    def _close(self):
+        """Closes the innermost container, returning an issue if one just ended."""
+        if not self._containers:
+            return None
+        self._containers.pop()
+        depth = len(self._containers)
+        if depth == 0:
+            self._end_value()
+            self.done = True
+        elif depth == 1 and self._in_issues:
+            self._in_issues = False
+            self.issues_closed = True
+            # Every issue is known; whatever follows the array adds nothing to the review
+            self.done = True
+        elif depth == 2 and self._in_issues and self._issue_start is not None:
+            issue_text = self.text[self._issue_start:self._pos + 1]
+            self._issue_start = None
+            try:
+                issue = json.loads(issue_text)
+            except ValueError:
+                print(f"Skipping an issue that is not valid JSON: {issue_text}")
+                return None
+            return issue if isinstance(issue, dict) else None
+        return None
+
+    def _end_string(self):
+        """Takes a string that just closed at the top level as the next key, if one is expected."""
+        if len(self._containers) == 1 and self._expect_key:
+            try:
+                self._key = json.loads(self.text[self._string_start:self._pos + 1])
+            except ValueError:
+                self._key = None
+            self._expect_key = False
+            self._value_start = None
+
+    def _end_value(self):
+        """Looks at a finished top-level scalar value; issues_found of 0 means an empty review."""
+        if self._key == 'issues_found' and self._value_start is not None:
+            try:
+                issues_found = int(self.text[self._value_start:self._pos].strip())
+            except ValueError:
+                issues_found = None
+            if issues_found == 0 and not self.issues:
+                self.empty = True
+                self.done = True
+        self._value_start = None
+
+    def result(self):
+        """Returns the review parsed so far, or None if the answer never became known."""
+        if self.empty:
+            return {"issues_found": 0, "issues": []}
+        if self.done:
+            return {"issues_found": len(self.issues), "issues": list(self.issues)}
+        return None
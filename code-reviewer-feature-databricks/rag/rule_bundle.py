@@ -0,0 +1,222 @@
+import argparse
+import json
+import re
+import shutil
+import sys
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Add project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDING_CONFIG, PGVECTOR_CONFIG, RULE_BUNDLE_CONFIG
+from rag.vector_search import normalize_rows
+
+
+# Bumped whenever the on-disk layout changes so old bundles are ignored
+BUNDLE_FORMAT = 1
+# Names the directory of the bundle version in use, replaced atomically by each export
+CURRENT_FILE = 'CURRENT'
+
+RULE_COLUMNS = ('id', 'title', 'description', 'severity', 'practice_type', 'category')
+PATTERN_COLUMNS = ('id', 'title', 'description', 'code_pattern', 'severity', 'practice_type', 'category')
+
+
+def _file_prefix(language):
+    """Returns the file name prefix of a language's bundle files."""
+    return re.sub(r'[^a-z0-9]+', '_', language.lower())
+
+
+def _encode_version(version):
+    """Makes a (max last_updated_utc, row count) version JSON serializable."""
+    last_updated, count = version
+    return [last_updated.isoformat() if last_updated is not None else None, count]
+
+
+def _decode_version(version):
+    """Turns a stored version back into the value RuleStore.fetch_version returns."""
+    last_updated, count = version
+    return (datetime.fromisoformat(last_updated) if last_updated is not None else None, count)
+
+
+def _write_language(bundle_dir, language, rule_set):
+    """Writes the vector matrix, rule columns and pattern metadata of one language."""
+    version, bad_pattern_rows, vector_rows = rule_set
+    prefix = _file_prefix(language)
+
+    # Invalid patterns are dropped here rather than in every worker
+    patterns = []
+    for row in bad_pattern_rows:
+        try:
+            re.compile(row[3], re.IGNORECASE)
+        except re.error as e:
+            print(f"Skipping rule ID {row[0]}, invalid code_pattern {row[3]!r}: {e}")
+            continue
+        patterns.append(list(row))
+
+    vector_rows = [row for row in vector_rows if row[6]]
+    # Stored normalized and C-contiguous, so workers map it and use it without a copy
+    matrix = normalize_rows([row[6] for row in vector_rows]) if vector_rows else np.empty((0, 0), dtype=np.float32)
+    np.save(os.path.join(bundle_dir, f"{prefix}.vectors.npy"), np.ascontiguousarray(matrix, dtype=np.float32))
+
+    with open(os.path.join(bundle_dir, f"{prefix}.rules.json"), 'w') as f:
+        json.dump({column: [row[i] for row in vector_rows] for i, column in enumerate(RULE_COLUMNS)}, f)
+    with open(os.path.join(bundle_dir, f"{prefix}.patterns.json"), 'w') as f:
+        json.dump({'columns': PATTERN_COLUMNS, 'rows': patterns}, f)
+
+    return {
+        'version': _encode_version(version),
+        'prefix': prefix,
+        'regex_rules': len(patterns),
+        'vector_rules': len(vector_rows),
+        'dimensions': int(matrix.shape[1]) if matrix.size else 0,
+    }
+
+
+def export_bundle(path=None, languages=None):
+    """Snapshots the rules table into a new bundle version and makes it the current one.
+
+    Returns the directory of the new version, or None when there is nothing to export.
+    """
+    from database.rule_store import get_rule_store
+
+    if PGVECTOR_CONFIG['enabled']:
+        print("The rule vectors are searched in Postgres with pgvector, so there is no bundle to export.")
+        return None
+
+    path = path or RULE_BUNDLE_CONFIG['path']
+    store = get_rule_store()
+    languages = languages or store.fetch_languages()
+    if not languages:
+        print("No rules found to export.")
+        return None
+
+    os.makedirs(path, exist_ok=True)
+    name = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+    suffix = 1
+    while os.path.exists(os.path.join(path, name if suffix == 1 else f"{name}-{suffix}")):
+        suffix += 1
+    name = name if suffix == 1 else f"{name}-{suffix}"
+
+    # Written under a temporary name so a half-written version is never picked up
+    tmp_dir = os.path.join(path, f".tmp-{name}")
+    os.makedirs(tmp_dir)
+    try:
+        manifest = {
+            'format': BUNDLE_FORMAT,
+            'created_utc': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S'),
+            'embedding_model': EMBEDDING_CONFIG['model_path'],
+            'languages': {},
+        }
+        for language in languages:
+            manifest['languages'][language] = _write_language(tmp_dir, language, store.fetch_rule_set(language))
+            info = manifest['languages'][language]
+            print(f"Exported {info['regex_rules']} regex rules and {info['vector_rules']} vectorized rules for {language}.")
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.rename(tmp_dir, os.path.join(path, name))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    current_tmp = os.path.join(path, f".{CURRENT_FILE}.tmp")
+    with open(current_tmp, 'w') as f:
+        f.write(name + "\n")
+    os.replace(current_tmp, os.path.join(path, CURRENT_FILE))
+    _prune(path, RULE_BUNDLE_CONFIG['keep_versions'])
+
+    print(f"Rule bundle {name} written to {path}")
+    return os.path.join(path, name)
+
+
+def _prune(path, keep):
+    """Deletes all but the newest `keep` bundle versions."""
+    versions = sorted((entry for entry in os.listdir(path)
+                       if not entry.startswith('.') and os.path.isdir(os.path.join(path, entry))),
+                      key=lambda entry: os.path.getmtime(os.path.join(path, entry)))
+    for name in versions[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def current_bundle(path=None):
+    """Returns (directory, manifest) of the current bundle version, or None if there is none usable."""
+    path = path or RULE_BUNDLE_CONFIG['path']
+    try:
+        with open(os.path.join(path, CURRENT_FILE), 'r') as f:
+            bundle_dir = os.path.join(path, f.read().strip())
+        with open(os.path.join(bundle_dir, 'manifest.json'), 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Could not read the rule bundle in {path}, using the database: {e}")
+        return None
+
+    if manifest.get('format') != BUNDLE_FORMAT:
+        print(f"Ignoring the rule bundle in {bundle_dir}, it was written in an older format.")
+        return None
+    if manifest.get('embedding_model') != EMBEDDING_CONFIG['model_path']:
+        print(f"Ignoring the rule bundle in {bundle_dir}, its vectors come from {manifest.get('embedding_model')}.")
+        return None
+    return bundle_dir, manifest
+
+
+def load_rule_set(language, path=None):
+    """Loads a language's rules from the current bundle.
+
+    Returns (version, bad_pattern_rows, vector_rows, matrix) with rows shaped like those of
+    RuleStore.fetch_rule_set, except that the vectors are None and come instead as the
+    read-only memory-mapped `matrix`. Returns None when the bundle does not have the language.
+    """
+    bundle = current_bundle(path)
+    if bundle is None:
+        return None
+    bundle_dir, manifest = bundle
+    info = manifest['languages'].get(language)
+    if info is None:
+        return None
+
+    prefix = os.path.join(bundle_dir, info['prefix'])
+    try:
+        # Every process mapping the file shares the same page cache pages
+        matrix = np.load(f"{prefix}.vectors.npy", mmap_mode='r') if info['vector_rules'] else np.empty((0, 0), dtype=np.float32)
+        with open(f"{prefix}.rules.json", 'r') as f:
+            columns = json.load(f)
+        with open(f"{prefix}.patterns.json", 'r') as f:
+            patterns = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not load {language} from the rule bundle, using the database: {e}")
+        return None
+
+    vector_rows = [row + (None,) for row in zip(*(columns[column] for column in RULE_COLUMNS))]
+    bad_pattern_rows = [tuple(row) for row in patterns['rows']]
+    return _decode_version(info['version']), bad_pattern_rows, vector_rows, matrix
+
+
+def print_info(path=None):
+    """Prints the current bundle version and what it holds."""
+    bundle = current_bundle(path)
+    if bundle is None:
+        print(f"No usable rule bundle in {path or RULE_BUNDLE_CONFIG['path']}.")
+        return
+    bundle_dir, manifest = bundle
+    print(f"Rule bundle {os.path.basename(bundle_dir)} (created {manifest['created_utc']} UTC, model {manifest['embedding_model']})")
+    for language, info in manifest['languages'].items():
+        print(f"  {language}: {info['regex_rules']} regex rules, {info['vector_rules']} vectorized rules "
+              f"({info['dimensions']} dimensions), rules version {info['version']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export the rules into a memory-mapped bundle that reviewers load without the database.')
+    parser.add_argument('command', choices=['export', 'info'])
+    parser.add_argument('--path', type=str, default=None, help=f"Bundle directory (default {RULE_BUNDLE_CONFIG['path']}).")
+    parser.add_argument('--languages', nargs='+', default=None, help='Languages to export (default: every language with rules).')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_bundle(args.path, args.languages)
+    else:
+        print_info(args.path)
@@ -0,0 +1,231 @@
+import psycopg2
+import numpy as np
+import re
+import select
+import sys
+import os
+import threading
+import time
+
+# Add project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import RULE_CACHE_CONFIG, ANN_CONFIG, PGVECTOR_CONFIG, RULE_BUNDLE_CONFIG
+from database.rule_store import get_rule_store, reset_after_fork as reset_store_after_fork
+from rag.ann_index import load_or_build_index
+from rag.regex_scanner import build_scanner
+from rag.rule_bundle import load_rule_set
+from rag.vector_search import normalize_rows
+from utils import metrics
+
+
+# One entry per language, loaded once and reused for every chunk of a run.
+_cache = {}
+_last_checked = {}
+# Languages whose entry was installed with pin_rules rather than loaded from the database
+_pinned = set()
+# Languages already offered to the bundle; later reloads go to the database
+_bundle_tried = set()
+_lock = threading.Lock()
+_listen_conn = None
+_inherited_connections = []
+
+
+def _connect_listener():
+    """Opens the LISTEN connection used to receive rule change notifications."""
+    global _listen_conn
+    if _listen_conn is not None or not RULE_CACHE_CONFIG.get('listen', True):
+        return _listen_conn
+    try:
+        _listen_conn = get_rule_store().listen(RULE_CACHE_CONFIG['notify_channel'])
+    except psycopg2.Error as e:
+        print(f"Could not listen for rule changes, relying on last_updated_utc checks: {e}")
+        RULE_CACHE_CONFIG['listen'] = False
+    return _listen_conn
+
+
+def _drain_notifications():
+    """Invalidates cached languages named in any pending NOTIFY payloads."""
+    global _listen_conn
+    conn = _connect_listener()
+    if conn is None:
+        return
+    try:
+        if select.select([conn], [], [], 0) == ([], [], []):
+            return
+        conn.poll()
+    except (psycopg2.Error, OSError) as e:
+        print(f"Lost rule change listener, will reconnect: {e}")
+        _listen_conn = None
+        _cache.clear()
+        return
+    while conn.notifies:
+        notify = conn.notifies.pop(0)
+        if notify.payload:
+            _cache.pop(notify.payload, None)
+        else:
+            # An empty payload (e.g. TRUNCATE) means every language may have changed.
+            _cache.clear()
+
+
+def build_entry(language, version, bad_pattern_rows, vector_rows, matrix=None):
+    """Builds a cache entry from rule rows, compiling patterns and stacking vectors once.
+
+    The rows have the shape returned by RuleStore.fetch_rule_set. A prebuilt normalized
+    `matrix` (e.g. memory-mapped from a rule bundle) is used as is, one row per vector row.
+    """
+    bad_patterns = []
+    for rule_id, title, description, code_pattern, severity, _, category in bad_pattern_rows:
+        try:
+            compiled = re.compile(code_pattern, re.IGNORECASE)
+        except re.error as e:
+            print(f"Skipping rule ID {rule_id}, invalid code_pattern {code_pattern!r}: {e}")
+            continue
+        bad_patterns.append((compiled, {
+            'id': rule_id, 'title': title, 'description': description,
+            'severity': severity, 'practice_type': 'bad', 'category': category
+        }))
+
+    # With pgvector the search runs in Postgres, so only the rule metadata is kept here
+    server_side = PGVECTOR_CONFIG['enabled']
+    prebuilt = matrix is not None
+    vector_rules = []
+    vectors = []
+    for rule_id, title, description, severity, practice_type, category, vector in vector_rows:
+        if not vector and not server_side and not prebuilt:
+            continue
+        vector_rules.append({
+            'id': rule_id, 'title': title, 'description': description,
+            'severity': severity, 'practice_type': practice_type, 'category': category
+        })
+        if not server_side and not prebuilt:
+            vectors.append(vector)
+
+    # Normalized once here so each similarity lookup is a single dot product
+    if not prebuilt:
+        matrix = normalize_rows(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+    # Large catalogs are searched through an IVF index instead of scoring every rule
+    ann_index = None
+    if not server_side and ANN_CONFIG.get('enabled', True) and len(vector_rules) >= ANN_CONFIG['min_rules']:
+        ann_index = load_or_build_index(language, matrix, [rule['id'] for rule in vector_rules])
+
+    print(f"Loaded {len(bad_patterns)} regex rules and {len(vector_rules)} vectorized rules for {language} into the rule cache.")
+    return {
+        'language': language,
+        'version': version,
+        'bad_patterns': bad_patterns,
+        'scanner': build_scanner(bad_patterns),
+        'vector_rules': vector_rules,
+        'vectors': matrix,
+        'ann_index': ann_index,
+        'server_side': server_side,
+    }
+
+
+def _load_entry(language):
+    """Loads all rules for a language from the database."""
+    with metrics.timer('db_fetch'):
+        rule_set = get_rule_store().fetch_rule_set(language)
+    metrics.increment('rule_cache_loads_total')
+    return build_entry(language, *rule_set)
+
+
+def _load_bundle_entry(language):
+    """Loads a language from the exported rule bundle, or returns None if it has none."""
+    if not RULE_BUNDLE_CONFIG.get('enabled', True) or PGVECTOR_CONFIG['enabled'] or language in _bundle_tried:
+        return None
+    _bundle_tried.add(language)
+    rule_set = load_rule_set(language)
+    if rule_set is None:
+        return None
+    version, bad_pattern_rows, vector_rows, matrix = rule_set
+    metrics.increment('rule_bundle_loads_total')
+    return build_entry(language, version, bad_pattern_rows, vector_rows, matrix=matrix)
+
+
+def pin_rules(entry):
+    """Installs a prebuilt entry for its language that is never refreshed from the database."""
+    with _lock:
+        _cache[entry['language']] = entry
+        _pinned.add(entry['language'])
+
+
+def get_rules(language):
+    """Returns the cached rule set for a language, reloading it only when the rules table has changed.
+
+    Changes are picked up from NOTIFY messages on the configured channel as soon as they
+    arrive, and otherwise by comparing MAX(last_updated_utc) and the row count at most
+    once every `check_interval_seconds`. The first load comes from the rule bundle when
+    one has been exported, without touching the database; it is then checked like any
+    other entry, and replaced from the database once the rules have changed.
+    """
+    with _lock:
+        if language in _pinned and language in _cache:
+            return _cache[language]
+
+        if language not in _cache:
+            entry = _load_bundle_entry(language)
+            if entry is not None:
+                _cache[language] = entry
+                _last_checked[language] = time.monotonic()
+                return entry
+
+        _drain_notifications()
+
+        entry = _cache.get(language)
+        now = time.monotonic()
+        interval = RULE_CACHE_CONFIG.get('check_interval_seconds', 30)
+        if entry is not None and now - _last_checked.get(language, 0) < interval:
+            return entry
+
+        try:
+            if entry is not None:
+                with metrics.timer('db_fetch'):
+                    version = get_rule_store().fetch_version(language)
+                if version == entry['version']:
+                    _last_checked[language] = now
+                    return entry
+            entry = _load_entry(language)
+        except psycopg2.Error as e:
+            if entry is None:
+                raise
+            print(f"Could not refresh the rule cache, using the cached rules: {e}")
+            _last_checked[language] = now
+            return entry
+
+        _cache[language] = entry
+        _last_checked[language] = now
+        return entry
+
+
+def loaded_languages():
+    """Returns the languages whose rules are currently cached."""
+    with _lock:
+        return sorted(_cache)
+
+
+def invalidate(language=None):
+    """Drops the cached rules for one language, or for every language when none is given."""
+    with _lock:
+        if language is None:
+            _cache.clear()
+            _last_checked.clear()
+            _pinned.clear()
+            _bundle_tried.clear()
+        else:
+            _cache.pop(language, None)
+            _last_checked.pop(language, None)
+            _pinned.discard(language)
+            _bundle_tried.discard(language)
+
+
+def reset_after_fork():
+    """Keeps the inherited rules but drops the parent's database connections in a forked child."""
+    global _listen_conn, _lock
+    if _listen_conn is not None:
+        # Kept referenced so it is never closed, and so never terminated, from the child
+        _inherited_connections.append(_listen_conn)
+    _listen_conn = None
+    _lock = threading.Lock()
+    reset_store_after_fork()
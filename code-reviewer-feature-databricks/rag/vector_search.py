@@ -0,0 +1,64 @@
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """Returns a float32 copy of the matrix with every row scaled to unit length."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.size == 0:
+        return matrix
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    # Leave all-zero rows at zero rather than dividing by zero
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def select_top_k(scores, top_k, similarity_threshold):
+    """Picks the indices of the top_k scores above the threshold, best first."""
+    if top_k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.intp)
+    if scores.size > top_k:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(scores.size)
+    candidates = candidates[scores[candidates] > similarity_threshold]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def top_k_similar(rule_matrix, embedding, top_k=3, similarity_threshold=0.55):
+    """Scores one embedding against the pre-normalized rule matrix.
+
+    Returns (indices, scores) for at most top_k rules whose cosine similarity is above the
+    threshold, ordered from most to least similar.
+    """
+    if rule_matrix.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+    scores = rule_matrix @ normalize_rows(embedding)
+    indices = select_top_k(scores, top_k, similarity_threshold)
+    return indices, scores[indices]
+
+
+def top_k_similar_batch(rule_matrix, embeddings, top_k=3, similarity_threshold=0.55):
+    """Scores a batch of embeddings against the rule matrix in one matrix-matrix product.
+
+    Returns a list with one (indices, scores) pair per embedding, as in top_k_similar.
+    """
+    embeddings = normalize_rows(np.atleast_2d(embeddings))
+    if rule_matrix.size == 0:
+        empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32))
+        return [empty for _ in range(len(embeddings))]
+
+    scores = embeddings @ rule_matrix.T
+    k = min(top_k, scores.shape[1])
+    if k <= 0:
+        candidates = np.empty((len(scores), 0), dtype=np.intp)
+    elif k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+
+    results = []
+    for row, row_candidates in zip(scores, candidates):
+        row_candidates = row_candidates[row[row_candidates] > similarity_threshold]
+        row_candidates = row_candidates[np.argsort(-row[row_candidates], kind='stable')]
+        results.append((row_candidates, row[row_candidates]))
+    return results
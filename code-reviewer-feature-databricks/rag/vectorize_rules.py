@@ -1,70 +1,81 @@
+import hashlib
 import psycopg2
 import sys
 import os
-from sentence_transformers import SentenceTransformer
 
 # Add project root to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import DB_CONFIG
+from config import EMBEDDING_CONFIG, PGVECTOR_CONFIG
+from database.rule_store import get_rule_store
+from rag.embedder import cache_model_id, embed_chunks
 
-def vectorize_rules():
-    """Fetches rules, generates embeddings, and stores them in the database."""
-    # Load a pre-trained sentence transformer model
-    model_path = r'C:\Users\AshishAdhikari\Documents\models--sentence-transformers--all-MiniLM-L6-v2\models--sentence-transformers--all-MiniLM-L6-v2'
+def rule_text(title, category, description):
+    """Combines the text fields to create a rich context for the embedding."""
+    return f"{title}. Category: {category}. Description: {description}"
 
-# Initialize the sentence transformer model using the local path
-    print("Loading sentence transformer model from local cache...")
-    try:
-        model = SentenceTransformer(model_path)
-        print("Model loaded successfully.")
-    except Exception as e:
-        print(f"An error occurred while loading the model: {e}")
-        model = None  # Safeguard for failed loading
+def content_hash(text):
+    """Hashes the embedded text together with the model and backend, so any of them changing
+    re-embeds the rule (int8 ONNX vectors differ slightly from the reference model's)."""
+    return hashlib.sha256(f"{cache_model_id()}\0{text}".encode('utf-8')).hexdigest()
+
+def vectorize_rules(batch_size=None, force=False):
+    """Embeds new and edited rules in batches and stores them in the database.
 
-    # Use an assertion to ensure the model is correctly loaded before using it
-    assert model is not None, "Model failed to load, ensure the correct path and files exist."
+    A rule is re-embedded when it has no vector yet or when the hash of its title, category
+    and description (and the model and embedding backend) differs from the stored
+    content_hash. With `force` every rule is re-embedded.
+    """
+    if batch_size is None:
+        batch_size = EMBEDDING_CONFIG['batch_size']
 
-    conn = None
+    store = None
     try:
         print("Connecting to the database...")
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
+        store = get_rule_store()
+        store.ensure_content_hash_column()
 
-        # Fetch all rules that haven't been vectorized yet
+        # Find the rules whose text changed since their vector was computed
         print("Fetching rules from the database...")
-        cur.execute("SELECT id, title, description, category FROM rules WHERE vector IS NULL;")
-        rules = cur.fetchall()
+        rules = []
+        for rule_id, title, description, category, stored_hash, missing_vector in store.fetch_vectorization_state():
+            text = rule_text(title, category, description)
+            text_hash = content_hash(text)
+            if force or missing_vector or stored_hash != text_hash:
+                rules.append((rule_id, text, text_hash))
 
         if not rules:
-            print("All rules are already vectorized.")
+            print("All rules are already vectorized and up to date.")
             return
 
-        print(f"Found {len(rules)} rules to vectorize...")
+        print(f"Found {len(rules)} new or changed rules to vectorize...")
+        embeddings = embed_chunks([text for _, text, _ in rules], batch_size=batch_size)
 
-        for rule_id, title, description, category in rules:
-            # Combine the text fields to create a rich context for the embedding
-            combined_text = f"{title}. Category: {category}. Description: {description}"
-            
-            # Generate the embedding
-            embedding = model.encode(combined_text).tolist()
-            
-            # Update the rule in the database with the new vector
-            cur.execute("UPDATE rules SET vector = %s WHERE id = %s;", (embedding, rule_id))
-            print(f"Vectorized and updated rule ID: {rule_id}")
+        # A vector(N) column rejects embeddings of any other size
+        if PGVECTOR_CONFIG['enabled'] and embeddings.shape[1] != PGVECTOR_CONFIG['dimensions']:
+            print(f"Model produces {embeddings.shape[1]}-dimensional embeddings but PGVECTOR_CONFIG expects {PGVECTOR_CONFIG['dimensions']}.")
+            return
 
-        conn.commit()
-        print("All rules have been vectorized and stored successfully.")
+        # Update the rules in the database with the new vectors
+        rule_vectors = [
+            (rule_id, embedding.tolist(), text_hash)
+            for (rule_id, _, text_hash), embedding in zip(rules, embeddings)
+        ]
+        store.update_vectors(rule_vectors)
+        print(f"Vectorized and stored {len(rule_vectors)} rules.")
 
-        cur.close()
+        # IVFFlat clusters are computed when the index is built, so re-cluster after loading vectors
+        if PGVECTOR_CONFIG['enabled'] and PGVECTOR_CONFIG['index_type'] == 'ivfflat':
+            print("Rebuilding the IVFFlat index...")
+            store.rebuild_vector_index()
 
     except psycopg2.Error as e:
         print(f"Database error: {e}")
 
     finally:
-        if conn is not None:
-            conn.close()
+        if store is not None:
+            store.close()
             print("Database connection closed.")
 
 if __name__ == "__main__":
-    vectorize_rules()
+    vectorize_rules(force='--force' in sys.argv)
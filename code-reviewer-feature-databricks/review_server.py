@@ -0,0 +1,240 @@
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from config import DAEMON_CONFIG, LLM_CONFIG
+from main import LANGUAGES_BY_EXTENSION, expand_paths, review_file, warm_up
+from rag.rule_cache import loaded_languages
+
+# Job options passed through to review_file. Incremental baselines are sent by the client
+# with the job, since the previous reports are saved on its side.
+JOB_OPTIONS = ('batch_size', 'encode_pool', 'fast', 'concurrency', 'pack', 'use_review_cache', 'stream', 'dedup', 'dedup_literals')
+
+_job_slots = threading.BoundedSemaphore(DAEMON_CONFIG['max_jobs'])
+_started = time.time()
+
+
+def _review_content(content, language, name, options, on_chunk, on_issue, baseline=None):
+    """Reviews raw code text by writing it to a temporary file with the language's extension."""
+    extension = next((ext for ext, lang in LANGUAGES_BY_EXTENSION.items() if lang == language), None)
+    if extension is None:
+        raise ValueError(f"Unsupported language: {language}")
+    with tempfile.TemporaryDirectory(prefix='review_job_') as job_dir:
+        file_name = os.path.basename(name) if name else 'snippet'
+        if not file_name.endswith(extension):
+            file_name += extension
+        file_path = os.path.join(job_dir, file_name)
+        with open(file_path, 'w') as f:
+            f.write(content)
+        final_report = review_file(file_path, on_chunk=on_chunk, on_issue=on_issue, incremental=baseline, **options)
+    if final_report is not None:
+        final_report['file_name'] = name or os.path.basename(file_path)
+        final_report['file_path'] = name or os.path.basename(file_path)
+    return final_report
+
+
+def run_job(job, emit):
+    """Reviews the files or code text of a job, emitting one event dict per result.
+
+    A job is {"paths": [...]} or {"content": "...", "language": "SQL", "name": "..."}, with
+    optional "options" from JOB_OPTIONS, which apply to this job only. For an incremental
+    review, "baselines" maps paths (or "baseline" holds, for content) to the previous
+    report's statements and issues. Events are `file_started`, `issue` (each
+    issue as the LLM streams it, when streaming is on), `chunk` (one per chunk, with its
+    statement and issues), `file_finished` (with the file's report) or `error` for a file
+    that could not be reviewed, and finally `done`. Each file's report only holds the
+    metrics recorded while reviewing it, even with several jobs running at once.
+    """
+    options = {key: value for key, value in (job.get('options') or {}).items() if key in JOB_OPTIONS}
+    started = time.perf_counter()
+    files_reviewed = 0
+    issues_found = 0
+
+    def reviewed(review, file_path):
+        """Runs one file's review; a file that fails is reported and the job goes on."""
+        nonlocal files_reviewed, issues_found
+        try:
+            final_report = review()
+        except (BrokenPipeError, ConnectionResetError):
+            raise
+        except Exception as e:
+            print(f"Error reviewing {file_path}: {e}")
+            emit({"event": "error", "file_path": file_path, "message": str(e)})
+            return
+        if final_report is None:
+            emit({"event": "error", "file_path": file_path, "message": "File could not be reviewed."})
+            return
+        files_reviewed += 1
+        issues_found += final_report['issues_found']
+        emit({"event": "file_finished", "report": final_report})
+
+    if 'content' in job:
+        name = job.get('name')
+        emit({"event": "file_started", "file_path": name})
+        on_chunk = lambda statement, issues: emit({"event": "chunk", "file_path": name, "statement": statement, "issues": issues})
+        on_issue = lambda issue: emit({"event": "issue", "file_path": name, "issue": issue})
+        reviewed(lambda: _review_content(job['content'], job.get('language', 'SQL'), name, options, on_chunk, on_issue, job.get('baseline')), name)
+    else:
+        baselines = job.get('baselines') or {}
+        for file_path in expand_paths(job.get('paths') or []):
+            file_path = os.path.abspath(file_path)
+            emit({"event": "file_started", "file_path": file_path})
+            on_chunk = lambda statement, issues, file_path=file_path: emit({"event": "chunk", "file_path": file_path, "statement": statement, "issues": issues})
+            on_issue = lambda issue, file_path=file_path: emit({"event": "issue", "file_path": file_path, "issue": issue})
+            reviewed(lambda: review_file(file_path, on_chunk=on_chunk, on_issue=on_issue, incremental=baselines.get(file_path), **options), file_path)
+
+    emit({
+        "event": "done",
+        "files_reviewed": files_reviewed,
+        "issues_found": issues_found,
+        "timing_seconds": round(time.perf_counter() - started, 3)
+    })
+
+
+class ReviewRequestHandler(BaseHTTPRequestHandler):
+    """Serves GET /health and POST /review, which streams newline-delimited JSON events."""
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send_json(404, {"error": "Not found."})
+            return
+        self._send_json(200, {
+            "status": "ok",
+            "uptime_seconds": round(time.time() - _started, 1),
+            "languages_loaded": loaded_languages()
+        })
+
+    def do_POST(self):
+        if self.path != '/review':
+            self._send_json(404, {"error": "Not found."})
+            return
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {"error": f"Invalid job: {e}"})
+            return
+        if not isinstance(job, dict) or not ('paths' in job or 'content' in job):
+            self._send_json(400, {"error": "A job needs 'paths' or 'content'."})
+            return
+
+        # The body is streamed until the connection closes, one JSON event per line
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        write_lock = threading.Lock()
+
+        def emit(event):
+            line = (json.dumps(event) + "\n").encode('utf-8')
+            with write_lock:
+                self.wfile.write(line)
+                self.wfile.flush()
+
+        with _job_slots:
+            try:
+                run_job(job, emit)
+            except (BrokenPipeError, ConnectionResetError):
+                print("Client disconnected before the job finished.")
+            except Exception as e:
+                emit({"event": "error", "message": str(e)})
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """The HTTP server on a Unix domain socket instead of TCP."""
+    daemon_threads = True
+
+
+def serve(host=None, port=None, socket_path=None, fast=False):
+    """Warms up the model and rules once, then serves review jobs until interrupted."""
+    print("Warming up the rule cache" + ("" if fast else " and embedding model") + "...")
+    warm_up(fast)
+    if not fast:
+        # Fails early without a DATABRICKS_TOKEN, and opens the pooled LLM session once,
+        # with room for every job's reviews in flight at the same time
+        from rag.generator import size_session
+        size_session(DAEMON_CONFIG['max_jobs'] * LLM_CONFIG['max_concurrency'])
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, ReviewRequestHandler)
+        print(f"Review server listening on unix:{socket_path}")
+    else:
+        server = ThreadingHTTPServer((host or DAEMON_CONFIG['host'], port or DAEMON_CONFIG['port']), ReviewRequestHandler)
+        print(f"Review server listening on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down the review server.")
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTPConnection over a Unix domain socket."""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connect(server_url, timeout=None):
+    """Opens a connection to http://host:port or unix:/path/to/socket."""
+    if server_url.startswith('unix:'):
+        return _UnixHTTPConnection(server_url[len('unix:'):], timeout=timeout)
+    parsed = urlparse(server_url if '://' in server_url else f"http://{server_url}")
+    return http.client.HTTPConnection(parsed.hostname, parsed.port or DAEMON_CONFIG['port'], timeout=timeout)
+
+
+def stream_review(server_url, job):
+    """Sends a job to a review server and yields its events as they arrive."""
+    conn = _connect(server_url)
+    try:
+        conn.request('POST', '/review', body=json.dumps(job), headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"Review server returned {response.status}: {response.read().decode('utf-8', 'replace')}")
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resident review server that keeps the model, rules and database pool warm.')
+    parser.add_argument('--host', type=str, default=None, help=f"Address to listen on (default {DAEMON_CONFIG['host']}).")
+    parser.add_argument('--port', type=int, default=None, help=f"Port to listen on (default {DAEMON_CONFIG['port']}).")
+    parser.add_argument('--socket', type=str, default=None, help='Listen on this Unix domain socket instead of TCP.')
+    parser.add_argument('--fast', action='store_true', help='Do not preload the embedding model (for regex-only clients).')
+    parser.add_argument('--stream', action='store_true', help='Stream LLM responses and send each issue as it arrives.')
+    args = parser.parse_args()
+    if args.stream:
+        LLM_CONFIG['stream'] = True
+    serve(args.host, args.port, args.socket, fast=args.fast)
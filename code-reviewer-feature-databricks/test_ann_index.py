@@ -0,0 +1,77 @@
+import contextlib
+import io
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from rag.ann_index import build_index, load_index, recall_at_k, save_index, search_batch, update_index
+from rag.vector_search import normalize_rows, top_k_similar_batch
+from utils.checks import check, finish
+
+print("--- Testing the IVF index against exact search ---")
+
+# A clustered synthetic catalog, so the IVF lists mean something as they do for real rules
+rng = np.random.default_rng(0)
+n_rules, dimensions = 20000, 384
+centers = normalize_rows(rng.standard_normal((64, dimensions)).astype(np.float32))
+matrix = normalize_rows(centers[rng.integers(0, len(centers), n_rules)] + 0.03 * rng.standard_normal((n_rules, dimensions)).astype(np.float32))
+rule_ids = np.arange(n_rules) + 1000
+with contextlib.redirect_stdout(io.StringIO()):
+    index = build_index(matrix, rule_ids)
+
+# Slightly perturbed rules stand in for code embeddings, as in check_recall
+queries = matrix[rng.choice(n_rules, 256, replace=False)] + rng.normal(scale=0.05, size=(256, dimensions)).astype(np.float32)
+for n_probe in (1, 8, len(index['centroids'])):
+    recall = recall_at_k(index, matrix, queries, top_k=3, n_probe=n_probe)
+    minimum = 1.0 if n_probe == len(index['centroids']) else 0.9 if n_probe == 8 else 0.0
+    check(f"recall@3 with n_probe={n_probe}", recall >= minimum, f"{recall:.3f}")
+
+# Probing every list is exact search, scores and order included
+exact = top_k_similar_batch(matrix, queries, top_k=5, similarity_threshold=0.3)
+approximate = search_batch(index, matrix, queries, top_k=5, similarity_threshold=0.3, n_probe=len(index['centroids']))
+check("all lists probed equals exact search", all(
+    np.array_equal(e_indices, a_indices) and np.allclose(e_scores, a_scores)
+    for (e_indices, e_scores), (a_indices, a_scores) in zip(exact, approximate)
+))
+
+# More top_k than candidates, and a threshold nothing passes
+results = search_batch(index, matrix, queries[:4], top_k=n_rules, similarity_threshold=-np.inf, n_probe=1)
+check("top_k larger than the probed lists", all(len(indices) == len(set(indices.tolist())) > 0 for indices, _ in results))
+results = search_batch(index, matrix, queries[:4], top_k=3, similarity_threshold=1.5)
+check("threshold above every score", all(len(indices) == 0 for indices, _ in results))
+
+# An incremental update keeps the recall and reports each kind of change once
+changed = matrix.copy()
+changed[:50] = normalize_rows(rng.standard_normal((50, dimensions)).astype(np.float32))
+changed = np.vstack([changed[:-30], normalize_rows(rng.standard_normal((20, dimensions)).astype(np.float32))])
+changed_ids = np.concatenate([rule_ids[:-30], np.arange(20) + 100000])
+output = io.StringIO()
+with contextlib.redirect_stdout(output):
+    updated = update_index(index, changed, changed_ids)
+check("update log", "20 rule vectors added, 50 changed, 30 removed" in output.getvalue(), output.getvalue().strip())
+recall = recall_at_k(updated, changed, queries, top_k=3)
+check("recall@3 after the update", recall >= 0.9, f"{recall:.3f}")
+
+# Workers saving the same index at once each write their own temporary file
+with tempfile.TemporaryDirectory() as tmp_dir:
+    path = os.path.join(tmp_dir, 'SQL.npz')
+    errors = []
+
+    def save():
+        try:
+            save_index(updated, path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    loaded = load_index(path)
+    check("concurrent saves", not errors and loaded is not None and np.array_equal(loaded['rule_ids'], updated['rule_ids'])
+          and os.listdir(tmp_dir) == ['SQL.npz'], f"{errors} {os.listdir(tmp_dir)}")
+
+finish()
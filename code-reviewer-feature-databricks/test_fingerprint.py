@@ -0,0 +1,64 @@
+import contextlib
+import io
+import os
+import tempfile
+
+from benchmarks.run_benchmarks import install_rules, stub_llm, use_embedder
+from config import REVIEW_CACHE_CONFIG
+from utils.checks import check, finish
+from utils.fingerprint import statement_fingerprint
+
+print("--- Testing statement fingerprints used to deduplicate reviews ---")
+
+def same(first, second, language='SQL', strip_literals=False):
+    return statement_fingerprint(first, language, strip_literals) == statement_fingerprint(second, language, strip_literals)
+
+
+# Copies that only differ in formatting, comments or the case of keywords and identifiers
+check("whitespace", same("SELECT id FROM t WHERE x = 1;", "SELECT  id\n  FROM t\n WHERE x = 1;"))
+check("comments", same("SELECT id FROM t; -- all rows", "SELECT /* ids */ id FROM t;"))
+check("keyword and identifier case", same("SELECT id FROM Orders;", "select ID from orders;"))
+
+# Differences that change what the statement does
+check("string literal case", not same("SELECT id FROM t WHERE s = 'Open';", "SELECT id FROM t WHERE s = 'open';"))
+check("quoted identifier case", not same('SELECT "Id" FROM t;', 'SELECT "id" FROM t;'))
+check("different literals", not same("SELECT id FROM t WHERE x = 1;", "SELECT id FROM t WHERE x = 2;"))
+check("different tables", not same("SELECT id FROM a;", "SELECT id FROM b;"))
+check("comment markers inside strings", not same("SELECT '--a' FROM t;", "SELECT '--b' FROM t;"))
+
+# With strip_literals, statements that only differ in literal values are copies
+check("literals stripped", same("SELECT id FROM t WHERE x = 1 AND s = 'a';", "SELECT id FROM t WHERE x = 22 AND s = 'it''s';", strip_literals=True))
+check("stripped literals keep identifiers", not same("SELECT a1 FROM t;", "SELECT a2 FROM t;", strip_literals=True))
+check("exact and stripped fingerprints differ", statement_fingerprint("SELECT 1;", 'SQL') != statement_fingerprint("SELECT 1;", 'SQL', True))
+
+# PySpark code is tokenized: comments and spacing go, indentation and case stay
+check("PySpark comments and spacing", same("df = spark.read.csv('a')  # load", "df=spark.read.csv( 'a' )", 'PySpark'))
+check("PySpark case", not same("df = spark.table('a')", "DF = spark.table('a')", 'PySpark'))
+check("PySpark indentation", not same("if x:\n    a()\n    b()", "if x:\n    a()\nb()", 'PySpark'))
+check("PySpark literals stripped", same("df.filter(col('x') > 1)", "df.filter(col('y') > 10)", 'PySpark', strip_literals=True))
+
+# The same text in another language is never a copy
+check("languages kept apart", statement_fingerprint("x = 1", 'SQL') != statement_fingerprint("x = 1", 'PySpark'))
+
+# Replaces the Databricks endpoint before main imports the generator
+stub_llm()
+from main import review_file
+install_rules('SQL', 0)
+use_embedder('stub')
+REVIEW_CACHE_CONFIG['enabled'] = False
+
+# With literals stripped, statements a regex rule matches still keep their literals: a leading
+# wildcard is only in the first LIKE, so its issue must not be copied to the second
+with tempfile.TemporaryDirectory() as tmp_dir:
+    file_path = os.path.join(tmp_dir, 'literals.sql')
+    with open(file_path, 'w') as f:
+        f.write("SELECT id FROM t WHERE name LIKE '%x%';\nSELECT id FROM t WHERE name LIKE 'x%';\n"
+                "SELECT id FROM t WHERE a = 1;\nSELECT id FROM t WHERE a = 2;\n")
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = review_file(file_path, dedup=True, dedup_literals=True)
+check("regex-matched statements keep their literals",
+      [statement.get('duplicate_of') for statement in report['statements']] == [None, None, None, 3]
+      and [issue['line_number'] for issue in report['issues']] == [1],
+      f"{[statement.get('duplicate_of') for statement in report['statements']]}, issues at {[issue['line_number'] for issue in report['issues']]}")
+
+finish()
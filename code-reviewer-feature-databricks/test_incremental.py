@@ -0,0 +1,80 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+from benchmarks.run_benchmarks import install_rules, stub_llm, use_embedder
+from config import REVIEW_CACHE_CONFIG
+from utils.checks import check, finish
+from utils.incremental import carry_forward, load_report
+
+# Replaces the Databricks endpoint before main imports the generator
+stub_llm()
+from main import review_file
+from rag import generator
+
+print("--- Testing incremental re-reviews ---")
+
+install_rules('SQL', 0)
+use_embedder('stub')
+REVIEW_CACHE_CONFIG['enabled'] = False
+
+stub_call = generator.call_databricks_llm
+prompts = []
+
+
+def counting_llm(prompt, temperature=0.0):
+    prompts.append(prompt)
+    return stub_call(prompt, temperature)
+
+
+generator.call_databricks_llm = counting_llm
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    file_path = os.path.join(tmp_dir, 'orders.sql')
+    with open(file_path, 'w') as f:
+        f.write("SELECT * FROM a;\nSELECT *\nFROM b;\nSELECT * FROM c WHERE x = 1;\n")
+    with contextlib.redirect_stdout(io.StringIO()):
+        previous_report = review_file(file_path, dedup=False)
+
+    # A new statement on top, one reformatted onto a single line and one changed: only the
+    # new and the changed statements are reviewed, and the carried issues move with their
+    # statements
+    with open(file_path, 'w') as f:
+        f.write("SELECT * FROM z;\nSELECT * FROM a;\nSELECT *   FROM b;\nSELECT * FROM c WHERE x = 2;\n")
+    prompts.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = review_file(file_path, dedup=False, incremental=previous_report)
+    check("only new and changed statements reviewed", len(prompts) == 2 and report['summary']['incremental']['carried_forward'] == 2,
+          f"{len(prompts)} LLM call(s), {report['summary'].get('incremental')}")
+    check("carried issues moved to the new lines", sorted((issue['line_number'], issue['statement_line']) for issue in report['issues']) == [(1, 1), (2, 2), (3, 3), (4, 4)],
+          str([(issue['line_number'], issue['statement_line']) for issue in report['issues']]))
+
+    # A --fast report is never the baseline of an LLM review
+    fast_path = os.path.join(tmp_dir, 'fast_report.json')
+    with open(fast_path, 'w') as f:
+        json.dump(dict(previous_report, review_mode='fast'), f)
+    with contextlib.redirect_stdout(io.StringIO()):
+        fast_baseline = load_report(fast_path, file_path, review_mode='llm')
+    check("fast report refused as the baseline", fast_baseline is None)
+
+# Statements whose retrieval failed, or that were not reviewed, are reviewed again, and
+# repeated statements are matched in file order
+previous = {
+    'statements': [
+        {'fingerprint': 'same', 'start_line': 1, 'reviewed': True},
+        {'fingerprint': 'same', 'start_line': 5, 'reviewed': True},
+        {'fingerprint': 'failed', 'start_line': 8, 'reviewed': True, 'retrieval_failed': True},
+        {'fingerprint': 'unreviewed', 'start_line': 9, 'reviewed': False},
+    ],
+    'issues': [
+        {'fingerprint': 'same', 'statement_line': 5, 'line_number': 6, 'rule_id': 1},
+    ],
+}
+chunks = [("", 10), ("", 20), ("", 30), ("", 40)]
+carried, to_review = carry_forward(chunks, ['same', 'same', 'failed', 'unreviewed'], previous)
+check("failed and unreviewed statements reviewed again", to_review == [2, 3], str(to_review))
+check("repeated statements matched in order", carried[0] == [] and [issue['line_number'] for issue in carried[1]] == [21], str(carried))
+
+finish()
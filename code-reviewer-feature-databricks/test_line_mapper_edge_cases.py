@@ -0,0 +1,50 @@
+import time
+
+from utils.checks import check, finish
+from utils.line_mapper import map_sql_statements_to_lines, iter_sql_file
+
+print("--- Testing line mapper edge cases ---")
+
+# An unterminated string or quoted identifier that ends in a backslash used to backtrack
+# exponentially in the tokenizer
+for quote in ("'", '"'):
+    sql_content = "SELECT 1;\nSELECT " + quote + "a" * 5000 + "\\"
+    started = time.perf_counter()
+    mapped_statements = map_sql_statements_to_lines(sql_content)
+    seconds = time.perf_counter() - started
+    check(f"unterminated {quote} ending in a backslash", seconds < 1 and len(mapped_statements) == 2 and mapped_statements[1][1] == 2,
+          f"{seconds:.3f}s, {len(mapped_statements)} statements")
+
+# A long run of spaces that does not end a line used to be retried from every offset in it
+sql_content = "SELECT a" + " " * 40000 + "b;"
+started = time.perf_counter()
+mapped_statements = map_sql_statements_to_lines(sql_content)
+seconds = time.perf_counter() - started
+check("long run of spaces inside a line", seconds < 1 and mapped_statements == [(sql_content, 1)], f"{seconds:.3f}s")
+
+# Semicolons inside strings, identifiers and comments do not end a statement
+mapped_statements = map_sql_statements_to_lines(
+    "SELECT 'a;b', \"c;d\", `e;f` -- g;\nFROM t /* h; */ WHERE x = 'it''s';\n\nSELECT 2;"
+)
+check("semicolons inside quotes and comments", [line for _, line in mapped_statements] == [1, 4],
+      str(mapped_statements))
+
+# Lines of code lose their trailing whitespace, strings keep theirs
+mapped_statements = map_sql_statements_to_lines("SELECT 'a  \nb' AS x,  \n  y /* c */ FROM t -- z\n;")
+check("trailing whitespace stripped outside strings", mapped_statements == [("SELECT 'a  \nb' AS x,\n  y FROM t\n;", 1)],
+      repr(mapped_statements))
+
+# A block comment over several lines keeps its line breaks, so the lines after it do not move
+mapped_statements = map_sql_statements_to_lines("SELECT a, /* multi\nline */ b\nFROM t /* x */ WHERE c;\nSELECT /* a\n\n*/c;")
+check("block comments keep their line breaks", mapped_statements == [("SELECT a,\n b\nFROM t WHERE c;", 1), ("SELECT\n\nc;", 4)],
+      repr(mapped_statements))
+
+# The fixtures give the same statements from a string and from the memory map
+for file_path in ('test_files/specific_code.sql', 'test_files/test_code.sql'):
+    with open(file_path, 'r') as f:
+        mapped_statements = map_sql_statements_to_lines(f.read())
+    trailing = [line for statement, _ in mapped_statements for line in statement.split('\n') if line != line.rstrip()]
+    check(f"{file_path} has no trailing whitespace", not trailing, f"{len(trailing)} line(s)")
+    check(f"{file_path} mapped the same from the file", mapped_statements == list(iter_sql_file(file_path)))
+
+finish()
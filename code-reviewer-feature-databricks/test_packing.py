@@ -0,0 +1,62 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+from benchmarks.run_benchmarks import install_rules, stub_llm, use_embedder
+from config import REVIEW_CACHE_CONFIG
+from utils.checks import check, finish
+
+# Replaces the Databricks endpoint before main imports the generator
+stub_llm()
+from main import review_file
+from rag import generator
+
+print("--- Testing packed prompts ---")
+
+install_rules('SQL', 0)
+use_embedder('stub')
+
+prompts = []
+
+
+def packed_llm(prompt, temperature=0.0):
+    """Answers a packed prompt with an issue on the second line of chunk 1, one outside
+    chunk 0 and one for a chunk that does not exist."""
+    prompts.append(prompt)
+    return json.dumps({"issues_found": 3, "issues": [
+        {"chunk_id": 1, "line_number": 4, "severity": "Major", "rule_id": 1, "suggestion": "second line of chunk 1"},
+        {"chunk_id": 0, "line_number": 999, "severity": "Major", "rule_id": 1, "suggestion": "outside chunk 0"},
+        {"chunk_id": 7, "line_number": 1, "severity": "Major", "rule_id": 1, "suggestion": "unknown chunk"},
+    ]})
+
+
+generator.call_databricks_llm = packed_llm
+sql_content = "SELECT *\nFROM a;\nSELECT *\nFROM b\nWHERE x = 1;\nSELECT * FROM c;\n"
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    REVIEW_CACHE_CONFIG['path'] = os.path.join(tmp_dir, 'reviews.sqlite3')
+    REVIEW_CACHE_CONFIG['enabled'] = True
+    file_path = os.path.join(tmp_dir, 'packed.sql')
+    with open(file_path, 'w') as f:
+        f.write(sql_content)
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = review_file(file_path, pack=True, stream=False, dedup=False)
+    located = sorted((issue['line_number'], issue['statement_line'], issue['suggestion']) for issue in report['issues'])
+
+    # Issues go to the chunk named by chunk_id, at their file line, or at the chunk's first
+    # line when the line is outside the chunk; issues for unknown chunks are dropped
+    check("one prompt for the three chunks", len(prompts) == 1 and prompts[0].count("### Chunk") == 3, f"{len(prompts)} prompt(s)")
+    check("issues attributed by chunk_id", located == [(1, 1, "outside chunk 0"), (4, 3, "second line of chunk 1")], str(located))
+
+    # The cached reviews keep chunk-relative lines, so they still fit once the file moves down
+    with open(file_path, 'w') as f:
+        f.write("\n\n" + sql_content)
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = review_file(file_path, pack=True, stream=False, dedup=False)
+    located = sorted((issue['line_number'], issue['statement_line'], issue['suggestion']) for issue in report['issues'])
+    check("cached packed reviews follow the moved chunks", len(prompts) == 1 and located == [(3, 3, "outside chunk 0"), (6, 5, "second line of chunk 1")],
+          f"{len(prompts)} prompt(s), {located}")
+
+finish()
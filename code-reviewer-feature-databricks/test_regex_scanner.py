@@ -0,0 +1,76 @@
+import os
+import re
+import tempfile
+
+from benchmarks.corpus import generate_sql_corpus
+from benchmarks.run_benchmarks import seed_rules
+from rag.regex_scanner import build_scanner, scan_chunks
+from utils.checks import check, finish
+from utils.line_mapper import iter_sql_file, map_sql_statements_to_lines
+
+print("--- Testing the combined regex scanner against per-chunk re.search ---")
+
+# The SQL rules from database/insert_rules.sql, compiled like the rule cache does
+bad_patterns = []
+for rule_id, title, description, code_pattern, severity, practice_type, category in seed_rules('SQL'):
+    if practice_type != 'bad':
+        continue
+    bad_patterns.append((re.compile(code_pattern, re.IGNORECASE), {'id': rule_id, 'title': title, 'severity': severity}))
+# Plus anchors, lookarounds and a backreference, which are all scanned on their own
+for rule_id, code_pattern in (
+    ('anchored', r'^select\b'),
+    ('start_of_chunk', r'\Aupdate\b'),
+    ('end_of_chunk', r'\bfrom\s+\w+\Z'),
+    ('delete_without_where', r'delete\s+from\s+\w+(?![\s\S]*\bwhere\b)'),
+    ('not_after_join', r'(?<!join )\bon\b'),
+    ('backreference', r'(\w+)\s*=\s*\1\b'),
+):
+    bad_patterns.append((re.compile(code_pattern, re.IGNORECASE), {'id': rule_id, 'title': rule_id, 'severity': 'Minor'}))
+scanner = build_scanner(bad_patterns)
+print(f"{len(scanner['combined_rules'])} combined and {len(scanner['standalone_rules'])} standalone patterns.")
+
+
+def expected_matches(code_chunk, start_line):
+    """What a separate re.search per rule and chunk finds: (rule id, line of the first hit)."""
+    matches = set()
+    for pattern, rule in bad_patterns:
+        match = pattern.search(code_chunk)
+        if match:
+            matches.add((rule['id'], start_line + code_chunk.count('\n', 0, match.start())))
+    return matches
+
+
+def compare(name, chunks):
+    scanned = scan_chunks(scanner, chunks)
+    mismatches = [
+        start_line for (code_chunk, start_line), chunk_matches in zip(chunks, scanned)
+        if {(rule['id'], rule['match_line']) for rule in chunk_matches} != expected_matches(code_chunk, start_line)
+    ]
+    hits = sum(len(chunk_matches) for chunk_matches in scanned)
+    check(name, not mismatches, f"{len(chunks)} chunks, {hits} hits" + (f", mismatches at lines {mismatches[:5]}" if mismatches else ""))
+
+
+for file_name in sorted(os.listdir('test_files')):
+    if file_name.endswith('.sql'):
+        compare(f"test_files/{file_name}", list(iter_sql_file(os.path.join('test_files', file_name))))
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    corpus_path = os.path.join(tmp_dir, 'corpus.sql')
+    generate_sql_corpus(corpus_path, 2000)
+    compare("synthetic corpus of 2000 statements", list(iter_sql_file(corpus_path)))
+
+# Anchors and a hit on the last line of a chunk must not leak into the next chunk
+compare("anchors at chunk boundaries", map_sql_statements_to_lines(
+    "SELECT *\nFROM a;\nSELECT id FROM b WHERE name LIKE '%x';\nDELETE FROM c;\nselect * from d WHERE a.id = a.id;"
+))
+
+# Anchors and lookarounds keep their per-chunk meaning: a DELETE followed by a WHERE in a later
+# chunk and an UPDATE that does not start the joined text
+chunks = [("SELECT 1 FROM t WHERE a = 1", 1), ("DELETE FROM t", 2), ("UPDATE t SET a = 1", 3), ("DELETE FROM t WHERE a = 1", 4)]
+scanned = scan_chunks(scanner, chunks)
+check("anchors and lookarounds match per chunk",
+      [[rule['match_line'] for rule in chunk_matches if rule['id'] in ('start_of_chunk', 'delete_without_where')] for chunk_matches in scanned] == [[], [2], [3], []],
+      str(scanned))
+compare("anchors and lookarounds against re.search", chunks)
+
+finish()
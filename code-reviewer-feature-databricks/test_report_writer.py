@@ -0,0 +1,57 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+from utils.checks import check, finish
+from utils.report_writer import JsonlReportWriter, load_file_report, write_sarif
+
+print("--- Testing the JSONL report and its SARIF export ---")
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    jsonl_path = os.path.join(tmp_dir, 'report.jsonl')
+    orders, users = os.path.join(tmp_dir, 'orders.sql'), os.path.join(tmp_dir, 'users.sql')
+
+    # Two files written the way review_file's on_chunk callbacks write them
+    with JsonlReportWriter(jsonl_path) as writer:
+        writer.write('run_started', paths=[orders, users])
+        writer.chunk_writer(orders)(
+            {"fingerprint": "f1", "start_line": 1, "end_line": 2, "reviewed": True},
+            [{"line_number": 2, "severity": "Major", "rule_id": 1, "suggestion": "Avoid SELECT *", "fingerprint": "f1", "statement_line": 1}]
+        )
+        writer.chunk_writer(users)(
+            {"fingerprint": "f2", "start_line": 1, "end_line": 1, "reviewed": True},
+            [{"line_number": None, "severity": "AI Generated Suggestion", "suggestion": "Add an index", "fingerprint": "f2", "statement_line": 1}]
+        )
+        writer.chunk_writer(orders)(
+            {"fingerprint": "f3", "start_line": 4, "end_line": 4, "reviewed": True},
+            [{"line_number": 4, "severity": "Minor", "rule_id": 9, "suggestion": "Use COUNT(1)", "fingerprint": "f3", "statement_line": 4}]
+        )
+        writer.write('file_finished', file_path=orders, file_name='orders.sql', issues_found=2)
+    # A run still in progress may end in a half-written line
+    with open(jsonl_path, 'a') as f:
+        f.write('{"type": "issue", "file_path": ')
+
+    file_report = load_file_report(jsonl_path, orders)
+    check("file report rebuilt from its records", file_report is not None and file_report['issues_found'] == 2
+          and [statement['start_line'] for statement in file_report['statements']] == [1, 4]
+          and [issue['rule_id'] for issue in file_report['issues']] == [1, 9], str(file_report))
+    check("unfinished file has no report", load_file_report(jsonl_path, users) is None)
+
+    sarif_path = os.path.join(tmp_dir, 'report.sarif')
+    with contextlib.redirect_stdout(io.StringIO()):
+        count = write_sarif(jsonl_path, sarif_path)
+    with open(sarif_path, 'r') as f:
+        sarif = json.load(f)
+    run = sarif['runs'][0]
+    results = run['results']
+    check("one SARIF result per issue", count == 3 and len(results) == 3 and sarif['version'] == "2.1.0", f"{count} result(s)")
+    check("rule ids and levels", [(result['ruleId'], result['level']) for result in results] == [("1", "error"), ("ai-suggestion", "note"), ("9", "warning")],
+          str([(result['ruleId'], result['level']) for result in results]))
+    check("rules listed in the driver", [rule['id'] for rule in run['tool']['driver']['rules']] == ["1", "9", "ai-suggestion"])
+    regions = [result['locations'][0]['physicalLocation']['region']['startLine'] for result in results]
+    check("issue without a line at its statement's line", regions == [2, 1, 4], str(regions))
+    check("statement fingerprints kept", [result['partialFingerprints']['statementFingerprint/v1'] for result in results] == ["f1", "f2", "f3"])
+
+finish()
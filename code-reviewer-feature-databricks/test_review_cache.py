@@ -0,0 +1,64 @@
+import os
+import tempfile
+import time
+
+from benchmarks.run_benchmarks import stub_llm
+from config import REVIEW_CACHE_CONFIG
+from rag import review_cache
+from utils.checks import check, finish
+from utils.sqlite_cache import SQLiteCache
+
+# Replaces the Databricks endpoint before the generator is imported
+stub_llm()
+from rag import generator
+
+print("--- Testing the review cache ---")
+
+rules = {'bad_practices': [{'id': 7}], 'good_practices': [{'id': 3}]}
+
+
+def key(code_chunk, rule_set=rules, prompt_version="1"):
+    return review_cache.review_key(code_chunk, rule_set, "Vector Search", prompt_version, "endpoint")
+
+
+# Spacing within lines does not matter, but the lines do: cached issues carry line numbers
+# relative to the chunk
+chunk = "SELECT *\nFROM orders\nWHERE id = 1;"
+check("same key for re-spaced lines", key(chunk) == key("SELECT  *\n  FROM\torders  \nWHERE id = 1;"))
+check("different key for reflowed lines", key(chunk) != key("SELECT * FROM orders\nWHERE id = 1;"))
+check("different key for other rules", key(chunk) != key(chunk, {'bad_practices': [{'id': 8}]}))
+check("different key for another prompt version", key(chunk) != key(chunk, prompt_version="2"))
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    # Least recently used entries are evicted first; a lookup counts as a use
+    cache = SQLiteCache(os.path.join(tmp_dir, 'lru.sqlite3'), max_entries=3)
+    for name in ('a', 'b', 'c'):
+        cache.put(name, name)
+        time.sleep(0.01)
+    cache.get('a')
+    time.sleep(0.01)
+    cache.put('d', 'd')
+    check("least recently used entry evicted", cache.get_many(['a', 'b', 'c', 'd']) == {'a': 'a', 'c': 'c', 'd': 'd'})
+    cache.close()
+
+    # A second review of the same chunk and rules is served from the cache without an LLM call
+    REVIEW_CACHE_CONFIG['path'] = os.path.join(tmp_dir, 'reviews.sqlite3')
+    REVIEW_CACHE_CONFIG['enabled'] = True
+    stub_call = generator.call_databricks_llm
+    calls = []
+
+    def counting_call(prompt, temperature=0.0):
+        calls.append(prompt)
+        return stub_call(prompt, temperature)
+
+    generator.call_databricks_llm = counting_call
+    review_rules = {'bad_practices': [{'id': 1, 'title': 'Avoid SELECT *', 'description': 'List the columns.', 'severity': 'Minor'}],
+                    'good_practices': []}
+    first = generator.generate_review(chunk, review_rules, "Regex Match", stream=False)
+    second = generator.generate_review("SELECT  *\nFROM orders\nWHERE id = 1;", review_rules, "Regex Match", stream=False)
+    check("second review served from the cache", len(calls) == 1 and first == second and review_cache.get_stats()['hits'] == 1,
+          f"{len(calls)} LLM call(s), {review_cache.get_stats()}")
+    generator.generate_review(chunk, review_rules, "Regex Match", use_cache=False, stream=False)
+    check("use_cache=False calls the LLM", len(calls) == 2)
+
+finish()
@@ -0,0 +1,70 @@
+import contextlib
+import io
+import os
+import tempfile
+import threading
+
+from benchmarks.run_benchmarks import install_rules, stub_llm, use_embedder
+from config import REVIEW_CACHE_CONFIG
+from utils import metrics
+from utils.checks import check, finish
+
+# Replaces the Databricks endpoint before the server imports the generator
+stub_llm(0.02)
+import review_server
+
+print("--- Testing review server jobs ---")
+
+install_rules('SQL', 50)
+use_embedder('stub')
+REVIEW_CACHE_CONFIG['enabled'] = False
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    paths = []
+    for name, statements in (('small.sql', 3), ('broken.sql', 2), ('large.sql', 12)):
+        paths.append(os.path.join(tmp_dir, name))
+        with open(paths[-1], 'w') as f:
+            f.write("".join(f"SELECT * FROM t{i} WHERE id = {i};\n" for i in range(statements)))
+
+    # A file that raises is reported on its own and the job still finishes
+    review_file = review_server.review_file
+
+    def failing_review_file(file_path, **options):
+        if file_path.endswith('broken.sql'):
+            raise RuntimeError("cannot review this file")
+        return review_file(file_path, **options)
+
+    review_server.review_file = failing_review_file
+    events = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        review_server.run_job({"paths": paths}, events.append)
+    review_server.review_file = review_file
+    errors = [event for event in events if event['event'] == 'error']
+    check("a failing file does not end the job",
+          len(errors) == 1 and errors[0]['file_path'].endswith('broken.sql') and events[-1]['event'] == 'done'
+          and events[-1]['files_reviewed'] == 2, str([event['event'] for event in events]))
+
+    # Concurrent jobs each report only their own file's metrics
+    reports = {}
+
+    def job(path):
+        job_events = []
+        review_server.run_job({"paths": [path], "options": {"concurrency": 2}}, job_events.append)
+        reports[path] = next(event['report'] for event in job_events if event['event'] == 'file_finished')
+
+    before = metrics.snapshot()
+    with contextlib.redirect_stdout(io.StringIO()):
+        threads = [threading.Thread(target=job, args=(path,)) for path in (paths[0], paths[2])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    chunks = {path: metrics.counter(reports[path]['metrics'], 'chunks_total', language='SQL') for path in reports}
+    # Prompts are built in the review threads, which count towards their job too
+    prompts = {path: reports[path]['metrics']['stages'].get('prompt_build', {}).get('count') for path in reports}
+    check("concurrent jobs keep their metrics apart", chunks == {paths[0]: 3, paths[2]: 12} and prompts == {paths[0]: 3, paths[2]: 12},
+          f"chunks {list(chunks.values())}, prompts {list(prompts.values())}")
+    process_wide = metrics.delta(metrics.snapshot(), before)
+    check("process-wide metrics still count every job", metrics.counter(process_wide, 'chunks_total', language='SQL') == 15)
+
+finish()
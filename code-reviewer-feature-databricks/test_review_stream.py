@@ -0,0 +1,84 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+import requests
+
+from benchmarks.run_benchmarks import install_rules, stub_llm, use_embedder
+from config import REVIEW_CACHE_CONFIG
+from rag.review_stream import ReviewStreamParser
+from utils.checks import check, finish
+
+print("--- Testing the streamed review parser across chunk boundaries ---")
+
+def feed_in_pieces(text, size):
+    """Feeds the text `size` characters at a time, as a stream would deliver it."""
+    parser = ReviewStreamParser()
+    streamed = []
+    for start in range(0, len(text), size):
+        streamed.extend(parser.feed(text[start:start + size]))
+    return parser, streamed
+
+
+issues = [
+    {"line_number": 1, "severity": "Major", "rule_id": 3, "suggestion": "Avoid SELECT * {use columns}, not \"*\"."},
+    {"line_number": 2, "severity": "Minor", "rule_id": 7, "suggestion": "Escaped \\ backslash and ] bracket; é."},
+]
+review_text = 'Here is the review:\n```json\n' + json.dumps({"issues_found": 2, "issues": issues}, indent=2) + '\n```'
+
+# Every split point, down to one character per piece, must give the same issues
+for size in (1, 2, 3, 7, 16, len(review_text)):
+    parser, streamed = feed_in_pieces(review_text, size)
+    check(f"pieces of {size} character(s)", streamed == issues and parser.done and parser.result() == {"issues_found": 2, "issues": issues})
+
+# issues_found of 0 ends the stream before the issues array
+parser, streamed = feed_in_pieces('{"issues_found": 0, "issues": []}', 1)
+check("empty review", parser.empty and parser.done and not streamed and parser.result() == {"issues_found": 0, "issues": []})
+parser = ReviewStreamParser()
+parser.feed('{"issues_found": 0')
+check("empty review is not known before the value ends", not parser.done)
+parser.feed(',')
+check("empty review is known once the value ends", parser.done and parser.empty)
+
+# The answer is known once the issues array closes, whatever follows it
+parser, streamed = feed_in_pieces('{"issues": [{"line_number": 4}], "notes": "never read', 5)
+check("done when the issues array closes", parser.done and streamed == [{"line_number": 4}])
+
+# A stream cut off mid-issue has no result, and an issue is only returned once complete
+parser, streamed = feed_in_pieces(review_text[:review_text.index('"rule_id": 7')], 4)
+check("truncated stream", not parser.done and parser.result() is None and streamed == issues[:1])
+
+# A stream that breaks off after an issue went out leaves the statement unreviewed, and the
+# report says how many streamed issues it discarded
+class BrokenStream:
+    def iter_lines(self, decode_unicode=False):
+        content = '{"issues_found": 2, "issues": [{"line_number": 1, "severity": "Major", "rule_id": 1, "suggestion": "x"}, '
+        yield "data: " + json.dumps({"choices": [{"delta": {"content": content}}]})
+        raise requests.ConnectionError("connection reset")
+
+    def close(self):
+        pass
+
+
+# Replaces the Databricks endpoint before main imports the generator
+stub_llm()
+from main import review_file
+from rag import generator
+install_rules('SQL', 0)
+use_embedder('stub')
+REVIEW_CACHE_CONFIG['enabled'] = False
+generator._post_llm = lambda prompt, temperature, stream=False: BrokenStream()
+with tempfile.TemporaryDirectory() as tmp_dir:
+    file_path = os.path.join(tmp_dir, 'broken.sql')
+    with open(file_path, 'w') as f:
+        f.write("SELECT * FROM orders;\n")
+    streamed = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = review_file(file_path, stream=True, on_issue=streamed.append)
+statement = report['statements'][0]
+check("broken stream discards its streamed issues", len(streamed) == 1 and not statement['reviewed']
+      and statement.get('streamed_issues_discarded') == 1 and report['issues_found'] == 0, str(statement))
+
+finish()
@@ -0,0 +1,19 @@
+import sys
+
+
+# Names of the cases that failed in this run of a check script
+failures = []
+
+
+def check(name, passed, detail=""):
+    """Prints PASS or FAIL for one case of a check script, with an optional detail."""
+    print(f"  {'PASS' if passed else 'FAIL'}: {name}{' - ' + detail if detail else ''}")
+    if not passed:
+        failures.append(name)
+
+
+def finish():
+    """Prints the end of the checks and exits with status 1 if any of them failed."""
+    print(f"--- End of Test ({len(failures)} failure(s)) ---")
+    if failures:
+        sys.exit(1)
@@ -1,16 +1,77 @@
-def chunk_pyspark_file(file_content):
-    """Splits a PySpark file into chunks, tracking the starting line number of each."""
+import ast
+
+
+def _chunk_by_blank_lines(file_content):
+    """Splits a file into chunks at blank lines, tracking the start and end line of each."""
     chunks = []
     current_chunk = []
     start_line = 1
     for i, line in enumerate(file_content.splitlines(), 1):
         if not line.strip() and current_chunk:
-            chunks.append(("\n".join(current_chunk), start_line))
+            chunks.append(("\n".join(current_chunk), start_line, start_line + len(current_chunk) - 1))
             current_chunk = []
         elif line.strip():
             if not current_chunk:
                 start_line = i
             current_chunk.append(line)
     if current_chunk:
-        chunks.append(("\n".join(current_chunk), start_line))
+        chunks.append(("\n".join(current_chunk), start_line, start_line + len(current_chunk) - 1))
     return chunks
+
+
+def _statement_ranges(tree):
+    """Yields (start_line, end_line, is_definition) for each top-level statement."""
+    for node in tree.body:
+        start_line = node.lineno
+        # Decorators sit above the def/class line but belong to it
+        for decorator in getattr(node, 'decorator_list', []):
+            start_line = min(start_line, decorator.lineno)
+        is_definition = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+        yield start_line, node.end_lineno, is_definition
+
+
+def chunk_pyspark_file_with_ranges(file_content, target_lines=30):
+    """Splits a PySpark file into statement-aligned chunks with exact line ranges.
+
+    The file is parsed with `ast`: every function or class is its own chunk, and runs of
+    adjacent small top-level statements are merged until a chunk would exceed
+    `target_lines`. Multi-line statements such as long DataFrame method chains are never
+    split, and the comments above a chunk's first statement are part of the chunk. Files
+    that do not parse fall back to splitting at blank lines.
+    Returns a list of (chunk, start_line, end_line) tuples.
+    """
+    try:
+        tree = ast.parse(file_content)
+    except (SyntaxError, ValueError) as e:
+        print(f"Could not parse Python file, falling back to blank-line chunks: {e}")
+        return _chunk_by_blank_lines(file_content)
+
+    lines = file_content.splitlines()
+    ranges = []
+    previous_end = 0
+    for start_line, end_line, is_definition in _statement_ranges(tree):
+        if (
+            ranges
+            and not is_definition
+            and not ranges[-1][2]
+            and end_line - ranges[-1][0] + 1 <= target_lines
+        ):
+            ranges[-1] = (ranges[-1][0], end_line, False)
+        else:
+            # Only comments and blank lines can sit between two statements; the comments
+            # describe the code below them, so the chunk starts at the first of them
+            first_line = min(previous_end + 1, start_line)
+            while first_line < start_line and not lines[first_line - 1].strip():
+                first_line += 1
+            ranges.append((first_line, end_line, is_definition))
+        previous_end = end_line
+
+    return [
+        ("\n".join(lines[start_line - 1:end_line]), start_line, end_line)
+        for start_line, end_line, _ in ranges
+    ]
+
+
+def chunk_pyspark_file(file_content):
+    """Splits a PySpark file into chunks, tracking the starting line number of each."""
+    return [(chunk, start_line) for chunk, start_line, _ in chunk_pyspark_file_with_ranges(file_content)]
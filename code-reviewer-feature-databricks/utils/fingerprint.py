@@ -0,0 +1,98 @@
+import hashlib
+import io
+import re
+import tokenize
+
+
+def normalize_chunk(code_chunk):
+    """Collapses all runs of whitespace so formatting-only edits map to the same text."""
+    return re.sub(r'\s+', ' ', code_chunk).strip()
+
+
+def normalize_lines(code_chunk):
+    """Collapses runs of spaces within each line but keeps the line breaks, so line numbers
+    relative to the chunk still point at the same code."""
+    return '\n'.join(re.sub(r'\s+', ' ', line).strip() for line in code_chunk.split('\n'))
+
+
+def chunk_fingerprint(code_chunk, *parts, keep_lines=False):
+    """Returns a SHA-256 hex digest of the normalized chunk plus any extra key parts.
+
+    With `keep_lines` the chunk's line breaks are part of the fingerprint (see normalize_lines).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    normalized = normalize_lines(code_chunk) if keep_lines else normalize_chunk(code_chunk)
+    digest.update(normalized.encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Comments, quoted strings and identifiers, and numbers in SQL; identifiers are matched so
+# quotes inside them are not taken for strings
+_SQL_TOKENS = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<identifier>"(?:[^"]|"")*"|`[^`]*`)
+  | (?P<number>\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b)
+""", re.DOTALL | re.VERBOSE)
+
+
+def _normalize_sql(code_chunk, strip_literals):
+    # Keywords and unquoted identifiers are case-insensitive, so only literals and quoted
+    # identifiers keep their case
+    parts = []
+    position = 0
+    for match in _SQL_TOKENS.finditer(code_chunk):
+        parts.append(code_chunk[position:match.start()].lower())
+        if match.group('comment') is not None:
+            parts.append(' ')
+        elif strip_literals and (match.group('string') is not None or match.group('number') is not None):
+            parts.append('?')
+        else:
+            parts.append(match.group(0))
+        position = match.end()
+    parts.append(code_chunk[position:].lower())
+    return normalize_chunk(''.join(parts))
+
+
+def _normalize_python(code_chunk, strip_literals):
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code_chunk).readline))
+    except (tokenize.TokenError, SyntaxError):
+        return normalize_chunk(code_chunk)
+    parts = []
+    for token in tokens:
+        if token.type in (tokenize.COMMENT, tokenize.NL, tokenize.ENDMARKER):
+            continue
+        if token.type == tokenize.NEWLINE:
+            parts.append(';')
+        elif token.type == tokenize.INDENT:
+            parts.append('{')
+        elif token.type == tokenize.DEDENT:
+            parts.append('}')
+        elif strip_literals and token.type in (tokenize.STRING, tokenize.NUMBER):
+            parts.append('?')
+        else:
+            parts.append(token.string)
+    return ' '.join(parts)
+
+
+def normalize_statement(code_chunk, language, strip_literals=False):
+    """Normalizes a statement for duplicate detection.
+
+    Comments and formatting are dropped, as is the case of SQL outside quotes. With
+    `strip_literals` every string and number literal becomes `?`. PySpark code is
+    tokenized, so indentation still counts.
+    """
+    if language == 'PySpark':
+        return _normalize_python(code_chunk, strip_literals)
+    return _normalize_sql(code_chunk, strip_literals)
+
+
+def statement_fingerprint(code_chunk, language, strip_literals=False):
+    """Returns the fingerprint shared by statements that only differ in comments, formatting
+    and, with `strip_literals`, literal values."""
+    normalized = normalize_statement(code_chunk, language, strip_literals)
+    return chunk_fingerprint(normalized, 'statement', language, 'literals' if strip_literals else 'exact')
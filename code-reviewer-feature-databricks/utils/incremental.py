@@ -0,0 +1,129 @@
+import glob
+import json
+import os
+
+from utils.report_writer import load_file_report
+
+
+def _file_reports(report):
+    """Yields the per-file reports of a single-file or an aggregated multi-file report."""
+    if 'files' in report:
+        yield from report['files']
+    else:
+        yield report
+
+
+def _compatible(file_report, review_mode):
+    """Tells whether a file's report was made in the given review mode ('llm' or 'fast').
+
+    Reports written before the mode was recorded are not trusted as a baseline.
+    """
+    return review_mode is None or file_report.get('review_mode') == review_mode
+
+
+def find_previous_report(file_path, report_dir='outputs', review_mode=None):
+    """Finds the most recent saved report for the same file.
+
+    Single-file, aggregated multi-file and JSONL reports are searched. With `review_mode`,
+    reports made in another mode (e.g. --fast runs) are skipped. Returns a
+    (report path, per-file report) tuple, or (None, None) if there is none.
+    """
+    target = os.path.abspath(file_path)
+    candidates = sorted(
+        glob.glob(os.path.join(report_dir, 'code_review_report_*.json'))
+        + glob.glob(os.path.join(report_dir, 'code_review_report_*.jsonl')),
+        reverse=True
+    )
+    for report_path in candidates:
+        if report_path.endswith('.jsonl'):
+            try:
+                file_report = load_file_report(report_path, target)
+            except OSError:
+                continue
+            if file_report is not None and file_report.get('statements') and _compatible(file_report, review_mode):
+                return report_path, file_report
+            continue
+        try:
+            with open(report_path, 'r') as f:
+                report = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        for file_report in _file_reports(report):
+            if file_report.get('file_path') == target and file_report.get('statements') and _compatible(file_report, review_mode):
+                return report_path, file_report
+    return None, None
+
+
+def load_report(report_path, file_path, review_mode=None):
+    """Loads the report for a file from a saved report, returning None if it cannot be used.
+
+    With `review_mode`, a report made in another mode cannot be used either.
+    """
+    if report_path.endswith('.jsonl'):
+        try:
+            file_report = load_file_report(report_path, file_path)
+        except OSError as e:
+            print(f"Could not read previous report {report_path}: {e}")
+            return None
+        return _usable(report_path, file_report, review_mode)
+    try:
+        with open(report_path, 'r') as f:
+            report = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Could not read previous report {report_path}: {e}")
+        return None
+    file_reports = list(_file_reports(report))
+    target = os.path.abspath(file_path)
+    for file_report in file_reports:
+        if file_report.get('file_path') == target:
+            return _usable(report_path, file_report, review_mode)
+    # A single-file report given explicitly may come from a copy of the file elsewhere
+    return _usable(report_path, file_reports[0], review_mode) if len(file_reports) == 1 else None
+
+
+def _usable(report_path, file_report, review_mode):
+    """Returns the file's report if it was made in the review mode, else None."""
+    if file_report is not None and not _compatible(file_report, review_mode):
+        print(f"Previous report {report_path} was not made in {review_mode} mode and cannot be the baseline.")
+        return None
+    return file_report
+
+
+def carry_forward(chunks, fingerprints, previous_report):
+    """Matches the current statements against a previous report by fingerprint.
+
+    A statement is unchanged when a statement with the same fingerprint was successfully
+    reviewed in the previous report with its rules; statements whose rule retrieval failed
+    there are reviewed again. Repeated statements are matched in file order.
+    Returns ({chunk index: carried issues}, [chunk indices that still need a review]).
+    The carried issues have their line numbers moved to the statement's new position.
+    """
+    previous_statements = {}
+    for statement in previous_report.get('statements', []):
+        if statement.get('reviewed') and not statement.get('retrieval_failed'):
+            previous_statements.setdefault(statement['fingerprint'], []).append(statement['start_line'])
+
+    previous_issues = {}
+    for issue in previous_report.get('issues', []):
+        if 'fingerprint' in issue:
+            previous_issues.setdefault((issue['fingerprint'], issue.get('statement_line')), []).append(issue)
+
+    carried = {}
+    to_review = []
+    for index, ((_, start_line), fingerprint) in enumerate(zip(chunks, fingerprints)):
+        old_starts = previous_statements.get(fingerprint)
+        if not old_starts:
+            to_review.append(index)
+            continue
+
+        old_start = old_starts.pop(0)
+        issues = []
+        for issue in previous_issues.get((fingerprint, old_start), []):
+            issue = dict(issue)
+            if isinstance(issue.get('line_number'), int):
+                issue['line_number'] += start_line - old_start
+            issue['statement_line'] = start_line
+            issues.append(issue)
+        carried[index] = issues
+
+    return carried, to_review
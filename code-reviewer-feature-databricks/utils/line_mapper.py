@@ -1,90 +1,162 @@
-import sqlparse
+import mmap
 import re
+from bisect import bisect_right
 
-def map_sql_statements_to_lines(sql_content):
+
+def build_line_index(text):
+    """Returns the offset at which each line of the text (str, bytes or mmap) starts."""
+    newline = '\n' if isinstance(text, str) else b'\n'
+    return [0] + [match.end() for match in re.finditer(newline, text)]
+
+
+def offset_to_line(line_index, offset):
+    """Converts a character offset into a 1-based line number using a line index."""
+    return bisect_right(line_index, offset)
+
+
+# Everything that can hide a semicolon or must not be treated as code. Strings accept both
+# '' doubling and backslash escapes as in Spark SQL; dollar quotes are closed separately.
+# Each repetition of a string or quoted identifier takes exactly one character or escape,
+# and a backslash at the end of the input is an escape too, so an unterminated quote
+# always matches up to the end in one way instead of backtracking. Spaces at the end of a
+# line of code are dropped like comments, while those inside strings are kept; they only
+# match from the start of a run of spaces, so a long run that is not at the end of a line
+# is given up once instead of being retried from every offset inside it.
+_SQL_TOKEN_PATTERN = r"""
+    (?P<line_comment>--[^\n]*)
+  | (?P<block_comment>/\*.*?(?:\*/|\Z))
+  | (?P<string>'(?:[^'\\]|\\.?|'')*(?:'|\Z))
+  | (?P<quoted_identifier>"(?:[^"\\]|\\.?|"")*(?:"|\Z))
+  | (?P<backquoted_identifier>`(?:[^`]+|``)*(?:`|\Z))
+  | (?P<dollar_quote>\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$)
+  | (?P<trailing_space>(?<![ \t])[ \t]+(?=\r?\n|\Z))
+  | (?P<semicolon>;)
+"""
+_SQL_TOKEN = {
+    str: re.compile(_SQL_TOKEN_PATTERN, re.DOTALL | re.VERBOSE),
+    bytes: re.compile(_SQL_TOKEN_PATTERN.encode(), re.DOTALL | re.VERBOSE),
+}
+_NON_SPACE = {str: re.compile(r'\S'), bytes: re.compile(rb'\S')}
+_HORIZONTAL_SPACE = {str: ' \t', bytes: b' \t'}
+
+
+def _iter_statement_parts(content):
+    """Splits SQL into statements in a single pass over the content.
+
+    Yields (parts, first_code_offset) per statement, where `parts` are the statement's code
+    segments with comments removed and the offset is where its first non-comment,
+    non-whitespace character is. Trailing spaces and the spaces before a comment are dropped,
+    a block comment spanning lines becomes its line breaks and one on a single line becomes
+    a space only where it separated two tokens, so every line of code keeps its place and
+    none is left with trailing whitespace.
     """
-    Parses SQL content and maps statements to their original starting line numbers.
-    Uses character position tracking for more accurate line mapping.
+    kind = str if isinstance(content, str) else bytes
+    token_re = _SQL_TOKEN[kind]
+    non_space_re = _NON_SPACE[kind]
+    space = ' ' if kind is str else b' '
+    newline = '\n' if kind is str else b'\n'
+    horizontal_space = _HORIZONTAL_SPACE[kind]
+    end = len(content)
+
+    parts = []
+    first_code_offset = None
+    # Set after a block comment, whose space is only added before adjacent code
+    separate = False
+    segment_start = 0
+    pos = 0
+
+    def add_code(start, stop):
+        nonlocal first_code_offset, separate
+        if start >= stop:
+            return
+        if separate and not content[start:start + 1].isspace():
+            parts.append(space)
+        separate = False
+        parts.append(content[start:stop])
+        if first_code_offset is None:
+            match = non_space_re.search(content, start, stop)
+            if match:
+                first_code_offset = match.start()
+
+    while True:
+        token = token_re.search(content, pos)
+        if token is None:
+            add_code(segment_start, end)
+            break
+
+        token_kind = token.lastgroup
+        if token_kind in ('line_comment', 'block_comment'):
+            add_code(segment_start, token.start())
+            if parts:
+                parts[-1] = parts[-1].rstrip(horizontal_space)
+            if token_kind == 'block_comment':
+                # A comment over several lines keeps its line breaks so the lines after it
+                # stay where they are; one on a single line separates tokens at most
+                line_breaks = token.group().count(newline)
+                if line_breaks:
+                    parts.append(newline * line_breaks)
+                else:
+                    separate = True
+            segment_start = pos = token.end()
+        elif token_kind == 'trailing_space':
+            add_code(segment_start, token.start())
+            segment_start = pos = token.end()
+        elif token_kind == 'dollar_quote':
+            closing = content.find(token.group(), token.end())
+            pos = end if closing == -1 else closing + len(token.group())
+        elif token_kind == 'semicolon':
+            add_code(segment_start, token.end())
+            if first_code_offset is not None:
+                yield parts, first_code_offset
+            parts = []
+            first_code_offset = None
+            separate = False
+            segment_start = pos = token.end()
+        else:
+            # Strings and quoted identifiers stay part of the code segment
+            pos = token.end()
+
+    if first_code_offset is not None:
+        yield parts, first_code_offset
+
+
+def iter_sql_statements(sql_content):
+    """Lazily yields (statement, start_line) for every statement in SQL text.
+
+    `sql_content` may be a str, bytes or an mmap. Statements keep their terminating
+    semicolon and have their comments stripped; the start line is the line of the first
+    non-comment token. Semicolons inside strings, quoted identifiers, comments and
+    dollar-quoted bodies do not end a statement. Runs in linear time.
     """
-    statements = []
-    try:
-        # Parse without stripping comments initially to preserve structure
-        parsed = sqlparse.parse(sql_content)
-        statements = [str(stmt) for stmt in parsed if str(stmt).strip()]
-    except Exception as e:
-        print(f"Could not parse SQL with sqlparse, falling back to simple split: {e}")
-        statements = [s for s in sql_content.split(';') if s.strip()]
-
-    original_lines = sql_content.splitlines()
-    chunks = []
-    search_start_pos = 0  # Track character position instead of just line index
-
-    for stmt in statements:
-        stmt_clean = stmt.strip()
-        if not stmt_clean:
+    line_index = build_line_index(sql_content)
+    for parts, first_code_offset in _iter_statement_parts(sql_content):
+        statement = parts[0][:0].join(parts)
+        if not isinstance(statement, str):
+            statement = statement.decode('utf-8', errors='replace')
+        statement = statement.strip()
+        # Skip empty statements such as a stray ";;"
+        if not statement.rstrip(';').strip():
             continue
+        yield statement, offset_to_line(line_index, first_code_offset)
 
-        # Get the first meaningful SQL line (skip comments and empty lines)
-        stmt_lines = stmt_clean.splitlines()
-        stmt_first_sql_line = ""
-        
-        for line in stmt_lines:
-            line_stripped = line.strip()
-            # Skip empty lines and comment lines
-            if line_stripped and not line_stripped.startswith('--'):
-                # Clean up the line for matching
-                stmt_first_sql_line = re.sub(r'\s+', ' ', line_stripped).strip()
-                break
-        
-        if not stmt_first_sql_line:
-            continue
 
-        # Find the position of this statement in the original content
-        # Start searching from where we left off
-        remaining_content = sql_content[search_start_pos:]
-        
-        # Look for the first significant word of the SQL statement
-        first_word = stmt_first_sql_line.split()[0].upper()
-        
-        # Find all potential matches in the remaining content
-        pattern = r'\b' + re.escape(first_word) + r'\b'
-        matches = list(re.finditer(pattern, remaining_content, re.IGNORECASE))
-        
-        found = False
-        for match in matches:
-            match_pos = search_start_pos + match.start()
-            
-            # Convert character position to line number
-            content_up_to_match = sql_content[:match_pos]
-            line_number = content_up_to_match.count('\n') + 1
-            
-            # Get the actual line content at this position
-            if line_number <= len(original_lines):
-                actual_line = original_lines[line_number - 1].strip()
-                
-                # Skip if this line is a comment
-                if actual_line.startswith('--') or not actual_line:
-                    continue
-                
-                # Check if this line matches our expected pattern
-                normalized_actual = re.sub(r'\s+', ' ', actual_line).strip()
-                if normalized_actual.upper().startswith(first_word.upper()):
-                    # Clean the statement by removing comments for the final output
-                    clean_stmt = sqlparse.format(stmt_clean, strip_comments=True).strip()
-                    chunks.append((clean_stmt, line_number))
-                    
-                    # Update search position to after this statement
-                    # Find the end of this statement (look for semicolon or end of content)
-                    stmt_end = sql_content.find(';', match_pos)
-                    if stmt_end != -1:
-                        search_start_pos = stmt_end + 1
-                    else:
-                        search_start_pos = match_pos + len(stmt_first_sql_line)
-                    
-                    found = True
-                    break
-        
-        if not found:
-            print(f"Warning: Could not find line mapping for statement: {stmt_first_sql_line[:50]}...")
-
-    return chunks
\ No newline at end of file
+def iter_sql_file(file_path):
+    """Lazily yields (statement, start_line) for a SQL file read through a memory map."""
+    with open(file_path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return
+        try:
+            yield from iter_sql_statements(mapped)
+        finally:
+            mapped.close()
+
+
+def map_sql_statements_to_lines(sql_content):
+    """
+    Parses SQL content and maps statements to their original starting line numbers.
+    Returns a list of (statement, start_line) tuples; see iter_sql_statements.
+    """
+    return list(iter_sql_statements(sql_content))
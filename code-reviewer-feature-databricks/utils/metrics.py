@@ -0,0 +1,188 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Upper bounds in seconds of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BUCKET_LABELS = [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+
+_lock = threading.Lock()
+# stage -> {'count', 'total_seconds', 'buckets': per-bucket (not cumulative) counts}
+_stages = {}
+# counter key, e.g. 'llm_requests' or 'retrieval_method{method="Regex Match"}' -> value
+_counters = {}
+# Registries of the scopes open in the current context (see scope); work handed to other
+# threads must run in a copy of the context to be counted, as rag/pipeline.py does
+_scopes = contextvars.ContextVar('metrics_scopes', default=())
+
+
+def _counter_key(name, labels):
+    """Renders a counter name and its labels in Prometheus notation."""
+    if not labels:
+        return name
+    rendered = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+def increment(name, value=1, **labels):
+    """Adds to a counter, optionally labelled (e.g. increment('retrieval_method', method='Regex Match'))."""
+    key = _counter_key(name, labels)
+    with _lock:
+        for counters in [_counters] + [registry['counters'] for registry in _scopes.get()]:
+            counters[key] = counters.get(key, 0) + value
+
+
+def observe(stage, seconds):
+    """Records one duration for a stage in its latency histogram."""
+    position = len(LATENCY_BUCKETS)
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            position = i
+            break
+    with _lock:
+        for stages in [_stages] + [registry['stages'] for registry in _scopes.get()]:
+            histogram = stages.get(stage)
+            if histogram is None:
+                histogram = stages[stage] = {'count': 0, 'total_seconds': 0.0, 'buckets': [0] * len(BUCKET_LABELS)}
+            histogram['count'] += 1
+            histogram['total_seconds'] += seconds
+            histogram['buckets'][position] += 1
+
+
+@contextmanager
+def scope():
+    """Also records everything observed in the current context into a registry of its own.
+
+    Yields the registry, which snapshot() can copy. Unlike a delta of two process-wide
+    snapshots, it leaves out what other threads (e.g. concurrent review server jobs) record.
+    """
+    registry = {'stages': {}, 'counters': {}}
+    token = _scopes.set(_scopes.get() + (registry,))
+    try:
+        yield registry
+    finally:
+        _scopes.reset(token)
+
+
+@contextmanager
+def timer(stage):
+    """Times the body of a with block as one observation of a stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def snapshot(registry=None):
+    """Returns a copy of every stage histogram and counter recorded in this process, or in
+    the registry of a scope."""
+    stages = _stages if registry is None else registry['stages']
+    counters = _counters if registry is None else registry['counters']
+    with _lock:
+        return {
+            'stages': {
+                stage: {'count': h['count'], 'total_seconds': h['total_seconds'], 'buckets': list(h['buckets'])}
+                for stage, h in stages.items()
+            },
+            'counters': dict(counters),
+        }
+
+
+def counter(snap, name, **labels):
+    """Returns the value of a counter in a snapshot, 0 if it was never incremented."""
+    return snap['counters'].get(_counter_key(name, labels), 0)
+
+
+def _combine(snapshots, signs):
+    """Adds up snapshots, each multiplied by its sign, dropping stages and counters that end at zero."""
+    stages = {}
+    counters = {}
+    for snap, sign in zip(snapshots, signs):
+        for stage, h in snap.get('stages', {}).items():
+            total = stages.setdefault(stage, {'count': 0, 'total_seconds': 0.0, 'buckets': [0] * len(BUCKET_LABELS)})
+            total['count'] += sign * h['count']
+            total['total_seconds'] += sign * h['total_seconds']
+            total['buckets'] = [a + sign * b for a, b in zip(total['buckets'], h['buckets'])]
+        for key, value in snap.get('counters', {}).items():
+            counters[key] = counters.get(key, 0) + sign * value
+    return {
+        'stages': {stage: h for stage, h in stages.items() if h['count']},
+        'counters': {key: value for key, value in counters.items() if value},
+    }
+
+
+def delta(after, before):
+    """Returns what was recorded between two snapshots."""
+    return _combine([after, before], [1, -1])
+
+
+def merge(snapshots):
+    """Adds up the snapshots of several files or processes."""
+    snapshots = list(snapshots)
+    return _combine(snapshots, [1] * len(snapshots))
+
+
+def _quantile(histogram, q):
+    """Estimates a quantile as the upper bound of the bucket it falls into."""
+    target = q * histogram['count']
+    seen = 0
+    for label, count in zip(BUCKET_LABELS, histogram['buckets']):
+        seen += count
+        if seen >= target and count:
+            return float(label) if label != '+Inf' else None
+    return None
+
+
+def summarize(snap):
+    """Adds mean and estimated p50/p95 latencies to each stage, for the JSON report."""
+    stages = {}
+    for stage, h in sorted(snap['stages'].items()):
+        stages[stage] = {
+            'count': h['count'],
+            'total_seconds': round(h['total_seconds'], 6),
+            'mean_seconds': round(h['total_seconds'] / h['count'], 6),
+            'p50_seconds': _quantile(h, 0.5),
+            'p95_seconds': _quantile(h, 0.95),
+            'buckets': list(h['buckets']),
+        }
+    return {'stages': stages, 'counters': dict(sorted(snap['counters'].items()))}
+
+
+def to_prometheus(snap, prefix='code_review'):
+    """Renders a snapshot in the Prometheus text exposition format."""
+    lines = [
+        f"# HELP {prefix}_stage_seconds Time spent in each review stage.",
+        f"# TYPE {prefix}_stage_seconds histogram",
+    ]
+    for stage, h in sorted(snap['stages'].items()):
+        cumulative = 0
+        for label, count in zip(BUCKET_LABELS, h['buckets']):
+            cumulative += count
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{label}"}} {cumulative}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {h["total_seconds"]}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {h["count"]}')
+
+    typed = set()
+    for key, value in sorted(snap['counters'].items()):
+        name = key.split('{', 1)[0]
+        if name not in typed:
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            typed.add(name)
+        lines.append(f"{prefix}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(snap, path):
+    """Writes a snapshot as a Prometheus text file (e.g. for the node_exporter textfile collector)."""
+    with open(path, 'w') as f:
+        f.write(to_prometheus(snap))
+    print(f"Metrics written to {path}")
+
+
+def reset_after_fork():
+    """Replaces the lock in a forked child, which may have been copied while held."""
+    global _lock
+    _lock = threading.Lock()
@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+SARIF_LEVELS = {'Critical': 'error', 'Major': 'error', 'Minor': 'warning'}
+TOOL_NAME = "code-reviewer"
+
+
+def default_report_path(extension, report_dir='outputs'):
+    """Returns a timestamped report path under outputs/, like save_report uses."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(report_dir, f"code_review_report_{timestamp}.{extension}")
+
+
+class JsonlReportWriter:
+    """Appends report records to a JSON Lines file as a review runs, one record per line.
+
+    Every record is written with a single write on an O_APPEND descriptor, so the worker
+    processes of a multi-file run can append to the same file without interleaving, and
+    a run in progress can be followed with `tail -f`. Records have a `type`: run_started,
+    statement, issue, file_finished or run_finished.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._lock = threading.Lock()
+
+    def write(self, record_type, **fields):
+        """Appends one record."""
+        data = (json.dumps(dict(type=record_type, **fields)) + "\n").encode('utf-8')
+        with self._lock:
+            while data:
+                data = data[os.write(self._fd, data):]
+
+    def chunk_writer(self, file_path):
+        """Returns an on_chunk callback for review_file that records a file's statements and issues."""
+        def on_chunk(statement, issues):
+            self.write('statement', file_path=file_path, **statement)
+            for issue in issues:
+                self.write('issue', file_path=file_path, **issue)
+        return on_chunk
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_records(path):
+    """Yields the records of a JSONL report one at a time, skipping a partly written last line."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A run still in progress may have a half-written line at the end
+                continue
+
+
+def load_file_report(path, file_path):
+    """Rebuilds the report of one file from a JSONL report, in the shape review_file returns.
+
+    Only that file's records are kept in memory. Returns None if the file is not in the
+    report or its review did not finish.
+    """
+    target = os.path.abspath(file_path)
+    issues = []
+    statements = []
+    finished = None
+    for record in read_records(path):
+        if record.get('file_path') != target:
+            continue
+        record_type = record.pop('type')
+        record.pop('file_path')
+        if record_type == 'statement':
+            statements.append(record)
+        elif record_type == 'issue':
+            issues.append(record)
+        elif record_type == 'file_finished':
+            finished = record
+    if finished is None or 'error' in finished:
+        return None
+    return dict(finished, file_path=target, issues=issues, statements=statements)
+
+
+def _artifact_uri(file_path):
+    """Returns a file's path relative to the working directory, or a file:// URI outside it."""
+    path = Path(file_path).resolve()
+    try:
+        return path.relative_to(Path.cwd()).as_posix()
+    except ValueError:
+        return path.as_uri()
+
+
+def _sarif_result(record):
+    """Turns an issue record into a SARIF result."""
+    rule_id = record.get('rule_id')
+    line_number = record.get('line_number')
+    if not isinstance(line_number, int) or line_number < 1:
+        line_number = record.get('statement_line') or 1
+    result = {
+        "ruleId": str(rule_id) if rule_id is not None else "ai-suggestion",
+        "level": SARIF_LEVELS.get(record.get('severity'), 'note'),
+        "message": {"text": record.get('suggestion') or "Code review issue."},
+        "locations": [{
+            "physicalLocation": {
+                "artifactLocation": {"uri": _artifact_uri(record['file_path'])},
+                "region": {"startLine": line_number}
+            }
+        }],
+        "properties": {"severity": record.get('severity')}
+    }
+    if record.get('fingerprint'):
+        result["partialFingerprints"] = {"statementFingerprint/v1": record['fingerprint']}
+    return result
+
+
+def write_sarif(jsonl_path, sarif_path):
+    """Converts a JSONL report into a SARIF 2.1.0 log, streaming one result at a time.
+
+    The results are written before the tool section, so only the set of rules seen is
+    kept in memory. Returns the number of results written.
+    """
+    directory = os.path.dirname(sarif_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    rules = {}
+    count = 0
+    with open(sarif_path, 'w', encoding='utf-8') as f:
+        f.write('{"$schema": ' + json.dumps(SARIF_SCHEMA) + ', "version": "2.1.0", "runs": [{"results": [')
+        for record in read_records(jsonl_path):
+            if record.get('type') != 'issue':
+                continue
+            result = _sarif_result(record)
+            rules.setdefault(result['ruleId'], result['properties']['severity'])
+            f.write((",\n" if count else "\n") + json.dumps(result))
+            count += 1
+        driver = {
+            "name": TOOL_NAME,
+            "rules": [
+                {"id": rule_id, "properties": {"severity": severity}}
+                for rule_id, severity in sorted(rules.items())
+            ]
+        }
+        f.write('\n], "tool": {"driver": ' + json.dumps(driver) + '}}]}\n')
+    print(f"SARIF report with {count} result(s) saved to {sarif_path}")
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a JSONL code review report into SARIF.')
+    parser.add_argument('jsonl_path', help='JSONL report written with main.py --jsonl.')
+    parser.add_argument('sarif_path', nargs='?', default=None, help='Output path (default: the JSONL path with .sarif).')
+    args = parser.parse_args()
+    write_sarif(args.jsonl_path, args.sarif_path or os.path.splitext(args.jsonl_path)[0] + '.sarif')
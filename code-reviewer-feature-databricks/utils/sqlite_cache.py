@@ -0,0 +1,88 @@
+import sqlite3
+import threading
+import time
+import os
+
+
+class SQLiteCache:
+    """A size-bounded key/value store in a SQLite file with least-recently-used eviction."""
+
+    def __init__(self, path, max_entries):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                last_access REAL NOT NULL
+            );
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access_idx ON cache (last_access);")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Returns a {key: value} dict for the keys that are present, marking them as recently used."""
+        found = {}
+        if not keys:
+            return found
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            # Stay well below SQLite's limit on bound parameters per statement
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({placeholders});", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE cache SET last_access = ? WHERE key = ?;",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def get(self, key):
+        """Returns the value stored for a key, or None."""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items):
+        """Stores {key: value} pairs and evicts the least recently used entries over the limit."""
+        if not items:
+            return
+        with self._lock:
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, last_access) VALUES (?, ?, ?);",
+                [(key, value, now) for key, value in items.items()]
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM cache;").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access ASC LIMIT ?);",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def put(self, key, value):
+        """Stores a single value."""
+        self.put_many({key: value})
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache;")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()